@@ -1,3 +1,3 @@
 from .character_state import CharacterState, StateName2State, InterruptableStates
 from .prompt_type import PromptType, TypeName2Name
-from .msg_id import State2RecieveMsgId, State2PushMsgId
+from .msg_id import State2RecieveMsgId, State2PushMsgId, get_recieve_msg_ids
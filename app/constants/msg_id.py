@@ -36,5 +36,13 @@ State2PushMsgId = { CharacterState.MOVE: 1007,
                     CharacterState.ACT: 1007,
                     CharacterState.DRAW: 1003,
                    }
-                     
+
+
+def get_recieve_msg_ids(state_name) -> tuple:
+    '''
+    ids of the server messages handled by a state, a value of State2RecieveMsgId is an id or a list of ids
+    '''
+    msg_ids = State2RecieveMsgId.get(state_name, ())
+    return tuple(int(i) for i in msg_ids) if isinstance(msg_ids, (list, tuple)) else (int(msg_ids),)
+
                 
\ No newline at end of file
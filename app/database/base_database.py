@@ -13,7 +13,8 @@ engine = create_engine(db_connection_string,echo=True, future=True )#connect_arg
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
-event.listen(Base.metadata, 'before_create', DDL("CREATE DATABASE IF NOT EXISTS DgentCivil DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;"))
+# mysql only, a sqlite DATABASE_URL (local runs, benchmarks) has no databases to create
+event.listen(Base.metadata, 'before_create', DDL("CREATE DATABASE IF NOT EXISTS DgentCivil DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;").execute_if(dialect='mysql'))
 # event.listen(Base.metadata, 'before_create',)
 from contextlib import contextmanager
 
@@ -29,7 +30,7 @@ def get_db_context():
 def init_db():
     # import all modules before calling init_db()
     from app.database.orm import (
-        artwork_record
+        agent_recod, artwork_record, trade_record
     )
     Base.metadata.create_all(bind=engine)
 
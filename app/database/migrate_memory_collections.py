@@ -0,0 +1,72 @@
+'''
+move the per-character memory collections (entity_memory_<name>) into the shared character_memory collection
+
+    python -m app.database.migrate_memory_collections [--dry-run] [--drop] [--batch-size 512]
+
+act_name of the migrated rows is kept when present, otherwise it is taken from the collection name
+(the old names have the spaces of the character name removed, so pass --names to map them back).
+'''
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from pymilvus import Collection, connections, utility
+
+from app.database.milvus_datastore import MILVUS_ALIAS
+from app.global_config import MILVUS_HOST, MILVUS_PORT
+from app.models.data_store import ENTITY_COLLECTION, get_character_memory_store
+
+LEGACY_FIELDS = {'uid': 'id', 'vector': 'emb', 'context': 'text'} # ENTITY_SCHEMA name -> CHARACTER_MEMORY_SCHEMA name
+
+
+def legacy_collections(alias: str = MILVUS_ALIAS):
+    prefix = f'{ENTITY_COLLECTION}_'
+    return [name for name in utility.list_collections(using=alias) if name.startswith(prefix)]
+
+
+def migrate_collection(name: str, target, batch_size: int = 512, name_map: dict = None, dry_run: bool = False) -> int:
+    act_name = name[len(ENTITY_COLLECTION) + 1:]
+    act_name = (name_map or {}).get(act_name, act_name)
+    source = Collection(name, using=target.alias)
+    source.load()
+    iterator = source.query_iterator(batch_size=batch_size, expr='', output_fields=['*'])
+    moved = 0
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            for row in rows:
+                for old, new in LEGACY_FIELDS.items():
+                    if old in row and new not in row:
+                        row[new] = row.pop(old)
+                row.setdefault('act_name', act_name)
+            if not dry_run:
+                # not buffered: a failed insert raises here, before the legacy collection can be dropped
+                target.insert_data(rows, buffered=False)
+            moved += len(rows)
+    finally:
+        iterator.close()
+    return moved
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dry-run', action='store_true', help='count the rows without writing')
+    parser.add_argument('--drop', action='store_true', help='drop every legacy collection once it is migrated')
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--names', nargs='*', default=[], help='character names, used to restore the spaces of act_name')
+    args = parser.parse_args()
+
+    connections.connect(alias=MILVUS_ALIAS, host=MILVUS_HOST, port=MILVUS_PORT)
+    name_map = {name.replace(' ', ''): name for name in args.names}
+    target = get_character_memory_store()
+    total = 0
+    for name in legacy_collections():
+        moved = migrate_collection(name, target, batch_size=args.batch_size, name_map=name_map, dry_run=args.dry_run)
+        total += moved
+        print(f'{name}: {moved} rows' + (' (dry run)' if args.dry_run else ''))
+        if args.drop and not args.dry_run:
+            utility.drop_collection(name, using=MILVUS_ALIAS)
+    print(f'migrated {total} rows into {target.collection_name}')
@@ -96,4 +96,27 @@ ENTITY_SCHEMA = CollectionSchema(
         ),
     ],
     description="Entity memory storage"
-)
\ No newline at end of file
+)
+
+
+# one collection shared by every character, act_name is the partition key so a search filtered on
+# act_name only scans the partition of that character
+CHARACTER_MEMORY_COLLECTION = 'character_memory'
+CHARACTER_MEMORY_NUM_PARTITIONS = 64
+CHARACTER_MEMORY_SCHEMA = CollectionSchema(
+    fields=[
+        FieldSchema(name="id", dtype=DataType.VARCHAR, max_length=200, is_primary=True),
+        FieldSchema(name="act_id", dtype=DataType.VARCHAR, max_length=200, default_value=""),
+        FieldSchema(name="act_name", dtype=DataType.VARCHAR, max_length=200, is_partition_key=True),
+        FieldSchema(name="obj_id", dtype=DataType.VARCHAR, max_length=200, default_value=""),
+        FieldSchema(name="obj_name", dtype=DataType.VARCHAR, max_length=200, default_value=""),
+        FieldSchema(name="in_building_id", dtype=DataType.VARCHAR, max_length=200, default_value=""),
+        FieldSchema(name="in_building_name", dtype=DataType.VARCHAR, max_length=200, default_value=""),
+        FieldSchema(name="timestamp", dtype=DataType.INT64, default_value=0),
+        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=4096, default_value=""),
+        FieldSchema(name="emb", dtype=DataType.FLOAT_VECTOR, dim=3072),
+    ],
+    description="Memory of all the characters, partitioned by act_name",
+    enable_dynamic_field=True, # money, emotion, ... of scale_dict
+    num_partitions=CHARACTER_MEMORY_NUM_PARTITIONS,
+)
@@ -1,3 +1,7 @@
+import atexit
+import threading
+import time
+import weakref
 from typing import List, Optional, Union
 from pymilvus import (
     connections,
@@ -11,7 +15,9 @@ from pymilvus.orm.collection import (
     MutationResult,
     SearchResult
 )
+from .vector_store import VectorStore
 from ..utils.log import LogManager
+from ..global_config import MILVUS_WRITE_BUFFER_SIZE, MILVUS_FLUSH_INTERVAL, MILVUS_MAX_PENDING
 import os
 
 MILVUS_ALIAS = 'default'
@@ -22,8 +28,11 @@ MILVUS_INDEX_PARAMS = {
 }
 MILVUS_CONSISTENCY_LEVEL = os.environ.get("MILVUS_CONSISTENCY_LEVEL") or 'Strong'
 
-class MilvusDataStore():
+class MilvusDataStore(VectorStore):
     MODULE_NAME = 'MilvusDataStore'
+    _instances = weakref.WeakSet() # stores with a write buffer, flushed by flush_due / flush_all
+    _shared = {} # (alias, collection_name) -> store, see shared()
+    _shared_lock = threading.Lock()
     def __init__(
         self,
         host: str = "",
@@ -36,6 +45,9 @@ class MilvusDataStore():
         scalar_index_fields: Union[str, List[str]] = None,
         create_new: Optional[bool] = False,
         consistency_level: str = "Bounded",
+        write_buffer_size: int = MILVUS_WRITE_BUFFER_SIZE,
+        flush_interval: float = MILVUS_FLUSH_INTERVAL,
+        max_pending: int = MILVUS_MAX_PENDING,
     ):
         """Create a Milvus DataStore.
 
@@ -46,6 +58,9 @@ class MilvusDataStore():
             consistency_level(str, optional): Specify the collection consistency level.
                                                 Defaults to "Bounded" for search performance.
                                                 Set to "Strong" in test cases for result validation.
+            write_buffer_size (int, optional): Rows buffered by insert_data before one bulk insert. 0 inserts directly.
+            flush_interval (float, optional): Seconds a buffered row may wait before flush_due writes it.
+            max_pending (int, optional): Rows kept in the buffer when flushes fail, the oldest rows are dropped beyond it.
         """
         # Overwrite the default consistency level by MILVUS_CONSISTENCY_LEVEL
         # self._consistency_level = MILVUS_CONSISTENCY_LEVEL or consistency_level
@@ -58,6 +73,18 @@ class MilvusDataStore():
         self.index_params = index_params
         self.scalar_index_fields = scalar_index_fields
         self._consistency_level = consistency_level
+        self.write_buffer_size = write_buffer_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, write_buffer_size)
+        self._write_buffer: List[dict] = []
+        self._buffer_since = None # time.monotonic() of the oldest buffered row
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.inserted_rows = 0
+        self.insert_calls = 0
+        self.dropped_rows = 0
+        if self.write_buffer_size > 0:
+            MilvusDataStore._instances.add(self)
         self._create_connection()
         self._create_collection(self.collection_name, create_new)  # type: ignore
         self._create_index()
@@ -65,7 +92,22 @@ class MilvusDataStore():
                 self.collection.load()
 
 
+    @classmethod
+    def shared(cls, collection_name: str, alias: str = MILVUS_ALIAS, **kwargs) -> 'MilvusDataStore':
+        '''
+        one store per collection and connection alias in the process: the collection is created, indexed and
+        loaded by the first caller only, later callers get the same store (and the same write buffer)
+        '''
+        key = (alias, collection_name)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(collection_name=collection_name, alias=alias, **kwargs)
+            return cls._shared[key]
+
     def _create_connection(self):
+        # the connection of an alias is pooled, every store on the same alias reuses it
+        if connections.has_connection(self.alias):
+            return
         try:
             self.connection = connections.connect(
                 alias=self.alias,
@@ -127,8 +169,96 @@ class MilvusDataStore():
     
 
 
-    def insert_data(self, data:List[dict]) ->MutationResult:
-        return self.collection.insert(data)
+    def insert_data(self, data:Union[dict, List[dict]], buffered: bool = True) -> Optional[MutationResult]:
+        '''
+        with a write buffer the rows are only queued and None is returned, they reach milvus with the next flush:
+        when write_buffer_size rows are queued, on flush_due after flush_interval, or on shutdown.
+        buffered=False inserts at once and raises on failure, for callers that must know the rows are stored
+        '''
+        rows = [data] if isinstance(data, dict) else list(data)
+        if self.write_buffer_size <= 0 or not buffered:
+            return self._insert_rows(rows)
+        with self._buffer_lock:
+            if not self._write_buffer:
+                self._buffer_since = time.monotonic()
+            self._write_buffer.extend(rows)
+            pending = len(self._write_buffer)
+        if pending >= self.write_buffer_size:
+            # back-pressure: the caller pays for the bulk insert instead of growing the buffer
+            self.flush()
+        return None
+
+    def _insert_rows(self, rows: List[dict]) -> MutationResult:
+        '''
+        one columnar insert when every row carries exactly the schema fields, one row based insert otherwise:
+        with enable_dynamic_field the extra keys of a row are kept only by the row based insert
+        '''
+        schema = self.collection.schema
+        fields = [f.name for f in schema.fields if not (f.is_primary and f.auto_id)]
+        if not getattr(schema, 'enable_dynamic_field', False) and \
+                all(len(row) == len(fields) and all(name in row for name in fields) for row in rows):
+            data = [[row[name] for row in rows] for name in fields]
+        else:
+            data = rows
+        response = self.collection.insert(data)
+        self.insert_calls += 1
+        self.inserted_rows += len(rows)
+        return response
+
+    def pending(self) -> int:
+        return len(self._write_buffer)
+
+    def flush(self) -> Optional[MutationResult]:
+        '''
+        write all the buffered rows in one insert. On failure the rows go back to the buffer, capped by max_pending
+        '''
+        with self._flush_lock:
+            with self._buffer_lock:
+                rows, self._write_buffer = self._write_buffer, []
+                self._buffer_since = None
+            if not rows:
+                return None
+            try:
+                return self._insert_rows(rows)
+            except Exception as e:
+                with self._buffer_lock:
+                    self._write_buffer = rows + self._write_buffer
+                    overflow = len(self._write_buffer) - self.max_pending
+                    if overflow > 0:
+                        self._write_buffer = self._write_buffer[overflow:]
+                        self.dropped_rows += overflow
+                    self._buffer_since = time.monotonic()
+                LogManager.log_error(
+                    msg = "Failed to flush {} rows into Milvus collection '{}', error: {}".format(len(rows), self.collection_name, e)
+                )
+                return None
+
+    def is_due(self) -> bool:
+        since = self._buffer_since
+        return since is not None and time.monotonic() - since >= self.flush_interval
+
+    @classmethod
+    def flush_due(cls):
+        '''
+        flush the stores whose oldest buffered row waited flush_interval, called once per simulation tick
+        '''
+        for store in list(cls._instances):
+            if store.is_due():
+                store.flush()
+
+    @classmethod
+    def flush_all(cls):
+        for store in list(cls._instances):
+            store.flush()
+
+    def buffer_stats(self) -> dict:
+        return {
+            'pending': self.pending(),
+            'inserted_rows': self.inserted_rows,
+            'insert_calls': self.insert_calls,
+            'rows_per_insert': self.inserted_rows / self.insert_calls if self.insert_calls else 0.,
+            'dropped_rows': self.dropped_rows,
+        }
 
     
     def _create_index(self):
@@ -178,3 +308,5 @@ class MilvusDataStore():
         )
         return int(res[0]['count(*)'])
 
+
+atexit.register(MilvusDataStore.flush_all)
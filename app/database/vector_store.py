@@ -0,0 +1,266 @@
+import atexit
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+
+class VectorStore:
+    '''
+    what Memory needs from a vector collection, implemented by MilvusDataStore and NumpyVectorStore.
+    vector_search takes the milvus search params (data, anns_field, param, limit, output_fields, expr) and
+    returns one list of hits per query vector, a hit has .id, .distance and .entity.get(field)
+    '''
+    collection_name: str = ''
+
+    def insert_data(self, data: Union[dict, List[dict]]):
+        raise NotImplementedError
+
+    def vector_search(self, search_param: dict):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+
+class SearchHit:
+    def __init__(self, id, distance: float, entity: Dict[str, Any]):
+        self.id = id
+        self.distance = distance
+        self.score = distance
+        self.entity = entity
+
+    def get(self, field: str, default=None):
+        return self.entity.get(field, default)
+
+    def __repr__(self) -> str:
+        return f'SearchHit(id={self.id}, distance={self.distance:.4f}, entity={self.entity})'
+
+
+_CLAUSE = re.compile(r'''\s*(\w+)\s*(==|!=)\s*(?:'([^']*)'|"([^"]*)"|(-?\d+(?:\.\d+)?))\s*''')
+_JOIN = re.compile(r'&&|and\b')
+
+
+def parse_expr(expr: Optional[str]):
+    '''
+    the subset of the milvus boolean expressions used by the memory queries:
+    equality / inequality clauses joined by && (or and), e.g. obj_name=='Bar' && act_name=='Lily Johnson'
+    the clauses are matched from left to right, so a quoted value may contain && or and
+    returns [(field, op, value), ...]
+    '''
+    if not expr or not expr.strip():
+        return []
+    clauses = []
+    pos = 0
+    while True:
+        match = _CLAUSE.match(expr, pos)
+        if match is None:
+            raise ValueError(f'unsupported filter clause at {expr[pos:]!r} in {expr!r}')
+        field, op, single, double, number = match.groups()
+        if number is not None:
+            value = float(number) if '.' in number else int(number)
+        else:
+            value = single if single is not None else double
+        clauses.append((field, op, value))
+        pos = match.end()
+        if pos == len(expr):
+            return clauses
+        join = _JOIN.match(expr, pos)
+        if join is None:
+            raise ValueError(f'unsupported filter clause at {expr[pos:]!r} in {expr!r}')
+        pos = join.end()
+
+
+class NumpyVectorStore(VectorStore):
+    '''
+    in-process exact vector store, for runs without a milvus server.
+    - rows are kept as dicts, the vectors of anns_field in one float32 matrix
+    - equality filters go through a lazily built inverted index field -> value -> row ids, so a search on
+      act_name / obj_name / buyer only scores the candidate rows
+    - with path set, flush() persists <path>/<collection_name>/vectors.npy + rows.jsonl and reopening memory-maps
+      the vectors instead of reading them
+    '''
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, collection_name: str, path: Optional[str] = None, anns_field: str = 'emb', metric_type: str = 'COSINE'):
+        self.collection_name = collection_name
+        self.anns_field = anns_field
+        self.metric_type = metric_type
+        self.dir = os.path.join(path, collection_name) if path else None
+        self._lock = threading.RLock()
+        self._rows: List[Dict[str, Any]] = []
+        self._base: Optional[np.ndarray] = None # memory-mapped vectors of the persisted rows
+        self._tail: List[np.ndarray] = [] # vectors inserted since the last flush
+        self._persisted = 0
+        self._index: Dict[str, Dict[Any, List[int]]] = {}
+        if self.dir is not None:
+            self._load()
+
+    @classmethod
+    def shared(cls, collection_name: str, **kwargs) -> 'NumpyVectorStore':
+        key = (collection_name, kwargs.get('path'))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(collection_name, **kwargs)
+            return cls._shared[key]
+
+    def _load(self):
+        vectors_path = os.path.join(self.dir, 'vectors.npy')
+        rows_path = os.path.join(self.dir, 'rows.jsonl')
+        if not os.path.exists(vectors_path) or not os.path.exists(rows_path):
+            return
+        with open(rows_path, encoding='utf-8') as f:
+            self._rows = [json.loads(line) for line in f if line.strip()]
+        self._base = np.load(vectors_path, mmap_mode='r')
+        # rows.jsonl is appended before vectors.npy is replaced, drop the rows of an interrupted flush,
+        # on disk too: the next flush appends after them
+        if len(self._rows) > len(self._base):
+            self._rows = self._rows[:len(self._base)]
+            tmp_path = os.path.join(self.dir, 'rows.tmp.jsonl')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for row in self._rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+            os.replace(tmp_path, rows_path)
+        self._persisted = len(self._rows)
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        if self.metric_type != 'COSINE':
+            return vectors
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.
+        return vectors / norms
+
+    def insert_data(self, data: Union[dict, List[dict]]):
+        rows = [data] if isinstance(data, dict) else list(data)
+        if not rows:
+            return None
+        vectors = self._normalize(np.asarray([row[self.anns_field] for row in rows], dtype=np.float32))
+        with self._lock:
+            start = len(self._rows)
+            for i, row in enumerate(rows):
+                row = {k: v for k, v in row.items() if k != self.anns_field}
+                self._rows.append(row)
+                for field, values in self._index.items():
+                    values[row.get(field)].append(start + i)
+            self._tail.append(vectors)
+        return [row.get('id', start + i) for i, row in enumerate(rows)]
+
+    def _tail_matrix(self) -> Optional[np.ndarray]:
+        if not self._tail:
+            return None
+        if len(self._tail) > 1:
+            self._tail = [np.concatenate(self._tail)]
+        return self._tail[0]
+
+    def vectors(self, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        '''
+        vectors of the given row ids (all rows for None), persisted rows are read from the memory map
+        '''
+        with self._lock:
+            n_base = len(self._base) if self._base is not None else 0
+            tail = self._tail_matrix()
+            if ids is None:
+                parts = [p for p in (self._base, tail) if p is not None]
+            else:
+                parts = []
+                if n_base:
+                    parts.append(self._base[ids[ids < n_base]])
+                if tail is not None:
+                    parts.append(tail[ids[ids >= n_base] - n_base])
+            if not parts:
+                return np.zeros((0, 0), dtype=np.float32)
+            return np.concatenate(parts) if len(parts) > 1 else np.asarray(parts[0])
+
+    def _field_index(self, field: str) -> Dict[Any, List[int]]:
+        if field not in self._index:
+            values = defaultdict(list)
+            for i, row in enumerate(self._rows):
+                values[row.get(field)].append(i)
+            self._index[field] = values
+        return self._index[field]
+
+    def _candidates(self, expr: Optional[str]) -> Optional[np.ndarray]:
+        '''
+        row ids matching expr, None for every row
+        '''
+        clauses = parse_expr(expr)
+        if not clauses:
+            return None
+        selected = None
+        for field, op, value in clauses:
+            ids = set(self._field_index(field).get(value, ()))
+            if op == '!=':
+                ids = set(range(len(self._rows))) - ids
+            selected = ids if selected is None else selected & ids
+            if not selected:
+                break
+        return np.fromiter(sorted(selected), dtype=np.int64)
+
+    def vector_search(self, search_param: dict) -> List[List[SearchHit]]:
+        queries = np.asarray(search_param['data'], dtype=np.float32)
+        limit = search_param.get('limit', 10)
+        output_fields = search_param.get('output_fields') or []
+        metric_type = (search_param.get('param') or {}).get('metric_type', self.metric_type)
+        with self._lock:
+            candidates = self._candidates(search_param.get('expr'))
+            if len(self._rows) == 0 or (candidates is not None and len(candidates) == 0):
+                return [[] for _ in queries]
+            vectors = self.vectors(candidates)
+            if metric_type == 'L2':
+                scores = -((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(-1)
+            else:
+                scores = self._normalize(queries) @ vectors.T if metric_type == 'COSINE' else queries @ vectors.T
+            k = min(limit, vectors.shape[0])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            results = []
+            for qi in range(len(queries)):
+                order = top[qi][np.argsort(-scores[qi, top[qi]])]
+                hits = []
+                for j in order:
+                    row_id = int(j) if candidates is None else int(candidates[j])
+                    row = self._rows[row_id]
+                    distance = float(-scores[qi, j]) if metric_type == 'L2' else float(scores[qi, j])
+                    hits.append(SearchHit(row.get('id', row_id), distance, {f: row.get(f) for f in output_fields}))
+                results.append(hits)
+            return results
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def flush(self):
+        '''
+        persist the rows inserted since the last flush, no-op without path
+        '''
+        if self.dir is None:
+            return
+        with self._lock:
+            if self._persisted == len(self._rows):
+                return
+            os.makedirs(self.dir, exist_ok=True)
+            with open(os.path.join(self.dir, 'rows.jsonl'), 'a', encoding='utf-8') as f:
+                for row in self._rows[self._persisted:]:
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+            vectors_path = os.path.join(self.dir, 'vectors.npy')
+            tmp_path = os.path.join(self.dir, 'vectors.tmp.npy')
+            np.save(tmp_path, np.ascontiguousarray(self.vectors()))
+            self._base = None
+            os.replace(tmp_path, vectors_path)
+            self._base = np.load(vectors_path, mmap_mode='r')
+            self._tail = []
+            self._persisted = len(self._rows)
+
+    @classmethod
+    def flush_all(cls):
+        for store in list(cls._shared.values()):
+            store.flush()
+
+
+atexit.register(NumpyVectorStore.flush_all)
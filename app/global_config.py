@@ -7,4 +7,24 @@ MILVUS_INDEX_PARAMS = {
     "metric_type":"COSINE",
     "index_type":"IVF_FLAT",
     "params":{"nlist":64}
-}
\ No newline at end of file
+}
+
+# backend of the long-term memory: 'milvus', 'numpy' (in-process, app/database/vector_store.py) or '' (disabled)
+VECTOR_STORE = os.environ.get('VECTOR_STORE', 'milvus' if os.environ.get('Milvus') else '')
+VECTOR_STORE_PATH = os.environ.get('VECTOR_STORE_PATH', '.vector_store') # persistence dir of the numpy backend
+
+# write-behind buffer of MilvusDataStore.insert_data, MILVUS_WRITE_BUFFER_SIZE=0 inserts every row directly
+MILVUS_WRITE_BUFFER_SIZE = int(os.environ.get('MILVUS_WRITE_BUFFER_SIZE', 256))
+MILVUS_FLUSH_INTERVAL = float(os.environ.get('MILVUS_FLUSH_INTERVAL', 1.0)) # seconds a buffered row may wait
+MILVUS_MAX_PENDING = int(os.environ.get('MILVUS_MAX_PENDING', 4096)) # rows kept while milvus is unreachable
+
+# local stand-in for the llm apis, see app/llm/mock_server.py. MOCK_LLM=http uses a server started separately
+# (python -m app.llm.mock_server), MOCK_LLM=inprocess starts it in a thread of the simulation
+MOCK_LLM = os.environ.get('MOCK_LLM', '')
+MOCK_LLM_HOST = os.environ.get('MOCK_LLM_HOST', '127.0.0.1')
+MOCK_LLM_PORT = int(os.environ.get('MOCK_LLM_PORT', 8999))
+MOCK_LLM_KEYS = int(os.environ.get('MOCK_LLM_KEYS', 4)) # fake keys per pool, each with its own rate limit bucket
+MOCK_LLM_SEED = int(os.environ.get('MOCK_LLM_SEED', 0))
+MOCK_LLM_LATENCY = os.environ.get('MOCK_LLM_LATENCY', 'lognormal:-1.2,0.5') # fixed:s, uniform:a,b, normal:mu,sigma or lognormal:mu,sigma
+MOCK_LLM_ERROR_RATE = float(os.environ.get('MOCK_LLM_ERROR_RATE', 0.))
+MOCK_LLM_429_RATE = float(os.environ.get('MOCK_LLM_429_RATE', 0.))
@@ -0,0 +1,240 @@
+import asyncio
+import json
+from functools import partial
+from typing import Dict, List, Optional
+
+from .key_router import estimate_tokens
+from .response_parser import ResponseError, get_response_parser, load_json, parser_stats
+from .scheduler import get_llm_scheduler
+from ..utils.log import LogManager
+
+BATCH_SYSTEM_MESSAGE = 'You write the answers of several game characters. Each request says who its character is, answer it as that character only.'
+
+BATCH_INSTRUCTION = '''You answer for {n} game characters at once. They share the instructions below, the placeholders in braces differ per character and their values are given in each request, after the profile of its character.
+Answer every request independently, as the character of that request.
+
+### Instructions
+{instructions}
+
+### Requests
+{requests}
+
+Return one json dict {{"answers": {{"<request id>": <the json answer of that request, following the example of the instructions>}}}} with an answer for every request id: {ids}.'''
+
+
+def build_batch_message(renders: List[tuple]) -> str:
+    '''
+    renders: [(request id, template, values, profile)] of prompts built from the same template, profile is the
+    system message of the character (name, id, bio), which a single call would have sent.
+    the placeholders that have the same value in every prompt are filled in the shared instructions,
+    the others are listed per request
+    '''
+    template = renders[0][1]
+    texts = [{att: str(values[att]) for att in template.attributes} for _, _, values, _ in renders]
+    shared = {att: texts[0][att] for att in template.attributes if all(t[att] == texts[0][att] for t in texts)}
+    instructions = template.render(lambda att: shared[att] if att in shared else '{' + att + '}')
+    requests = '\n'.join(
+        f'#### {request_id}\nCharacter: {profile.strip()}\nValues: '
+        + json.dumps({att: v for att, v in t.items() if att not in shared}, ensure_ascii=False)
+        for (request_id, _, _, profile), t in zip(renders, texts))
+    return BATCH_INSTRUCTION.format(n=len(renders), instructions=instructions.strip(), requests=requests,
+                                    ids=', '.join(request_id for request_id, *_ in renders))
+
+
+def split_batch_reply(reply, request_ids: List[str]) -> Dict[str, object]:
+    '''
+    request id -> raw answer, the ids without an answer are left out
+    '''
+    value, _ = load_json(reply) if not isinstance(reply, dict) else (reply, False)
+    answers = value.get('answers') if isinstance(value, dict) else None
+    if not isinstance(answers, dict):
+        raise ResponseError('the batched reply has no "answers" dict', fragment=str(reply)[:500])
+    return {request_id: answers[request_id] for request_id in request_ids if request_id in answers}
+
+
+class BatchRequest:
+    def __init__(self, request_id: str, state, prompt: str, future: asyncio.Future):
+        self.request_id = request_id
+        self.state = state
+        self.prompt = prompt
+        self.future = future
+        self.template, self.values, _ = state.prompt_class.last_render
+        self.profile = '\n'.join(str(m.get('content') or '') for m in state.character._oai_system_message)
+
+
+class DecisionBatcher:
+    '''
+    packs the llm calls of the same PromptType issued by several characters within `window` seconds
+    (in practice: the same tick) into one call answering all of them, at most max_size per call.
+    the answers are validated against the example of the prompt and delivered to the futures the states wait on,
+    a request whose answer is missing or invalid, or the whole batch when the call fails, falls back to single calls.
+    '''
+    def __init__(self, prompt_types: List[str], max_size: int = 10, window: float = 0.05):
+        self.prompt_types = set(prompt_types)
+        self.max_size = max_size
+        self.window = window
+        self._pending: Dict[str, List[BatchRequest]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._owners: Dict[int, set] = {} # id(state) -> its requests not answered yet, pending or in a batch
+        self._seq = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.single_calls = 0
+        self.fallbacks = 0
+        self.calls_saved = 0
+        self.tokens_saved = 0.
+
+    def accepts(self, state, prompt: str) -> bool:
+        '''
+        only the configured prompt types, and only prompts rendered from their template as is (no warning messages appended)
+        '''
+        prompt_class = state.prompt_class
+        return (getattr(state.prompt_type, 'name', None) in self.prompt_types
+                and not prompt_class.warning_added
+                and getattr(prompt_class, 'last_render', None) is not None
+                and prompt_class.last_render[2] == prompt)
+
+    def request(self, state, prompt: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        key = state.prompt_type.name
+        self._seq += 1
+        request = BatchRequest(f'r{self._seq}', state, prompt, loop.create_future())
+        self._owners.setdefault(id(state), set()).add(request)
+        request.future.add_done_callback(partial(self._on_request_done, request))
+        pending = self._pending.setdefault(key, [])
+        pending.append(request)
+        if len(pending) >= self.max_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return request.future
+
+    def cancel_owner(self, state):
+        '''
+        cancel the requests of a state that exits, whether they still wait for their batch or are in one:
+        a batch skips its cancelled requests and does not fall back to single calls for them
+        '''
+        for request in list(self._owners.get(id(state), ())):
+            request.future.cancel()
+
+    def _on_request_done(self, request: BatchRequest, future: asyncio.Future):
+        requests = self._owners.get(id(request.state))
+        if requests is not None:
+            requests.discard(request)
+            if not requests:
+                del self._owners[id(request.state)]
+
+    def _flush(self, key: str):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        requests = [r for r in self._pending.pop(key, []) if not r.future.done()]
+        if len(requests) == 1:
+            self._single(requests[0])
+        elif requests:
+            future = get_llm_scheduler().submit(partial(self._run_batch, requests), prompt_type=requests[0].state.prompt_type)
+            future.add_done_callback(partial(self._on_batch_done, requests))
+            for request in requests: # the batch call is obsolete once all its states exited
+                request.future.add_done_callback(
+                    lambda _: future.cancel() if all(r.future.cancelled() for r in requests) else None)
+
+    def _on_batch_done(self, requests: List[BatchRequest], future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None: # e.g. expired in the llm queue
+            for request in requests:
+                if not request.future.done():
+                    self.fallbacks += 1
+                    self._single(request)
+
+    def _single(self, request: BatchRequest):
+        if request.future.done(): # cancelled: its state exited
+            return
+        state = request.state
+        self.single_calls += 1
+        future = get_llm_scheduler().submit(lambda: state.character.a_process_then_reply(
+                        message=request.prompt, sender=state.character, restart=True, check_exempt_layers=state.prompt_class.check_exempt_layers),
+                    prompt_type=state.prompt_type, owner=state)
+        future.add_done_callback(partial(_copy_future, request.future))
+        request.future.add_done_callback(lambda f: future.cancel() if f.cancelled() else None)
+
+    async def _run_batch(self, requests: List[BatchRequest]):
+        lead = requests[0].state.character
+        message = build_batch_message([(r.request_id, r.template, r.values, r.profile) for r in requests]).replace('TERMINATE', '')
+        system_message = [{'role': 'system', 'content': BATCH_SYSTEM_MESSAGE}]
+        # the tokens of the call are split evenly between the characters of the batch
+        usage_shares = [(r.state.character.name, r.state.state_name) for r in requests]
+        try:
+            client = lead.clients.get(requests[0].state.default_client, lead.client)
+            reply = await asyncio.to_thread(
+                partial(lead.routed_reply_from_client, client, [{'role': 'user', 'content': message}], structured=False,
+                        system_message=system_message, usage_shares=usage_shares))
+            answers = split_batch_reply(reply, [r.request_id for r in requests])
+        except Exception as e:
+            LogManager.log_warning(f"[DecisionBatcher]: batch of {len(requests)} {requests[0].state.prompt_type} failed, single calls instead: {e!r}")
+            answers = {}
+        self.batches += 1
+        self.batched_requests += len(requests)
+        delivered = 0
+        for request in requests:
+            if request.future.done():
+                continue
+            prompt_class = request.state.prompt_class
+            try:
+                if request.request_id not in answers:
+                    raise ResponseError('no answer in the batched reply')
+                parser = get_response_parser(getattr(prompt_class, 'EXAMPLE', None), prompt_class.check_exempt_layers)
+                result, repaired = parser.parse(answers[request.request_id])
+            except ResponseError:
+                self.fallbacks += 1
+                self._single(request)
+                continue
+            parser_stats.record(repaired)
+            delivered += 1
+            request.future.set_result(result)
+        if delivered:
+            singles = sum(estimate_tokens([{'content': r.prompt}, {'content': r.profile}]) for r in requests)
+            self.calls_saved += delivered - 1
+            self.tokens_saved += max(0., singles - estimate_tokens([{'content': message}] + system_message))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'batches': self.batches,
+            'batched_requests': self.batched_requests,
+            'avg_batch_size': round(self.batched_requests / self.batches, 2) if self.batches else 0.,
+            'single_calls': self.single_calls,
+            'fallbacks': self.fallbacks,
+            'calls_saved': self.calls_saved,
+            'tokens_saved': round(self.tokens_saved),
+        }
+
+
+def _copy_future(target: asyncio.Future, source: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+_decision_batcher: DecisionBatcher = None
+
+
+def get_decision_batcher() -> Optional[DecisionBatcher]:
+    '''
+    process-wide batcher for the PromptType names of CommonConfig.llm_batch_prompt_types, None when it is empty
+    '''
+    global _decision_batcher
+    from config.config_common import CommonConfig
+    if not CommonConfig.llm_batch_prompt_types:
+        return None
+    if _decision_batcher is None:
+        _decision_batcher = DecisionBatcher(CommonConfig.llm_batch_prompt_types,
+                                            max_size=CommonConfig.llm_batch_max_size,
+                                            window=CommonConfig.llm_batch_window)
+    return _decision_batcher
+
+
+def get_batcher_stats() -> Optional[Dict[str, float]]:
+    return _decision_batcher.stats() if _decision_batcher is not None else None
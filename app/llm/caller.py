@@ -41,3 +41,16 @@ class LLMCaller:
             result = {"response": result}
 
         return result
+
+
+_llm_callers: Dict[str, LLMCaller] = {}
+
+
+def get_llm_caller(model: str) -> LLMCaller:
+    '''
+    one caller per model, shared by the states of every character
+    '''
+    caller = _llm_callers.get(model)
+    if caller is None:
+        caller = _llm_callers.setdefault(model, LLMCaller(model))
+    return caller
@@ -0,0 +1,85 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class EmbeddingCache:
+    '''
+    content addressed embedding cache, key = sha1(namespace + text), namespace is the embedding model name.
+    - memory tier: LRU of at most max_items vectors
+    - disk tier: diskcache.Cache under disk_dir, written through on every put, so vectors evicted from the
+      memory tier (and the ones of previous runs) are promoted back on the next hit
+    disk_dir=None, or diskcache not installed, keeps the memory tier only.
+    '''
+    def __init__(self, namespace: str = '', max_items: int = 20000, disk_dir: Optional[str] = None,
+                 disk_size_limit: int = 2 ** 30):
+        self.namespace = namespace
+        self.max_items = max_items
+        self._memory: 'OrderedDict[str, List[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_dir is not None:
+            try:
+                from diskcache import Cache
+                self._disk = Cache(disk_dir, size_limit=disk_size_limit)
+            except ImportError:
+                print('diskcache is not installed, embeddings are cached in memory only')
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f'{self.namespace}\0{text}'.encode('utf-8')).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        # called with the lock held
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self.key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+        vector = self._disk.get(key) if self._disk is not None else None
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, vector)
+        return vector
+
+    def put(self, text: str, vector: List[float]):
+        key = self.key(text)
+        with self._lock:
+            self._remember(key, vector)
+        if self._disk is not None:
+            self._disk.set(key, vector)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.,
+            'memory_items': len(self._memory),
+            'disk_items': len(self._disk) if self._disk is not None else 0,
+        }
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .embedding_cache import EmbeddingCache
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_DIM = 3072 # dim of text-embedding-3-large, see the vector fields in milvus_constants.py
+
+
+class LocalEmbeddings:
+    '''
+    deterministic offline embedder (feature hashing of the lowercased words), same interface as langchain OpenAIEmbeddings.
+    texts sharing words get a positive cosine similarity, identical texts get identical vectors.
+    '''
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed_query(self, text: str) -> List[float]:
+        vec = [0.] * self.dim
+        for token in re.findall(r'\w+', text.lower()):
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            idx = int.from_bytes(digest[:4], 'little') % self.dim
+            vec[idx] += 1. if digest[4] & 1 else -1.
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+class EmbeddingService:
+    '''
+    shared embedding entry for every character.
+    - embed_query / embed_documents: blocking, drop-in for langchain embeddings
+    - aembed_query / aembed_documents: requests issued in the same short window (max_wait) are coalesced into
+      one embed_documents call of at most max_batch_size texts, which runs in a thread pool, off the event loop
+    texts found in cache (an EmbeddingCache) are never sent to the embedder.
+    '''
+    def __init__(self, embedder=None, max_batch_size: int = 64, max_wait: float = 0.005, max_workers: int = 4,
+                 cache: Optional[EmbeddingCache] = None):
+        self.embedder = embedder if embedder is not None else LocalEmbeddings()
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='embedding')
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.requests = 0
+        self.batches = 0
+        self.embedded_texts = 0
+        self.embed_seconds = 0.
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        vectors = self.embedder.embed_documents(texts)
+        self.embed_seconds += time.perf_counter() - start
+        self.batches += 1
+        self.embedded_texts += len(texts)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        '''
+        one embedder call for all the texts that are not cached, duplicated texts are embedded once
+        '''
+        if not texts:
+            return []
+        self.requests += len(texts)
+        text2vec = {}
+        for text in dict.fromkeys(texts):
+            vector = self.cache.get(text) if self.cache is not None else None
+            if vector is not None:
+                text2vec[text] = vector
+        missing = [text for text in dict.fromkeys(texts) if text not in text2vec]
+        if missing:
+            for text, vector in zip(missing, self._embed_batch(missing)):
+                text2vec[text] = vector
+                if self.cache is not None:
+                    self.cache.put(text, vector)
+        return [text2vec[text] for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.requests += 1
+        if self.cache is not None:
+            vector = self.cache.get(text)
+            if vector is not None:
+                return vector
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush, loop)
+        return await future
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*[self.aembed_query(text) for text in texts]))
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            done = loop.run_in_executor(self._executor, self._embed_batch, texts)
+            done.add_done_callback(lambda fut, batch=batch, texts=texts: self._resolve(batch, texts, fut))
+
+    def _resolve(self, batch, texts, done: asyncio.Future):
+        if done.exception() is not None:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(done.exception())
+            return
+        text2vec = dict(zip(texts, done.result()))
+        if self.cache is not None:
+            for text, vector in text2vec.items():
+                self.cache.put(text, vector)
+        for text, future in batch:
+            if not future.done():
+                future.set_result(text2vec[text])
+
+    def stats(self) -> Dict[str, float]:
+        stats = {
+            'requests': self.requests,
+            'batches': self.batches,
+            'embedded_texts': self.embedded_texts,
+            'avg_batch_size': self.embedded_texts / self.batches if self.batches else 0.,
+            'embed_seconds': self.embed_seconds,
+        }
+        if self.cache is not None:
+            stats.update({f'cache_{k}': v for k, v in self.cache.stats().items()})
+        return stats
+
+
+_embedding_service: EmbeddingService = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    '''
+    process-wide service. EMBEDDING_BACKEND=local uses LocalEmbeddings (offline runs and tests),
+    otherwise OpenAI text-embedding-3-large. The cache is sized by CommonConfig.embedding_cache_*
+    '''
+    global _embedding_service
+    if _embedding_service is None:
+        from config.config_common import CommonConfig
+        if os.getenv('EMBEDDING_BACKEND', 'openai') == 'local':
+            embedder = LocalEmbeddings()
+        else:
+            from langchain_openai import OpenAIEmbeddings
+            embedder = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+        cache = EmbeddingCache(namespace=f'{type(embedder).__name__}/{EMBEDDING_MODEL}',
+                               max_items=CommonConfig.embedding_cache_size,
+                               disk_dir=CommonConfig.embedding_cache_dir) if CommonConfig.embedding_cache_size > 0 else None
+        _embedding_service = EmbeddingService(embedder, cache=cache)
+    return _embedding_service
+
+
+def get_embedding_stats() -> Optional[Dict[str, float]]:
+    '''
+    counters of the process-wide service (batches, cache hit rate), None if nothing was embedded yet
+    '''
+    return _embedding_service.stats() if _embedding_service is not None else None
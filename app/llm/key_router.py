@@ -0,0 +1,283 @@
+import copy
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..utils.load_oai_config import plug_api_to_cfg
+from ..utils.log import LogManager
+
+POOLS = ['cheap_api', 'official_api']
+
+
+class TokenBucket:
+    '''
+    refills capacity units per minute, continuously
+    '''
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.level
+
+    def wait_time(self, amount: float) -> float:
+        '''
+        seconds until amount units are available, amount is capped at the capacity
+        '''
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0., missing / self.rate) if self.rate > 0 else float('inf')
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount # may go negative, the debt delays the next requests
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ApiKey:
+    def __init__(self, key: str, pool: str, rpm: float, tpm: float):
+        self.key = key
+        self.pool = pool
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.
+        self.consecutive_failures = 0
+        self.agents: List[str] = [] # agents whose home key this is
+        self.n_requests = 0
+        self.n_tokens = 0
+        self.n_errors = 0
+        self.n_rate_limited = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def wait_time(self, est_tokens: float) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(est_tokens))
+
+    def headroom(self) -> float:
+        return min(self.requests.available() / self.requests.capacity, self.tokens.available() / self.tokens.capacity)
+
+    def stats(self) -> Dict:
+        return {
+            'pool': self.pool,
+            'requests': self.n_requests,
+            'tokens': self.n_tokens,
+            'errors': self.n_errors,
+            'rate_limited': self.n_rate_limited,
+            'in_flight': self.in_flight,
+            'rpm_utilization': round(1 - self.requests.available() / self.requests.capacity, 3),
+            'tpm_utilization': round(1 - self.tokens.available() / self.tokens.capacity, 3),
+            'healthy': self.healthy(time.monotonic()),
+            'agents': len(self.agents),
+        }
+
+
+class KeyLease:
+    '''
+    one request on one key, returned by KeyRouter.acquire and handed back with KeyRouter.release
+    '''
+    def __init__(self, api_key: ApiKey, tag: str, client, est_tokens: float):
+        self.api_key = api_key
+        self.tag = tag
+        self.client = client
+        self.est_tokens = est_tokens
+
+
+class KeyRouter:
+    '''
+    in-process pool of the cheap_api / official_api keys shared by every agent.
+    - every key has an RPM and a TPM token bucket, a request goes to the healthy key with the most headroom
+    - a 429 puts the key in cooldown (doubling per consecutive failure), other errors count against its health
+    - when no key of the pool of the requested model can serve in time, the request fails over to the same model
+      on the other pool, if the config template has one
+    the config template (OAI_CFG_TMPLT) is split by pool once: a model config belongs to the pool whose
+    placeholder it uses, and clients are built per (tag, key, response_format) and cached.
+    '''
+    SENTINEL = '__{}_placeholder__'
+
+    def __init__(self, apis: Dict[str, List[str]], cfg_tmplt: str, limits: Dict[str, Dict[str, float]],
+                 max_wait: float = 30., cooldown: float = 5., max_cooldown: float = 120.):
+        self.max_wait = max_wait
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._cond = threading.Condition()
+        self.keys: Dict[str, List[ApiKey]] = {
+            pool: [ApiKey(key, pool, limits[pool]['rpm'], limits[pool]['tpm']) for key in dict.fromkeys(apis.get(pool, []))]
+            for pool in POOLS
+        }
+        self._key_index = {(k.pool, k.key): k for pool in self.keys.values() for k in pool}
+        self.tag2cfg: Dict[str, Tuple[str, dict]] = {} # tag -> (pool, model config with the pool placeholder)
+        for cfg in plug_api_to_cfg(cfg_tmplt, **{pool: self.SENTINEL.format(pool) for pool in POOLS}):
+            tag = cfg.get('tag', cfg.get('model'))
+            pool = next((p for p in POOLS if self.SENTINEL.format(p) in str(cfg)), None)
+            if pool is not None:
+                self.tag2cfg[tag] = (pool, cfg)
+        self._clients = {}
+        self.failovers = 0
+        self.waited_seconds = 0.
+
+    def assign(self, llm_cfg: Dict[str, str], agent: str):
+        '''
+        remember the home keys of an agent, for the utilization stats
+        '''
+        for pool in POOLS:
+            api_key = self._key_index.get((pool, llm_cfg.get(pool)))
+            if api_key is not None:
+                api_key.agents.append(agent)
+
+    def least_used_cfg(self) -> Dict[str, str]:
+        '''
+        home keys for a new agent: the keys with the fewest agents
+        '''
+        return {pool: min(keys, key=lambda k: len(k.agents)).key for pool, keys in self.keys.items() if keys}
+
+    def _client(self, tag: str, api_key: ApiKey, response_format: Optional[Dict] = None):
+        from autogen import OpenAIWrapper
+        cache_key = (tag, api_key.key, json.dumps(response_format, sort_keys=True) if response_format else None)
+        if cache_key not in self._clients:
+            cfg = copy.deepcopy(self.tag2cfg[tag][1])
+            cfg.pop('tag', None)
+            sentinel = self.SENTINEL.format(api_key.pool)
+            cfg = {k: v.replace(sentinel, api_key.key) if isinstance(v, str) else v for k, v in cfg.items()}
+            if response_format:
+                cfg['response_format'] = response_format
+            self._clients[cache_key] = OpenAIWrapper(config_list=[cfg])
+        return self._clients[cache_key]
+
+    def _candidate_tags(self, tag: str) -> List[str]:
+        '''
+        the requested tag, then the tags of the same model on the other pool
+        '''
+        pool, cfg = self.tag2cfg[tag]
+        others = [t for t, (p, c) in self.tag2cfg.items() if p != pool and c.get('model') == cfg.get('model')]
+        return [tag] + others
+
+    def _pick(self, tags: List[str], est_tokens: float):
+        '''
+        (tag, key, wait) of the best key, keys that can serve now first, then the shortest wait
+        '''
+        now = time.monotonic()
+        best = None
+        for rank, tag in enumerate(tags):
+            for api_key in self.keys[self.tag2cfg[tag][0]]:
+                if not api_key.healthy(now):
+                    wait = api_key.cooldown_until - now
+                else:
+                    wait = api_key.wait_time(est_tokens)
+                # prefer the requested pool unless the other one is ready noticeably earlier
+                score = (wait + rank * 1., api_key.in_flight, -api_key.headroom())
+                if best is None or score < best[0]:
+                    best = (score, tag, api_key, wait)
+        return best[1:] if best else (None, None, None)
+
+    def routes(self, tag: str) -> bool:
+        return tag in self.tag2cfg and bool(self.keys[self.tag2cfg[tag][0]])
+
+    def model_of(self, tag: str) -> Optional[str]:
+        return self.tag2cfg[tag][1].get('model') if tag in self.tag2cfg else None
+
+    def acquire(self, tag: str, est_tokens: float = 0., response_format: Optional[Dict] = None) -> KeyLease:
+        '''
+        blocking, called from the reply threads of the agents. waits at most max_wait for a key with headroom.
+        response_format replaces the one of the model config, e.g. a json_schema for structured output
+        '''
+        tags = self._candidate_tags(tag)
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while True:
+                picked_tag, api_key, wait = self._pick(tags, est_tokens)
+                remaining = deadline - time.monotonic()
+                if wait <= 0 or remaining <= 0:
+                    break
+                start = time.monotonic()
+                self._cond.wait(timeout=min(wait, remaining))
+                self.waited_seconds += time.monotonic() - start
+            if picked_tag != tag:
+                self.failovers += 1
+            api_key.requests.take(1)
+            api_key.tokens.take(est_tokens)
+            api_key.in_flight += 1
+            api_key.n_requests += 1
+        return KeyLease(api_key, picked_tag, self._client(picked_tag, api_key, response_format), est_tokens)
+
+    def release(self, lease: KeyLease, used_tokens: Optional[float] = None, error: Optional[Exception] = None):
+        api_key = lease.api_key
+        with self._cond:
+            api_key.in_flight -= 1
+            if used_tokens is not None:
+                # settle the estimate with the tokens that were actually used
+                api_key.tokens.give_back(lease.est_tokens)
+                api_key.tokens.take(used_tokens)
+                api_key.n_tokens += used_tokens
+            if error is None:
+                api_key.consecutive_failures = 0
+            else:
+                api_key.n_errors += 1
+                api_key.consecutive_failures += 1
+                if is_rate_limit_error(error):
+                    api_key.n_rate_limited += 1
+                    cooldown = min(self.max_cooldown, self.cooldown * 2 ** (api_key.consecutive_failures - 1))
+                    api_key.cooldown_until = time.monotonic() + cooldown
+                    LogManager.log_warning(f"[KeyRouter]: {api_key.pool} key ...{api_key.key[-4:]} rate limited, cooldown {cooldown:.0f}s")
+                elif api_key.consecutive_failures >= 3:
+                    api_key.cooldown_until = time.monotonic() + self.cooldown
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'failovers': self.failovers,
+                'waited_seconds': round(self.waited_seconds, 3),
+                'keys': {f'{k.pool}:...{k.key[-4:]}': k.stats() for keys in self.keys.values() for k in keys},
+            }
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, 'status_code', None) == 429 or type(error).__name__ == 'RateLimitError'
+
+
+def estimate_tokens(messages: List[Dict]) -> float:
+    '''
+    ~4 characters per token, good enough for the TPM buckets
+    '''
+    return sum(len(str(m.get('content') or '')) for m in messages) / 4. + 4 * len(messages)
+
+
+_key_router: KeyRouter = None
+
+
+def init_key_router(cheap_apis: List[str], official_apis: List[str], cfg_tmplt: str) -> KeyRouter:
+    global _key_router
+    from config.config_common import CommonConfig
+    _key_router = KeyRouter({'cheap_api': cheap_apis, 'official_api': official_apis}, cfg_tmplt,
+                            limits=CommonConfig.api_key_limits, max_wait=CommonConfig.api_key_max_wait)
+    return _key_router
+
+
+def get_key_router() -> Optional[KeyRouter]:
+    return _key_router
+
+
+def register_agent(llm_cfg: Dict[str, str], guid, prefix: str):
+    '''
+    llm_cfg = {
+        'cheap_api': 'xxx',
+        'official_api': 'xxx',
+    }
+    '''
+    assert all(k in llm_cfg for k in POOLS), 'llm_cfg should contain cheap_api and official_api'
+    if _key_router is not None:
+        _key_router.assign(llm_cfg, agent=f'{prefix}_{guid}')
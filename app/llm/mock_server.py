@@ -0,0 +1,286 @@
+'''
+deterministic OpenAI-compatible stand-in for load testing the simulation without api keys
+
+    MOCK_LLM=http python -m app.llm.mock_server [--port 8999] [--seed 0] [--latency lognormal:-1.2,0.5] [--error-rate 0.01] [--rate-limit-rate 0.02]
+    MOCK_LLM=http python app/main.py ...        # in another shell
+    MOCK_LLM=inprocess python app/main.py ...   # the simulation starts the server in a thread
+
+with MOCK_LLM set, config/__init__.py loads MOCK_OAI_CFG_TMPLT.txt instead of OAI_CFG_TMPLT.txt and fake keys instead
+of cheap_apis.txt / official_apis.txt, so every model config points to this server.
+chat completions are answered with the EXAMPLE of the registered prompt found in the request (numbers jittered),
+a batched request of app.llm.batcher gets one answer per request id, other chats get a json content reply.
+image generations return urls of small pngs served by this server (GET /image/<n>.png), so the drawings can be downloaded.
+the answer, the latency and the injected errors only depend on the seed, the request body and how many times
+the same body was sent before.
+'''
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+BATCH_ID = re.compile(r'^#### (\S+)$', re.MULTILINE)
+IMAGE_PATH = re.compile(r'/image/(\d+)\.png$')
+
+
+def parse_latency(spec: str):
+    '''
+    fixed:s, uniform:a,b, normal:mu,sigma or lognormal:mu,sigma (of the log of the seconds) -> rng -> seconds
+    '''
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v]
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda rng: max(0., rng.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f'unknown latency distribution {spec}, expected fixed, uniform, normal or lognormal')
+
+
+def vary(example: Any, rng: random.Random) -> Any:
+    '''
+    a value of the same structure and types as the example: numbers are jittered, strings and booleans are kept
+    since the states read them as names, actions, etc.
+    '''
+    if isinstance(example, dict):
+        return {k: vary(v, rng) for k, v in example.items()}
+    if isinstance(example, list):
+        return [vary(v, rng) for v in example]
+    if isinstance(example, bool):
+        return example
+    if isinstance(example, int):
+        return example + rng.randint(-1, 1)
+    if isinstance(example, float):
+        return round(example * rng.uniform(0.8, 1.2), 3)
+    return example
+
+
+def from_schema(schema: Dict, rng: random.Random) -> Any:
+    kind = schema.get('type')
+    if kind == 'object':
+        return {k: from_schema(v, rng) for k, v in schema.get('properties', {}).items()}
+    if kind == 'array':
+        return [from_schema(schema['items'], rng)] if 'items' in schema else []
+    return {'string': 'ok', 'integer': rng.randint(0, 5), 'number': round(rng.random(), 3), 'boolean': True}.get(kind)
+
+
+def png(seed: int, size: int = 32) -> bytes:
+    '''
+    a small solid color png, the color depends on the seed
+    '''
+    rng = random.Random(seed)
+    pixel = bytes(rng.randrange(256) for _ in range(3))
+    raw = b''.join(b'\x00' + pixel * size for _ in range(size)) # filter type 0 per row
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def registered_examples() -> List[Tuple[str, Any, Tuple[str, ...]]]:
+    '''
+    (prompt type name, EXAMPLE, texts that identify it in a prompt) of every registered prompt
+    '''
+    from . import prompt as _prompt # registers the prompt classes
+    from ..models import internal_dialogue as _internal_dialogue # registers the monologue prompt
+    from ..service.character_state import PromptName2Registered
+    examples = []
+    for prompt_type, prompt_class in PromptName2Registered.items():
+        example = getattr(prompt_class, 'EXAMPLE', None)
+        if example is None:
+            continue
+        if isinstance(example, str):
+            example = json.loads(example)
+        needles = (str(example), json.dumps(example), json.dumps(example, ensure_ascii=False))
+        examples.append((getattr(prompt_type, 'name', str(prompt_type)), example, needles))
+    # the longest first, an example may contain a shorter one
+    return sorted(examples, key=lambda e: len(e[2][0]), reverse=True)
+
+
+class MockLLM:
+    '''
+    builds the responses of the mock server, independent of the transport
+    '''
+    def __init__(self, seed: int = 0, latency: str = 'fixed:0', error_rate: float = 0., rate_limit_rate: float = 0.,
+                 examples: Optional[List[Tuple[str, Any, Tuple[str, ...]]]] = None, base_url: str = 'http://127.0.0.1:8999'):
+        self.seed = seed
+        self.base_url = base_url # of this server, the generated images are served under base_url/image/<n>.png
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._examples = examples
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'by_prompt_type': {}}
+
+    @property
+    def examples(self):
+        if self._examples is None:
+            self._examples = registered_examples()
+        return self._examples
+
+    def _rng(self, body: bytes) -> random.Random:
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            occurrence = self._seen.get(digest, 0)
+            self._seen[digest] = occurrence + 1
+        return random.Random(f'{self.seed}:{digest}:{occurrence}')
+
+    def _count(self, key: str, sub: Optional[str] = None):
+        with self._lock:
+            if sub is None:
+                self.stats[key] += 1
+            else:
+                self.stats[key][sub] = self.stats[key].get(sub, 0) + 1
+
+    def match(self, text: str) -> Tuple[Optional[str], Any]:
+        for name, example, needles in self.examples:
+            if any(needle in text for needle in needles):
+                return name, example
+        return None, None
+
+    def answer(self, request: Dict, rng: random.Random) -> Tuple[str, str]:
+        '''
+        (prompt type name, content) of a chat completion request
+        '''
+        messages = request.get('messages') or []
+        text = '\n'.join(str(m.get('content') or '') for m in messages if m.get('role') != 'system')
+        name, example = self.match(text)
+        ids = BATCH_ID.findall(text) if '"answers"' in text else []
+        if ids and example is not None:
+            return f'{name}(batch)', json.dumps({'answers': {i: vary(example, rng) for i in ids}}, ensure_ascii=False)
+        if example is not None:
+            return name, json.dumps(vary(example, rng), ensure_ascii=False)
+        response_format = request.get('response_format') or {}
+        if response_format.get('type') == 'json_schema':
+            return 'SCHEMA', json.dumps(from_schema(response_format['json_schema']['schema'], rng))
+        return 'CHAT', json.dumps({'think_twice': 'mock reply', 'content': f'mock reply {rng.randint(0, 999)}'})
+
+    def handle(self, path: str, body: bytes) -> Tuple[int, Dict[str, str], Dict, float]:
+        '''
+        (status, headers, json body, seconds to wait before responding)
+        '''
+        rng = self._rng(body)
+        delay = self.latency(rng)
+        self._count('requests')
+        if rng.random() < self.rate_limit_rate:
+            self._count('rate_limited')
+            return 429, {'retry-after': '1'}, {'error': {'message': 'Rate limit reached (mock)', 'type': 'requests', 'code': 'rate_limit_exceeded'}}, delay * 0.1
+        if rng.random() < self.error_rate:
+            self._count('errors')
+            return 500, {}, {'error': {'message': 'The server had an error (mock)', 'type': 'server_error'}}, delay
+        request = json.loads(body or b'{}')
+        if path.endswith('/images/generations'):
+            return 200, {}, {'created': int(time.time()), 'data': [{'url': f'{self.base_url}/image/{rng.randint(0, 10 ** 6)}.png'}]}, delay
+        if not path.endswith('/chat/completions'):
+            return 404, {}, {'error': {'message': f'{path} is not mocked', 'type': 'invalid_request_error'}}, 0.
+        name, content = self.answer(request, rng)
+        self._count('by_prompt_type', name)
+        prompt_tokens = math.ceil(sum(len(str(m.get('content') or '')) for m in request.get('messages') or []) / 4)
+        completion_tokens = math.ceil(len(content) / 4)
+        return 200, {}, {
+            'id': f'chatcmpl-mock-{uuid.UUID(int=rng.getrandbits(128)).hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'logprobs': None,
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }, delay
+
+
+    def image(self, path: str) -> Optional[bytes]:
+        '''
+        the png of an image url returned by /images/generations, None for other paths
+        '''
+        match = IMAGE_PATH.search(path)
+        return png(self.seed * 10 ** 7 + int(match.group(1))) if match else None
+
+
+def make_handler(mock: MockLLM):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('content-length') or 0))
+            status, headers, payload, delay = mock.handle(self.path, body)
+            time.sleep(delay)
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('content-type', 'application/json')
+            self.send_header('content-length', str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            image = mock.image(self.path)
+            data = image if image is not None else json.dumps(mock.stats).encode('utf-8')
+            self.send_response(200)
+            self.send_header('content-type', 'image/png' if image is not None else 'application/json')
+            self.send_header('content-length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockHandler
+
+
+def start_mock_server(host: str = '127.0.0.1', port: int = 8999, **mock_kwargs) -> Tuple[ThreadingHTTPServer, MockLLM]:
+    '''
+    in-process mode: serve in a daemon thread of the current process, port=0 picks a free port
+    '''
+    mock = MockLLM(**mock_kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    mock.base_url = f'http://{host}:{server.server_address[1]}'
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mock-llm-server', daemon=True).start()
+    return server, mock
+
+
+def start_configured_mock_server() -> Optional[Tuple[ThreadingHTTPServer, MockLLM]]:
+    '''
+    starts the in-process server when MOCK_LLM=inprocess, with the MOCK_LLM_* settings of app/global_config.py
+    '''
+    from ..global_config import (MOCK_LLM, MOCK_LLM_429_RATE, MOCK_LLM_ERROR_RATE, MOCK_LLM_HOST, MOCK_LLM_LATENCY,
+                                 MOCK_LLM_PORT, MOCK_LLM_SEED)
+    if MOCK_LLM != 'inprocess':
+        return None
+    return start_mock_server(MOCK_LLM_HOST, MOCK_LLM_PORT, seed=MOCK_LLM_SEED, latency=MOCK_LLM_LATENCY,
+                             error_rate=MOCK_LLM_ERROR_RATE, rate_limit_rate=MOCK_LLM_429_RATE)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', default='lognormal:-1.2,0.5')
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.)
+    args = parser.parse_args()
+    mock = MockLLM(seed=args.seed, latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                   base_url=f'http://{args.host}:{args.port}')
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    print(f'mock llm server on http://{args.host}:{args.port}/v1')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
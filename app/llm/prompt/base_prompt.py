@@ -1,7 +1,4 @@
 import copy
-import os
-import re
-import traceback
 from typing import List, Optional, Union
 
 from ...models.building import BuildingList
@@ -9,6 +6,8 @@ from ...models.character import Character, CharacterList
 from ...utils.log import LogManager
 from ...service.character_state import FuncName2Registered, PromptName2Registered, StateName2Registered
 from ...utils.serialization import serialize
+from .context import get_context_assembler
+from .template import prompt_templates
 
 class BasePrompt:
     '''
@@ -34,6 +33,7 @@ class BasePrompt:
         self.check_exempt_layers = [1,2,3,4,5,6,7,8,9]
         
         self.recordable_key = None 
+        self.last_render = None
     
     def set_recordable_key(self, key: Union[str, List[str]]):
         if type(key) is str : 
@@ -59,46 +59,44 @@ class BasePrompt:
                     # building_list: BuildingList,
                     **kwargs,
                     ) -> str:
-        # find prompt by prompt_type in llm/prompt folder
-        # if cannot find, return error message
-        # replace placeholder with character info and building list
-        # return prompt
-        prompt_file_path = os.path.join(os.path.dirname(__file__), self.prompt_type.to_str() + '.txt')
-        if os.path.exists(prompt_file_path):
-            with open(prompt_file_path, 'r', encoding='utf-8') as file:
-                    base_prompt = file.read()
-        elif hasattr(self, 'PROMPT'):
-            base_prompt = self.PROMPT
+        # the template of the prompt type is compiled once, and again only when its .txt file changes
+        # placeholders are filled with kwargs, working memory, prompt attributes or character attributes
+        template = prompt_templates.get(self.prompt_type, getattr(self, 'PROMPT', None))
         
         att_dict = dict()
-        att_dict.update({'buildings': self.building_list.get_building_descriptions()})
-        att_dict.update({'memory': self.character.longterm_memory.to_json()})
+        att_dict.update({'buildings': self.building_list.get_building_descriptions()} if 'buildings' in template.attributes else {})
+        att_dict.update({'memory': self.character.longterm_memory.to_json()} if 'memory' in template.attributes else {})
         att_dict.update(self.character.working_memory.serialize())
         att_dict.update(kwargs)
-        
-        attributes = re.findall('\{([a-zA-Z_]+)\}', base_prompt) 
-        for att in attributes:
-            if att in att_dict:
-                att_val = att_dict[att]
-            elif hasattr(self, att):
-                att_val = getattr(self, att)
-            elif hasattr(self.character, att):
-                att_val = getattr(self.character, att)
-            elif att in self.character.working_memory.wm: # TODO
-                att_val = self.character.working_memory.get(att)   
-            else:
-                raise  AssertionError(f'Missing attribute: {att} . Current prompt: {self.prompt_type}')
-            try:
-                base_prompt = base_prompt.replace('{'+att+'}', str(att_val))
-            except:
-                traceback.print_exc()
-                if os.getenv('DEBUG'):
-                    __import__('ipdb').set_trace()
-                pass        
-        
+        values = fit_to_budget(self, template, att_dict)
+        base_prompt = template.render(values.__getitem__)
         
         base_prompt = base_prompt.replace('TERMINATE','') # in case that interaction history has 'TERMINATE'. TODO: make it more elegant
+        self.last_render = (template, values, base_prompt) # lets the decision batcher share the template among characters
         if self.warning_added:
             base_prompt = base_prompt + ' '.join(self.waring_message)
         return base_prompt
+
+
+def fit_to_budget(prompt, template, att_dict) -> dict:
+    '''
+    values of the placeholders, with the memory sections cut to the token budget of the prompt type
+    '''
+    values = {att: resolve_attribute(prompt, att_dict, att) for att in template.attributes}
+    context_assembler = get_context_assembler()
+    if context_assembler is not None:
+        values = context_assembler.fit(prompt.prompt_type, template, values)
+    return values
+
+
+def resolve_attribute(prompt, att_dict, att):
+    if att in att_dict:
+        return att_dict[att]
+    elif hasattr(prompt, att):
+        return getattr(prompt, att)
+    elif hasattr(prompt.character, att):
+        return getattr(prompt.character, att)
+    elif att in prompt.character.working_memory.wm: # TODO
+        return prompt.character.working_memory.retrieve_by_name(att)
+    raise AssertionError(f'Missing attribute: {att} . Current prompt: {prompt.prompt_type}')
         
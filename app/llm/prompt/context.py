@@ -0,0 +1,203 @@
+import json
+import re
+import threading
+from collections import defaultdict, deque
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception: # not installed, or the encoding can not be loaded offline
+    print('tiktoken is not available, prompt tokens are estimated from the text length')
+    _encoding = None
+
+_WORD = re.compile(r'[a-zA-Z0-9_]{3,}')
+
+
+@lru_cache(maxsize=65536)
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def to_text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+
+
+class _Index(int):
+    '''
+    position in a list, to tell list entries from dict keys that are ints
+    '''
+
+
+class Snippet:
+    '''
+    one memory entry of a section: section[key][index] = value, or section[key] = value when it is not a list
+    '''
+    __slots__ = ('path', 'value', 'tokens', 'score')
+
+    def __init__(self, path: tuple, value: Any, tokens: int, score: float):
+        self.path = path
+        self.value = value
+        self.tokens = tokens
+        self.score = score
+
+
+def split_snippets(section: Any) -> List[Tuple[tuple, Any, float]]:
+    '''
+    (path, value, recency) of the entries of a section, a later entry of a list is more recent.
+    long-term memory is {category: {name: [entries]}}, building descriptions are {name: description}
+    '''
+    snippets = []
+    if isinstance(section, dict):
+        for key, value in section.items():
+            for path, sub_value, recency in split_snippets(value):
+                snippets.append(((key,) + path, sub_value, recency))
+    elif isinstance(section, list) and section:
+        for i, value in enumerate(section):
+            snippets.append(((_Index(i),), value, (i + 1) / len(section)))
+    else:
+        snippets.append(((), section, 1.))
+    return snippets
+
+
+def join_snippets(snippets: List[Snippet]) -> Any:
+    '''
+    rebuild the nested structure of the kept snippets, given in their original order
+    '''
+    if len(snippets) == 1 and snippets[0].path == ():
+        return snippets[0].value
+    root: Dict = {}
+    for snippet in snippets:
+        node = root
+        for key in snippet.path[:-1]:
+            node = node.setdefault(key, {})
+        node[snippet.path[-1]] = snippet.value
+    return _lists_back(root)
+
+
+def _lists_back(node):
+    if isinstance(node, dict):
+        if node and all(isinstance(k, _Index) for k in node):
+            return [_lists_back(v) for v in node.values()]
+        return {k: _lists_back(v) for k, v in node.items()}
+    return node
+
+
+class ContextAssembler:
+    '''
+    fits the memory sections of a prompt (long-term memory, building descriptions, ...) into a token budget
+    per PromptType: the rest of the prompt is counted first, then the snippets of the sections are ranked by
+    relevance (their words or keys appearing in the rest of the prompt) and recency, and kept while they fit.
+    '''
+    def __init__(self, budgets: Dict[str, int] = None, default_budget: int = 3000, sections: List[str] = ('memory', 'buildings'),
+                 relevance_weight: float = 1., recency_weight: float = 0.5, history: int = 1000):
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.sections = tuple(sections)
+        self.relevance_weight = relevance_weight
+        self.recency_weight = recency_weight
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            'prompts': 0, 'over_budget': 0,
+            'snippets_included': 0, 'snippets_truncated': 0,
+            'tokens_included': 0, 'tokens_truncated': 0,
+            'prompt_tokens': deque(maxlen=history),
+        })
+
+    def budget_of(self, prompt_type) -> int:
+        return self.budgets.get(getattr(prompt_type, 'name', prompt_type), self.default_budget)
+
+    def _score(self, snippet_path: tuple, text: str, recency: float, query_words: set) -> float:
+        keys = {str(p).lower() for p in snippet_path if not isinstance(p, _Index)}
+        words = set(_WORD.findall(text.lower()))
+        relevance = (1. if keys & query_words else 0.) + (len(words & query_words) / len(words) if words else 0.)
+        return self.relevance_weight * relevance + self.recency_weight * recency
+
+    def fit(self, prompt_type, template, values: Dict[str, Any]) -> Dict[str, Any]:
+        '''
+        values: attribute -> value of the template, returns the values with the sections cut to the budget
+        '''
+        sections = [att for att in template.attributes if att in self.sections and values.get(att)]
+        fixed_texts = [to_text(v) for att, v in values.items() if att not in sections]
+        fixed_tokens = sum(count_tokens(f) for f in template.fragments) + sum(count_tokens(t) for t in fixed_texts)
+        if not sections:
+            self._record(prompt_type, fixed_tokens, [], [], over_budget=False)
+            return values
+
+        query_words = set(_WORD.findall(' '.join(fixed_texts).lower()))
+        candidates: Dict[str, List[Snippet]] = {}
+        for att in sections:
+            candidates[att] = []
+            for path, value, recency in split_snippets(values[att]):
+                text = to_text(value)
+                candidates[att].append(Snippet(path, value, count_tokens(text) + len(path), self._score(path, text, recency, query_words)))
+
+        remaining = self.budget_of(prompt_type) - fixed_tokens
+        ranked = sorted((s for snippets in candidates.values() for s in snippets), key=lambda s: s.score, reverse=True)
+        kept, dropped = set(), []
+        for snippet in ranked:
+            if snippet.tokens <= remaining:
+                kept.add(id(snippet))
+                remaining -= snippet.tokens
+            else:
+                dropped.append(snippet)
+
+        values = dict(values)
+        included = []
+        for att, snippets in candidates.items():
+            section_kept = [s for s in snippets if id(s) in kept]
+            included.extend(section_kept)
+            if len(section_kept) < len(snippets):
+                values[att] = join_snippets(section_kept) if section_kept else ''
+        self._record(prompt_type, fixed_tokens + sum(s.tokens for s in included), included, dropped,
+                     over_budget=fixed_tokens > self.budget_of(prompt_type))
+        return values
+
+    def _record(self, prompt_type, prompt_tokens: int, included: List[Snippet], dropped: List[Snippet], over_budget: bool):
+        with self._lock:
+            stats = self._stats[getattr(prompt_type, 'name', str(prompt_type))]
+            stats['prompts'] += 1
+            stats['over_budget'] += int(over_budget)
+            stats['snippets_included'] += len(included)
+            stats['snippets_truncated'] += len(dropped)
+            stats['tokens_included'] += sum(s.tokens for s in included)
+            stats['tokens_truncated'] += sum(s.tokens for s in dropped)
+            stats['prompt_tokens'].append(prompt_tokens)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for prompt_type, stats in self._stats.items():
+                sizes = sorted(stats['prompt_tokens'])
+                result[prompt_type] = {k: v for k, v in stats.items() if k != 'prompt_tokens'}
+                result[prompt_type].update({
+                    'budget': self.budget_of(prompt_type),
+                    'prompt_tokens_p50': sizes[len(sizes) // 2] if sizes else 0,
+                    'prompt_tokens_max': sizes[-1] if sizes else 0,
+                })
+            return result
+
+
+_context_assembler: ContextAssembler = None
+
+
+def get_context_assembler() -> Optional[ContextAssembler]:
+    '''
+    process-wide assembler configured by CommonConfig.prompt_token_budgets, None when the budgets are disabled
+    '''
+    global _context_assembler
+    from config.config_common import CommonConfig
+    if not CommonConfig.prompt_default_token_budget:
+        return None
+    if _context_assembler is None:
+        _context_assembler = ContextAssembler(budgets=CommonConfig.prompt_token_budgets,
+                                              default_budget=CommonConfig.prompt_default_token_budget,
+                                              sections=CommonConfig.prompt_budget_sections)
+    return _context_assembler
+
+
+def get_context_stats() -> Optional[Dict[str, Dict]]:
+    return _context_assembler.stats() if _context_assembler is not None else None
@@ -0,0 +1,143 @@
+import ast
+import inspect
+import os
+import re
+import textwrap
+import threading
+import traceback
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ...utils.log import LogManager
+
+SLOT_PATTERN = re.compile(r'\{([a-zA-Z_]+)\}')
+PROMPT_DIR = os.path.dirname(__file__)
+
+
+class PromptTemplate:
+    '''
+    a prompt parsed once into static fragments and placeholder slots:
+    text = fragments[0] + slot[0] + fragments[1] + slot[1] + ... + fragments[-1]
+    '''
+    def __init__(self, text: str, source: str = None):
+        parts = SLOT_PATTERN.split(text)
+        self.text = text
+        self.source = source
+        self.fragments: List[str] = parts[0::2]
+        self.slots: List[str] = parts[1::2]
+        self.attributes: Tuple[str, ...] = tuple(dict.fromkeys(self.slots)) # unique, in order of appearance
+
+    def render(self, resolve: Callable[[str], object]) -> str:
+        '''
+        resolve(attribute) -> value, each attribute is resolved once.
+        an attribute whose value can not be turned into a str keeps its placeholder
+        '''
+        values = {}
+        for att in self.attributes:
+            att_val = resolve(att)
+            try:
+                values[att] = str(att_val)
+            except Exception:
+                traceback.print_exc()
+                if os.getenv('DEBUG'):
+                    __import__('ipdb').set_trace()
+                values[att] = '{' + att + '}'
+        out = [self.fragments[0]]
+        for slot, fragment in zip(self.slots, self.fragments[1:]):
+            out.append(values[slot])
+            out.append(fragment)
+        return ''.join(out)
+
+
+class TemplateRegistry:
+    '''
+    compiled prompt templates. a prompt type with a .txt file next to the prompt classes uses the file,
+    which is compiled again only when its mtime changes, otherwise the PROMPT of the class is compiled once.
+    '''
+    def __init__(self, prompt_dir: str = PROMPT_DIR):
+        self.prompt_dir = prompt_dir
+        self._files: Dict[str, Tuple[float, PromptTemplate]] = {} # path -> (mtime, template)
+        self._texts: Dict[str, PromptTemplate] = {} # PROMPT of a class -> template
+        self._lock = threading.Lock()
+        self.compiled = 0
+        self.reloaded = 0
+
+    def path_of(self, prompt_type) -> str:
+        return os.path.join(self.prompt_dir, prompt_type.to_str() + '.txt')
+
+    def get(self, prompt_type, default_text: Optional[str] = None) -> PromptTemplate:
+        path = self.path_of(prompt_type) if prompt_type is not None else None
+        try:
+            mtime = os.stat(path).st_mtime if path is not None else None
+        except OSError:
+            mtime = None
+        if mtime is not None:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            with open(path, 'r', encoding='utf-8') as file:
+                template = PromptTemplate(file.read(), source=path)
+            with self._lock:
+                self.reloaded += int(cached is not None)
+                self.compiled += 1
+                self._files[path] = (mtime, template)
+            return template
+        if default_text is None:
+            raise AssertionError(f'No prompt for {prompt_type}: neither {path} nor a PROMPT')
+        template = self._texts.get(default_text)
+        if template is None:
+            with self._lock:
+                template = self._texts.setdefault(default_text, PromptTemplate(default_text, source=str(prompt_type)))
+                self.compiled += 1
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+            self._texts.clear()
+
+
+prompt_templates = TemplateRegistry()
+
+
+def create_prompt_arguments(prompt_class) -> Optional[Set[str]]:
+    '''
+    keyword arguments passed to format_attr in create_prompt, None when some are passed with **
+    '''
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(prompt_class.create_prompt)))
+    except (OSError, TypeError, SyntaxError):
+        return None
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'format_attr':
+            for keyword in node.keywords:
+                if keyword.arg is None:
+                    return None
+                names.add(keyword.arg)
+    return names
+
+
+def validate_prompt_templates(prompt_classes: Dict, character=None,
+                              base_attributes: Iterable[str] = ('buildings', 'memory')) -> Dict[str, List[str]]:
+    '''
+    compile the template of every registered prompt at startup and report the attributes that are neither
+    create_prompt arguments nor attributes of the prompt class or of the character, those have to be in the
+    working memory when the prompt is built. a template that can not be loaded raises here instead of at first use.
+    '''
+    unresolved = {}
+    for prompt_type, prompt_class in prompt_classes.items():
+        if not hasattr(prompt_type, 'to_str'):
+            continue
+        template = prompt_templates.get(prompt_type, getattr(prompt_class, 'PROMPT', None))
+        arguments = create_prompt_arguments(prompt_class)
+        known = set(base_attributes) | (arguments or set())
+        if character is not None:
+            known |= set(character.working_memory.serialize().keys())
+        missing = [att for att in template.attributes
+                   if att not in known and not hasattr(prompt_class, att) and not (character is not None and hasattr(character, att))]
+        if missing and arguments is not None:
+            unresolved[prompt_type.name] = missing
+            LogManager.log_warning(f"[PromptTemplates]: {prompt_type.name} uses {missing}, which are not create_prompt arguments "
+                                   f"nor attributes of the prompt or the character, they must be in the working memory")
+    LogManager.log_info(f"[PromptTemplates]: compiled {prompt_templates.compiled} prompt templates")
+    return unresolved
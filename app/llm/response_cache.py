@@ -0,0 +1,147 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class ResponseCache:
+    '''
+    exact-match cache of the llm completions, shared by all the characters and kept across runs.
+    key = sha256 of (model, system message, messages, temperature, response_format)
+    - memory tier: LRU of at most max_items responses
+    - disk tier: diskcache.Cache under disk_dir, written through on every put
+    entries older than ttl seconds are expired in both tiers (ttl=None keeps them until evicted).
+    every entry remembers how long the original call took, hits add it to saved_seconds.
+    '''
+    def __init__(self, max_items: int = 5000, disk_dir: Optional[str] = None, ttl: Optional[float] = None,
+                 disk_size_limit: int = 2 ** 30):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict() # key -> (response, latency, created_at)
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_dir is not None:
+            try:
+                from diskcache import Cache
+                self._disk = Cache(disk_dir, size_limit=disk_size_limit)
+            except ImportError:
+                print('diskcache is not installed, llm responses are cached in memory only')
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_seconds = 0.
+
+    @staticmethod
+    def key(model: str, system_message: List[Dict], messages: List[Dict], temperature=None, response_format=None) -> str:
+        payload = json.dumps([model, system_message, messages, temperature, response_format],
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, entry: tuple):
+        # called with the lock held
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[2]):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.saved_seconds += entry[1]
+                return entry[0]
+        entry = self._disk.get(key) if self._disk is not None else None
+        with self._lock:
+            if entry is None or self._expired(entry[2]):
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.saved_seconds += entry[1]
+            self._remember(key, entry)
+        return entry[0]
+
+    def put(self, key: str, response: Any, latency: float = 0.):
+        entry = (response, latency, time.time())
+        with self._lock:
+            self._remember(key, entry)
+        if self._disk is not None:
+            self._disk.set(key, entry, expire=self.ttl)
+
+    def discard(self, key: str):
+        '''
+        drop a response that turned out to be invalid, so the next identical prompt calls the llm again
+        '''
+        with self._lock:
+            self._memory.pop(key, None)
+        if self._disk is not None:
+            self._disk.delete(key)
+
+    def bypass(self):
+        self.bypassed += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.,
+            'saved_seconds': round(self.saved_seconds, 3),
+            'memory_items': len(self._memory),
+        }
+
+
+_response_cache: ResponseCache = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    '''
+    process-wide cache configured by CommonConfig.llm_cache_*, None when llm_cache_size is 0
+    '''
+    global _response_cache
+    from config.config_common import CommonConfig
+    if CommonConfig.llm_cache_size <= 0:
+        return None
+    if _response_cache is None:
+        _response_cache = ResponseCache(max_items=CommonConfig.llm_cache_size,
+                                        disk_dir=CommonConfig.llm_cache_dir,
+                                        ttl=CommonConfig.llm_cache_ttl)
+    return _response_cache
+
+
+class CachedReply(str):
+    '''
+    a reply text with the key it is cached under, discard_cached_reply evicts that entry when the reply is invalid
+    '''
+    cache_key: Optional[str] = None
+
+    @classmethod
+    def of(cls, text: str, cache_key: str) -> 'CachedReply':
+        reply = cls(text)
+        reply.cache_key = cache_key
+        return reply
+
+
+def is_cacheable(prompt_type) -> bool:
+    '''
+    only the prompt types listed in CommonConfig.llm_cache_prompt_types are served from the cache
+    '''
+    from config.config_common import CommonConfig
+    name = getattr(prompt_type, 'name', prompt_type)
+    return name in CommonConfig.llm_cache_prompt_types
+
+
+def get_response_cache_stats() -> Optional[Dict[str, float]]:
+    return _response_cache.stats() if _response_cache is not None else None
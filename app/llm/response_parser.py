@@ -0,0 +1,220 @@
+import ast
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_FENCE = re.compile(r'```(?:json|JSON)?\s*\n?(.*?)```', re.DOTALL)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_PY_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+TYPE_NAMES = {dict: 'object', list: 'array', str: 'string', int: 'integer', float: 'number', bool: 'boolean'}
+
+
+class ResponseError(ValueError):
+    '''
+    a reply that could not be turned into a dict of the expected structure, fragment is the offending part
+    '''
+    def __init__(self, msg: str, fragment: str = ''):
+        super().__init__(msg)
+        self.fragment = fragment
+
+
+def schema_from_example(example: Any, exempt_layers=(), layer: int = 0) -> Dict:
+    '''
+    json schema of the structure PromptAndResponse.have_same_structure checks:
+    every value keeps the type of the example, the keys of a dict at a checked layer are required,
+    the items of lists are not checked
+    '''
+    schema = {'type': TYPE_NAMES.get(type(example), 'string')}
+    if isinstance(example, dict) and layer not in exempt_layers:
+        schema['properties'] = {k: schema_from_example(v, exempt_layers, layer + 1) for k, v in example.items()}
+        schema['required'] = list(example.keys())
+    return schema
+
+
+def strip_fences(text: str) -> str:
+    match = _FENCE.search(text)
+    return match.group(1).strip() if match else text.strip()
+
+
+def outermost_object(text: str) -> str:
+    '''
+    the text from the first { to its matching }, ignoring braces inside strings
+    '''
+    start = text.find('{')
+    if start < 0:
+        return text
+    depth, quote, escaped = 0, None, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _requote(text: str) -> str:
+    '''
+    single quoted strings -> double quoted, python literals -> json literals, outside of strings only
+    '''
+    out, i, n = [], 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch in '"\'':
+            j, buf = i + 1, []
+            while j < n and text[j] != ch:
+                if text[j] == '\\' and j + 1 < n:
+                    buf.append(text[j:j + 2])
+                    j += 2
+                    continue
+                buf.append('\\"' if text[j] == '"' else text[j])
+                j += 1
+            body = ''.join(buf)
+            if ch == "'":
+                body = body.replace("\\'", "'")
+            out.append('"' + body + '"')
+            i = j + 1
+            continue
+        match = re.match(r'True|False|None', text[i:])
+        if match and (i == 0 or not text[i - 1].isalnum()):
+            out.append(_PY_LITERALS[match.group(0)])
+            i += len(match.group(0))
+            continue
+        out.append(ch)
+        i += 1
+    return ''.join(out)
+
+
+def load_json(text: str) -> Tuple[Any, bool]:
+    '''
+    (value, repaired). Tries strict json first, then the local repairs: markdown fences, text around the object,
+    trailing commas, single quotes and python literals, and finally python literal syntax (never eval)
+    '''
+    try:
+        return json.loads(text), False
+    except (TypeError, ValueError):
+        pass
+    candidate = outermost_object(strip_fences(text))
+    for fix in (lambda t: t, lambda t: _TRAILING_COMMA.sub(r'\1', t), lambda t: _TRAILING_COMMA.sub(r'\1', _requote(t))):
+        try:
+            return json.loads(fix(candidate)), True
+        except ValueError:
+            continue
+    try:
+        return ast.literal_eval(candidate), True
+    except (ValueError, SyntaxError):
+        raise ResponseError('Must return a formal json dict! Recheck the dict format', fragment=candidate[:500])
+
+
+def validate(value: Any, schema: Dict, path: str = '$') -> Optional[ResponseError]:
+    expected = schema.get('type')
+    actual = TYPE_NAMES.get(type(value))
+    if expected and actual != expected:
+        return ResponseError(f'the type of {path} should be {expected}, got {actual}', fragment=json.dumps(value, ensure_ascii=False, default=str)[:500])
+    if expected == 'object':
+        missing = [k for k in schema.get('required', []) if k not in value]
+        if missing:
+            return ResponseError(f'{path} must contain all the following keys: {schema["required"]}, missing {missing}',
+                                 fragment=json.dumps(value, ensure_ascii=False, default=str)[:500])
+        for k, sub in schema.get('properties', {}).items():
+            error = validate(value[k], sub, f'{path}.{k}')
+            if error:
+                return error
+    return None
+
+
+class ResponseParser:
+    '''
+    compiled from the EXAMPLE of a prompt: parse() returns the reply as a dict or raises ResponseError,
+    repair_message() is the short message sent instead of the whole prompt when the reply can not be repaired locally
+    '''
+    def __init__(self, example: Any, exempt_layers=()):
+        if isinstance(example, str):
+            example = json.loads(example)
+        self.example = example
+        self.schema = schema_from_example(example, tuple(exempt_layers)) if example is not None else None
+
+    def parse(self, text) -> Tuple[Dict, bool]:
+        '''
+        (dict, locally repaired)
+        '''
+        value, repaired = (text, False) if isinstance(text, dict) else load_json(text)
+        if not isinstance(value, dict):
+            raise ResponseError('Must return a json dict', fragment=str(text)[:500])
+        if self.schema is not None:
+            error = validate(value, self.schema)
+            if error:
+                raise error
+        return value, repaired
+
+    def response_format(self, name: str = 'response') -> Optional[Dict]:
+        if self.schema is None:
+            return None
+        return {'type': 'json_schema', 'json_schema': {'name': name, 'schema': self.schema}}
+
+    def repair_message(self, error: ResponseError) -> str:
+        schema = json.dumps(self.schema, ensure_ascii=False) if self.schema else 'a json dict'
+        # sent after the prompt and the invalid reply, which stay in the chat history
+        return (f'Your previous reply could not be used: {error}.\n'
+                f'Return only the corrected json dict, keeping your content, that matches this json schema:\n{schema}')
+
+
+class ParserStats:
+    def __init__(self):
+        self.parsed = 0
+        self.locally_repaired = 0
+        self.repair_retries = 0
+        self.failures = 0
+        self.tokens_saved = 0.
+
+    def record(self, repaired: bool):
+        self.parsed += 1
+        self.locally_repaired += int(repaired)
+
+    def record_retry(self, full_retry_tokens: float, repair_tokens: float):
+        '''
+        a repair-only retry, compared with re-sending the whole prompt with the error appended
+        '''
+        self.repair_retries += 1
+        self.tokens_saved += max(0., full_retry_tokens - repair_tokens)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'parsed': self.parsed,
+            'locally_repaired': self.locally_repaired,
+            'repair_retries': self.repair_retries,
+            'retry_rate': self.repair_retries / self.parsed if self.parsed else 0.,
+            'failures': self.failures,
+            'tokens_saved': round(self.tokens_saved),
+        }
+
+
+parser_stats = ParserStats()
+_parsers: Dict[Tuple[str, Tuple[int, ...]], ResponseParser] = {}
+
+
+def get_parser_stats() -> Dict[str, float]:
+    return parser_stats.stats()
+
+
+def get_response_parser(example: Any, exempt_layers: List[int] = ()) -> ResponseParser:
+    '''
+    parsers are compiled once per (EXAMPLE, exempt layers)
+    '''
+    example_key = example if isinstance(example, str) else json.dumps(example, sort_keys=True, default=str)
+    key = (example_key, tuple(exempt_layers))
+    if key not in _parsers:
+        _parsers[key] = ResponseParser(example, exempt_layers)
+    return _parsers[key]
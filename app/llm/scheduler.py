@@ -0,0 +1,187 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..utils.log import LogManager
+
+
+class LLMDeadlineExceeded(asyncio.TimeoutError):
+    pass
+
+
+_current_job: contextvars.ContextVar = contextvars.ContextVar('current_llm_job', default=None)
+
+
+class LLMJob:
+    def __init__(self, factory: Callable[[], Awaitable], priority: int, deadline: float, owner: Any,
+                 label: str, future: asyncio.Future, prompt_type=None):
+        self.factory = factory
+        self.priority = priority
+        self.deadline = deadline
+        self.owner = owner
+        self.label = label
+        self.prompt_type = prompt_type
+        self.future = future
+        self.submitted = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+
+class LLMScheduler:
+    '''
+    every llm call of the simulation goes through one scheduler:
+    - at most max_concurrency calls run at the same time, the others wait in a priority queue
+    - the queue is ordered by (priority, deadline, arrival), a lower priority value runs first
+    - a queued call whose deadline passed fails with LLMDeadlineExceeded instead of being sent
+    - cancel_owner(state) cancels the queued and running calls of a state that exits
+    submit() returns an asyncio.Future, which the states use like the task they used to create.
+    '''
+    def __init__(self, max_concurrency: int = 16, priorities: Dict[str, int] = None, default_priority: int = 2,
+                 deadlines: Dict[str, float] = None, history: int = 1000):
+        self.max_concurrency = max_concurrency
+        self.priorities = priorities or {}
+        self.default_priority = default_priority
+        self.deadlines = deadlines or {}
+        self._queue = []
+        self._seq = itertools.count()
+        self._owners: Dict[int, set] = defaultdict(set) # id(owner) -> jobs
+        self.running = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.wait_times: Dict[int, deque] = defaultdict(lambda: deque(maxlen=history)) # priority -> seconds queued
+
+    def priority_of(self, prompt_type) -> int:
+        return self.priorities.get(getattr(prompt_type, 'name', prompt_type), self.default_priority)
+
+    def submit(self, factory: Callable[[], Awaitable], prompt_type=None, priority: int = None,
+               timeout: float = None, owner: Any = None) -> asyncio.Future:
+        '''
+        factory: builds the coroutine once the call is scheduled, e.g. lambda: character.a_process_then_reply(...)
+        timeout: seconds the call may wait in the queue, defaults to the deadline of its prompt type
+        '''
+        loop = asyncio.get_running_loop()
+        if priority is None:
+            priority = self.priority_of(prompt_type)
+        if timeout is None:
+            timeout = self.deadlines.get(getattr(prompt_type, 'name', prompt_type))
+        deadline = time.monotonic() + timeout if timeout is not None else math.inf
+        job = LLMJob(factory, priority, deadline, owner, getattr(prompt_type, 'name', str(prompt_type)), loop.create_future(),
+                     prompt_type=prompt_type)
+        job.future.add_done_callback(lambda future, job=job: self._on_future_done(job))
+        if owner is not None:
+            self._owners[id(owner)].add(job)
+        heapq.heappush(self._queue, (priority, deadline, next(self._seq), job))
+        self.submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        self._dispatch()
+        return job.future
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._queue and self.running < self.max_concurrency:
+            priority, deadline, _, job = heapq.heappop(self._queue)
+            if job.future.done(): # cancelled while queued
+                continue
+            if deadline < now:
+                self.expired += 1
+                job.future.set_exception(LLMDeadlineExceeded(f'{job.label} waited {now - job.submitted:.1f}s in the llm queue'))
+                continue
+            self.wait_times[priority].append(now - job.submitted)
+            self.running += 1
+            # the coroutine, and the reply threads it starts with asyncio.to_thread, see current_llm_job()
+            context = contextvars.copy_context()
+            context.run(_current_job.set, job)
+            job.task = context.run(asyncio.get_running_loop().create_task, job.factory())
+            job.task.add_done_callback(lambda task, job=job: self._on_task_done(job, task))
+
+    def _on_task_done(self, job: LLMJob, task: asyncio.Task):
+        self.running -= 1
+        if not job.future.done():
+            if task.cancelled():
+                job.future.cancel()
+            elif task.exception() is not None:
+                self.failed += 1
+                job.future.set_exception(task.exception())
+            else:
+                self.completed += 1
+                job.future.set_result(task.result())
+        self._dispatch()
+
+    def _on_future_done(self, job: LLMJob):
+        if job.owner is not None:
+            jobs = self._owners.get(id(job.owner))
+            if jobs is not None:
+                jobs.discard(job)
+                if not jobs:
+                    del self._owners[id(job.owner)]
+        if job.future.cancelled():
+            self.cancelled += 1
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+
+    def cancel_owner(self, owner: Any) -> int:
+        '''
+        cancel the pending calls of owner, returns how many were cancelled
+        '''
+        jobs = list(self._owners.get(id(owner), ()))
+        for job in jobs:
+            job.future.cancel()
+        return len(jobs)
+
+    def queue_depth(self) -> int:
+        return sum(1 for *_, job in self._queue if not job.future.done())
+
+    def stats(self) -> Dict[str, Any]:
+        waits = {}
+        for priority, times in sorted(self.wait_times.items()):
+            ordered = sorted(times)
+            waits[priority] = {
+                'p50': round(ordered[len(ordered) // 2], 3),
+                'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                'max': round(ordered[-1], 3),
+            } if ordered else {}
+        return {
+            'running': self.running,
+            'queue_depth': self.queue_depth(),
+            'max_queue_depth': self.max_queue_depth,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'expired': self.expired,
+            'wait_seconds_by_priority': waits,
+        }
+
+
+_llm_scheduler: LLMScheduler = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    '''
+    process-wide scheduler configured by CommonConfig.llm_max_concurrency / llm_priorities / llm_deadlines
+    '''
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        from config.config_common import CommonConfig
+        _llm_scheduler = LLMScheduler(max_concurrency=CommonConfig.llm_max_concurrency,
+                                      priorities=CommonConfig.llm_priorities,
+                                      default_priority=CommonConfig.llm_default_priority,
+                                      deadlines=CommonConfig.llm_deadlines)
+        LogManager.log_info(f"[LLMScheduler]: max concurrency {_llm_scheduler.max_concurrency}")
+    return _llm_scheduler
+
+
+def current_llm_job() -> Optional[LLMJob]:
+    '''
+    the job whose call is running in this task or reply thread, None outside the scheduler.
+    its prompt_type and owner tell which call a reply belongs to, the state of the agent may have changed meanwhile
+    '''
+    return _current_job.get()
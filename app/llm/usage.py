@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..utils.log import LogManager
+
+DIMENSIONS = ('character', 'state', 'prompt_type', 'model')
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _name(value) -> Optional[str]:
+    if value is None:
+        return None
+    return getattr(value, 'name', None) or str(value)
+
+
+class UsageSeries:
+    '''
+    the calls of one (character, state, prompt_type, model): running totals and a ring buffer of the last calls
+    '''
+    def __init__(self, window: int):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.seconds = 0.
+        self.recent: deque = deque(maxlen=window) # (latency, prompt tokens, completion tokens)
+
+    def add(self, latency: float, prompt_tokens: int, completion_tokens: int, error: bool):
+        self.calls += 1
+        self.errors += int(error)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.seconds += latency
+        self.recent.append((latency, prompt_tokens, completion_tokens))
+
+
+class LLMUsage:
+    '''
+    token usage and latency of every llm response, keyed by (character, CharacterState, PromptType, model).
+    totals are exact, percentiles are computed on the last `window` calls of each key.
+    query() aggregates any subset of the dimensions, write_summary() dumps the per-state view to a json file.
+    '''
+    def __init__(self, window: int = 1000, summary_path: Optional[str] = None, summary_interval: float = 60.):
+        self.window = window
+        self.summary_path = summary_path
+        self.summary_interval = summary_interval
+        self._series: Dict[Tuple[str, str, str, str], UsageSeries] = {}
+        self._lock = threading.Lock()
+        self._last_summary = time.monotonic()
+
+    def record(self, character, state, prompt_type, model, latency: float, prompt_tokens: int = 0,
+               completion_tokens: int = 0, error: bool = False):
+        '''
+        called from the reply threads of the agents
+        '''
+        key = (_name(character), _name(state), _name(prompt_type), _name(model))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = UsageSeries(self.window)
+            series.add(latency, prompt_tokens, completion_tokens, error)
+
+    def query(self, group_by: Iterable[str] = ('state',), top: Optional[int] = None, **filters) -> List[Dict]:
+        '''
+        group_by: subset of character / state / prompt_type / model
+        filters: e.g. character='Alice', state='DRAW', values are compared with the recorded names
+        rows are sorted by total tokens, the heaviest first
+        '''
+        group_by = tuple(group_by)
+        unknown = set(group_by) - set(DIMENSIONS) or set(filters) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f'unknown dimensions {unknown}, expected some of {DIMENSIONS}')
+        filters = {k: _name(v) for k, v in filters.items() if v is not None}
+        groups: Dict[tuple, List[UsageSeries]] = {}
+        with self._lock:
+            for key, series in self._series.items():
+                named = dict(zip(DIMENSIONS, key))
+                if any(named[k] != v for k, v in filters.items()):
+                    continue
+                groups.setdefault(tuple(named[d] for d in group_by), []).append(series)
+            rows = [self._aggregate(dict(zip(group_by, group)), members) for group, members in groups.items()]
+        rows.sort(key=lambda row: row['total_tokens'], reverse=True)
+        return rows[:top] if top else rows
+
+    @staticmethod
+    def _aggregate(row: Dict, members: List[UsageSeries]) -> Dict:
+        calls = sum(s.calls for s in members)
+        prompt_tokens = sum(s.prompt_tokens for s in members)
+        completion_tokens = sum(s.completion_tokens for s in members)
+        seconds = sum(s.seconds for s in members)
+        recent = [r for s in members for r in s.recent]
+        latencies = sorted(r[0] for r in recent)
+        tokens = sorted(r[1] + r[2] for r in recent)
+        row.update({
+            'calls': calls,
+            'errors': sum(s.errors for s in members),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'seconds': round(seconds, 3),
+            'latency_p50': round(percentile(latencies, 0.5), 3),
+            'latency_p95': round(percentile(latencies, 0.95), 3),
+            'latency_p99': round(percentile(latencies, 0.99), 3),
+            'tokens_p50': percentile(tokens, 0.5),
+            'tokens_p95': percentile(tokens, 0.95),
+        })
+        return row
+
+    def summary(self) -> Dict:
+        return {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'total': (self.query(group_by=()) or [{}])[0],
+            'by_state': self.query(group_by=('state',)),
+            'by_prompt_type': self.query(group_by=('prompt_type',)),
+            'by_model': self.query(group_by=('model',)),
+            'by_character': self.query(group_by=('character',), top=20),
+        }
+
+    def write_summary(self, path: Optional[str] = None):
+        path = path or self.summary_path
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+        self._last_summary = time.monotonic()
+
+    def maybe_write_summary(self):
+        '''
+        called every tick, writes the summary file every summary_interval seconds
+        '''
+        if self.summary_path is not None and time.monotonic() - self._last_summary >= self.summary_interval:
+            try:
+                self.write_summary()
+            except OSError as e:
+                LogManager.log_warning(f"[LLMUsage]: can not write the usage summary, {e}")
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+_llm_usage: LLMUsage = None
+
+
+def get_llm_usage() -> LLMUsage:
+    '''
+    process-wide usage table configured by CommonConfig.llm_usage_*
+    '''
+    global _llm_usage
+    if _llm_usage is None:
+        from config.config_common import CommonConfig
+        summary_path = CommonConfig.llm_usage_summary_file
+        if summary_path is not None and not os.path.isabs(summary_path):
+            summary_path = os.path.join(LogManager.log_directory, summary_path)
+        _llm_usage = LLMUsage(window=CommonConfig.llm_usage_window, summary_path=summary_path,
+                              summary_interval=CommonConfig.llm_usage_summary_interval)
+    return _llm_usage
+
+
+def usage_of(response) -> Tuple[int, int]:
+    '''
+    (prompt tokens, completion tokens) of an openai ChatCompletion, (0, 0) when the response has no usage
+    '''
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return 0, 0
+    return getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0
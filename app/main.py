@@ -34,7 +34,7 @@ def setup_proxy():
 async def periodic_update(service):
     while True:
         start_time = time.monotonic()
-        service.update_state()
+        await service.update_state()
         elapsed = time.monotonic() - start_time
         wait_time = max(config.update_interval - elapsed, 0)
         if os.getenv("FAST"):
@@ -1,15 +1,40 @@
 import asyncio
 import copy
+import functools
 import inspect
 import json
+import time
 from typing import Callable, Dict, List, Literal, Union, Optional, Any
 from autogen import ConversableAgent, Agent, OpenAIWrapper, AssistantAgent
 
+from app.llm.key_router import estimate_tokens, get_key_router
+from app.llm.response_cache import CachedReply, get_response_cache, is_cacheable
+from app.llm.response_parser import get_response_parser
+from app.llm.scheduler import current_llm_job
+from app.llm.usage import get_llm_usage, usage_of
+from app.models.conversation import get_conversation_store
 from app.repository.artwork_repo import check_artwork_belonging
 from app.repository.utils import check_balance_and_trade
 from app.utils.gameserver_utils import add_msg_to_send_to_game_server
 # from app.models.trader_agent import Trader
 
+class _RecordingClient:
+    '''
+    forwards to an OpenAIWrapper and keeps the raw responses of create(), which carry the token usage
+    '''
+    def __init__(self, client: OpenAIWrapper):
+        self._client = client
+        self.responses = []
+
+    def create(self, **kwargs):
+        response = self._client.create(**kwargs)
+        self.responses.append(response)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
 class SimsAgent(AssistantAgent):
     def __init__(self,
             name: str,
@@ -41,6 +66,9 @@ class SimsAgent(AssistantAgent):
         self.register_hook('process_message_before_send', self.push_reply_to_game_server)
         self.register_reply([Agent, None], SimsAgent.func_router)
         self.subsitute_reply(SimsAgent.generate_oai_reply) 
+        self.subsitute_reply(SimsAgent.a_generate_oai_reply)
+        self._ignore_async_func_in_sync_chat_list = [SimsAgent.a_generate_oai_reply if f.__name__ == 'a_generate_oai_reply' else f
+                                                     for f in self._ignore_async_func_in_sync_chat_list]
         self.callable_tools = [self.handle_purchase_request]
     
     def subsitute_reply(self, new_func):
@@ -52,6 +80,21 @@ class SimsAgent(AssistantAgent):
             if reply_func.__name__ == new_func.__name__:
                 reply_func_tuple.update({"reply_func": new_func})
                 
+    def _append_oai_message(self, message: Union[Dict, str], role, conversation_id: Agent, *args, **kwargs) -> bool:
+        '''
+        the conversations with other agents are kept bounded: the sent turns go to the shared conversation store,
+        and the history of the pair is trimmed to the last turns plus the summary of the older ones
+        '''
+        appended = super()._append_oai_message(message, role, conversation_id, *args, **kwargs)
+        if not appended or conversation_id is self or not hasattr(conversation_id, 'name'):
+            return appended
+        store = get_conversation_store()
+        messages = self._oai_messages[conversation_id]
+        if role == 'assistant':
+            store.record(self, conversation_id.name, messages[-1])
+        store.bound(messages, self.name, conversation_id.name)
+        return appended
+
     def update_system_message(self, system_message: str) -> None:
         return super().update_system_message(system_message)
      
@@ -200,12 +243,145 @@ class SimsAgent(AssistantAgent):
             return False, None
         if messages is None:
             messages = self._oai_messages[sender]
-        extracted_response = self._generate_oai_reply_from_client(
-            client, self._oai_system_message + messages, self.client_cache
-        )
+        cache, cache_key = self.response_cache_lookup(client, messages, self.call_prompt_type())
+        if cache_key is not None:
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                return True, CachedReply.of(cached_response, cache_key)
+        start = time.perf_counter()
+        extracted_response = self.routed_reply_from_client(client, messages)
+        if extracted_response is None:
+            return False, None
         if extracted_response.startswith(' ```json') and extracted_response.endswith('```'):
             extracted_response = extracted_response[8:-3]
-        return (False, None) if extracted_response is None else (True, extracted_response)
+        if cache_key is not None:
+            cache.put(cache_key, extracted_response, latency=time.perf_counter() - start)
+            return True, CachedReply.of(extracted_response, cache_key)
+        return True, extracted_response
+
+    async def a_generate_oai_reply(self, messages: Optional[List[Dict]] = None, sender: Optional[Agent] = None,
+                                   config: Optional['OpenAIWrapper'] = None):
+        '''
+        ConversableAgent.a_generate_oai_reply with the reply thread in the context of the caller,
+        so the thread sees the scheduler job of the call, see call_prompt_type
+        '''
+        return await asyncio.to_thread(functools.partial(self.generate_oai_reply, messages=messages, sender=sender, config=config))
+
+    def call_prompt_type(self):
+        '''
+        the PromptType of the llm call being made: the one it was submitted with to the scheduler,
+        the prompt type of the current state for the calls made outside the scheduler
+        '''
+        job = current_llm_job()
+        if job is not None and job.prompt_type is not None:
+            return job.prompt_type
+        return getattr(getattr(self, 'state', None), 'prompt_type', None)
+
+    def call_state_name(self):
+        '''
+        the state that issued the llm call being made: the owner of its scheduler job (None for the monologue,
+        the summaries and the batches), the current state for the calls made outside the scheduler
+        '''
+        job = current_llm_job()
+        if job is not None:
+            return getattr(job.owner, 'state_name', None)
+        return getattr(getattr(self, 'state', None), 'state_name', None)
+
+    def routed_reply_from_client(self, client: 'OpenAIWrapper', messages: List[Dict], max_attempts: int = 3, structured: bool = True,
+                                 system_message: Optional[List[Dict]] = None, usage_shares: Optional[List[tuple]] = None):
+        '''
+        when the key router knows the tag of the state client, the request is sent with the key it picks
+        (any agent's key of the same pool, or the other pool on failover), otherwise with the agent's own client.
+        structured=False does not constrain the reply to the schema of the current prompt, e.g. for batched calls
+        system_message: sent instead of the agent's own, e.g. a neutral one for a batch of several characters
+        usage_shares: [(character name, state name)] the usage is split between, see _generate_oai_reply_from_client
+        '''
+        router = get_key_router()
+        tag = getattr(getattr(self, 'state', None), 'default_client', None)
+        all_messages = (self._oai_system_message if system_message is None else system_message) + messages
+        if router is None or not router.routes(tag):
+            return self._generate_oai_reply_from_client(client, all_messages, self.client_cache, usage_shares=usage_shares)
+        est_tokens = estimate_tokens(all_messages)
+        response_format = self.structured_output_format(router.model_of(tag)) if structured else None
+        for attempt in range(max_attempts):
+            lease = router.acquire(tag, est_tokens, response_format=response_format)
+            try:
+                extracted_response = self._generate_oai_reply_from_client(lease.client, copy.deepcopy(all_messages), self.client_cache,
+                                                                          usage_shares=usage_shares)
+            except Exception as e:
+                router.release(lease, error=e)
+                if attempt == max_attempts - 1:
+                    raise
+                continue
+            router.release(lease, used_tokens=est_tokens + len(str(extracted_response or '')) / 4.)
+            return extracted_response
+
+    def structured_output_format(self, model: str) -> Optional[Dict]:
+        '''
+        json_schema response_format compiled from the example of the current prompt,
+        only for the models of CommonConfig.llm_structured_output_models, the others keep json_object
+        '''
+        from config.config_common import CommonConfig
+        prompt_and_response = getattr(self, 'prompt_and_response', None)
+        if model not in CommonConfig.llm_structured_output_models or prompt_and_response is None:
+            return None
+        state = getattr(self, 'state', None)
+        try:
+            parser = get_response_parser(prompt_and_response.latest_prompt_example,
+                                         getattr(getattr(state, 'prompt_class', None), 'check_exempt_layers', [1,2,3,4,5,6,7,8,9,10]))
+        except ValueError:
+            return None
+        return parser.response_format(getattr(getattr(state, 'prompt_type', None), 'name', 'response').lower())
+
+    def _generate_oai_reply_from_client(self, llm_client, messages, cache, usage_shares: Optional[List[tuple]] = None):
+        '''
+        records the tokens and the latency of the call by character, state, prompt type and model.
+        usage_shares: [(character name, state name)] of a call made for several characters, each is recorded
+        with its share of the tokens instead of the whole call under this agent
+        '''
+        recording_client = _RecordingClient(llm_client)
+        state_name, prompt_type = self.call_state_name(), self.call_prompt_type()
+        start = time.perf_counter()
+        error = None
+        try:
+            return super()._generate_oai_reply_from_client(recording_client, messages, cache)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            response = recording_client.responses[-1] if recording_client.responses else None
+            model = getattr(response, 'model', None) or (getattr(llm_client, '_config_list', None) or [{}])[0].get('model')
+            latency, (prompt_tokens, completion_tokens) = time.perf_counter() - start, usage_of(response)
+            shares = usage_shares or [(self.name, state_name)]
+            if len(shares) > 1:
+                prompt_tokens, completion_tokens = prompt_tokens / len(shares), completion_tokens / len(shares)
+            for character, share_state in shares:
+                get_llm_usage().record(character, share_state, prompt_type, model, latency, prompt_tokens,
+                                       completion_tokens, error=error is not None)
+
+    def response_cache_lookup(self, client: 'OpenAIWrapper', messages: List[Dict], prompt_type=None):
+        '''
+        (cache, key) when the prompt type of the call opted in the response cache, (cache, None) otherwise
+        '''
+        cache = get_response_cache()
+        if cache is None:
+            return None, None
+        if not is_cacheable(prompt_type):
+            cache.bypass()
+            return cache, None
+        config_list = getattr(client, '_config_list', None) or [{}]
+        cfg = {**(self.llm_config or {}), **config_list[0]}
+        return cache, cache.key(cfg.get('model'), self._oai_system_message, messages,
+                                cfg.get('temperature'), cfg.get('response_format'))
+
+    def discard_cached_reply(self, reply):
+        '''
+        called when a reply failed the checks, the same prompt should reach the llm next time
+        '''
+        key = getattr(reply, 'cache_key', None)
+        cache = get_response_cache()
+        if key is not None and cache is not None:
+            cache.discard(key)
     
    
      
@@ -16,7 +16,6 @@ from datetime import datetime, timedelta
 from autogen import ConversableAgent, AssistantAgent, UserProxyAgent, config_list_from_json, Agent
 from autogen.agentchat.contrib.multimodal_conversable_agent import MultimodalConversableAgent
 from autogen import config_list_from_json, filter_config
-from langchain_openai import OpenAIEmbeddings
 from autogen.oai import OpenAIWrapper
 
 from app.models.base_agent import SimsAgent
@@ -25,17 +24,23 @@ from app.repository.artwork_repo import check_artwork_belonging, get_artwork_fro
 from app.repository.trade_repo import add_trade_to_db
 from app.database.orm.trade_record import trade_type_dict
 from app.repository.utils import check_balance_and_trade
-from app.utils.load_oai_config import plug_api_to_cfg, register_callback
+from app.llm.key_router import estimate_tokens, register_agent
+from app.llm.response_parser import ResponseError, ResponseParser, get_response_parser, parser_stats
+from app.utils.load_oai_config import plug_api_to_cfg
 from config import cfg_tmplt
 
+from .conversation import get_conversation_store
 from .data_store import Memory, WorkingMemory
 from .emotion import Emotion
 from .preference_model import ArtTaste
 from .internal_dialogue import InnerMonologue
 from ..constants import CharacterState, PromptType
+from ..global_config import VECTOR_STORE
+from ..llm.embedding_service import get_embedding_service
 from ..utils.log import LogManager
 from ..utils.gameserver_utils import add_msg_to_send_to_game_server
 from ..utils.serialization import serialize
+from ..utils.spatial_index import UniformGrid
 from ..models.location import Building, Job
 from ..models.scheduler import Agenda, Schedule, Task
 from .dalle_agent import DALLEAgent
@@ -94,13 +99,14 @@ Please notice that:
         
         self.x = x
         self.y = y
+        self._index_listeners = [] # callbacks of the CharacterList indexes, called when the position or building changes
         self.date_num = 0
         self.save_dir = f'{save_dir}/{name}'
         self.state:'BaseState' = None
         self.hang_states = deque(maxlen=3)
         
         self.longterm_memory = Memory(character_id=self.guid, character_name=name, \
-                                      embeddings = OpenAIEmbeddings(model="text-embedding-3-large") if os.environ.get('Milvus') else None) 
+                                      embeddings = get_embedding_service() if VECTOR_STORE else None) 
         self.in_building:Building  = in_building
         self.Schedule = Schedule()
         
@@ -118,7 +124,7 @@ Please notice that:
         self.prompt_and_response = PromptAndResponse(character_name=name, character_id=self.guid)
         
         #  ==== load llm_cfg for character ===== # TODO: wrap it into a function in utils
-        register_callback(llm_cfg, guid=self.guid, prefix=f'character_{name}')
+        register_agent(llm_cfg, guid=self.guid, prefix=f'character_{name}')
         config_list = plug_api_to_cfg(cfg_tmplt, **llm_cfg) 
         oai_config_list = filter_config(config_list=config_list,
                         filter_dict={
@@ -213,6 +219,11 @@ Please notice that:
     def change_pos(self, x, y):
         self.x = x
         self.y = y
+        self._notify_index()
+
+    def _notify_index(self):
+        for listener in self._index_listeners:
+            listener(self)
     
     def change_job(self, job:Job):
         assert self.in_building is not None, 'The character is not in a building. To have a job, the character should be in a building.'
@@ -300,6 +311,7 @@ Please notice that:
     
     def change_building(self,  building:Building ):
         self.in_building = building
+        self._notify_index()
         
     def set_Schedule(self, Schedule_details):
         Schedule_ls = list(Schedule_details['Steps'].values())
@@ -383,14 +395,7 @@ Please notice that:
 
     def impression_based_on_chat(self, act_obj:str):
         # for affectiveness, the impression is based on the chat history
-        obj_agent, value = None, 0   
-        for agent in self._oai_messages.keys():
-            if agent.name == act_obj:
-                obj_agent = agent
-                break
-        if obj_agent:
-            value = len(self._oai_messages[obj_agent])
-        return value
+        return get_conversation_store().turn_count(self.name, act_obj)
 
     def estimate_artwork_price(self, artwork_id):
         '''
@@ -469,39 +474,44 @@ Please notice that:
     #         raise ValueError(f"message is not in the proper format {message}")
             
    
-    def process_then_reply(self, message, sender: Agent, restart=True, silent=True, check_exempt_layers=[1,2,3,4,5,6,7,8,9,10] ):
+    def process_then_reply(self, message, sender: Agent, restart=True, silent=True, restart_times=0, check_exempt_layers=[1,2,3,4,5,6,7,8,9,10] ):
         # modified from ConversableAgent.receive(), for debug purpose
         self._prepare_chat(self,clear_history=restart)
         self._process_received_message(message, sender, silent)
         reply = self.generate_reply(sender=sender)
-        error = self.prompt_and_response.response_vanity_check(reply, check_exempt_layers)
-        if error:
-            print(f'Error in response: {error}.')
-            match = re.search(r'# previous error message: (\d+) #', message)
-            idx = int(match.group(1))+1 if match else 0
-            if idx < 4:
-                return self.process_then_reply(message + f'\n # previous error message: {idx} # '+  error +' Please strictly follow the example in the prompt', sender, restart=False, silent=silent, check_exempt_layers=check_exempt_layers)  
-            else:
-                return reply
-        else:
-            return PromptAndResponse.response_json_check(reply)
+        response_dict, error = self.prompt_and_response.parse_response(reply, check_exempt_layers)
+        if error is None:
+            return response_dict
+        print(f'Error in response: {error}.')
+        self.discard_cached_reply(reply)
+        if restart_times + 1 < 4:
+            repair_message = self.prompt_and_response.repair_message(message, reply, error, check_exempt_layers)
+            self._append_oai_message(reply, 'assistant', sender) # the invalid reply stays in the history the repair refers to
+            return self.process_then_reply(repair_message, sender, restart=False, silent=silent, restart_times=restart_times + 1, check_exempt_layers=check_exempt_layers)
+        parser_stats.failures += 1
+        return reply
     
     async def a_process_then_reply(self, message, sender: Agent, restart=True, silent=True, restart_times=0, check_exempt_layers=[1,2,3,4,5,6,7,8,9,10] ):
+        '''
+        a reply that can not be repaired locally is retried in the same chat: the prompt and the invalid reply
+        stay in the history and only a short repair message with the error and the schema of the prompt example is appended
+        '''
         # modified from ConversableAgent.a_receive()
         self._prepare_chat(self,clear_history=restart)
         self._process_received_message(message, sender, silent)
         reply = await self.a_generate_reply(sender=sender)
-        error = self.prompt_and_response.response_vanity_check(reply, check_exempt_layers)
-        if error:
-            print(f'Error in response: {error}.')
-            # match = re.search(r'# previous error message: (\d+) #', message)
-            restart_times += 1 
-            if restart_times < 4:
-                return await self.a_process_then_reply(message + f'\n # previous error message: {restart_times} # '+  error +' Please strictly follow the example in the prompt', sender, restart=False, silent=silent, restart_times=restart_times, check_exempt_layers=check_exempt_layers)  
-            else:
-                return reply
-        else:
-            return PromptAndResponse.response_json_check(reply)
+        response_dict, error = self.prompt_and_response.parse_response(reply, check_exempt_layers)
+        if error is None:
+            return response_dict
+        print(f'Error in response: {error}.')
+        self.discard_cached_reply(reply)
+        restart_times += 1 
+        if restart_times < 4:
+            repair_message = self.prompt_and_response.repair_message(message, reply, error, check_exempt_layers)
+            self._append_oai_message(reply, 'assistant', sender) # the invalid reply stays in the history the repair refers to
+            return await self.a_process_then_reply(repair_message, sender, restart=False, silent=silent, restart_times=restart_times, check_exempt_layers=check_exempt_layers)
+        parser_stats.failures += 1
+        return reply
         
     # def _prepare_chat(self, recipient: "ConversableAgent", clear_history: bool, prepare_recipient: bool = True) -> None:
     #     '''
@@ -618,16 +628,10 @@ Please notice that:
 
     def retrieve_modify_dialogue(self, obj_agent):
         '''
-        modify the role of a dialogue into specific names
+        modify the role of a dialogue into specific names.
+        the recent turns of the bounded conversation store, after the summary of the older ones
         '''
-        dialogue = copy.deepcopy(self._oai_messages[obj_agent])
-        for dia_id in range(len(dialogue)):
-            if dialogue[dia_id]['role'] == 'user':
-                dialogue[dia_id]['role'] = obj_agent.name
-            elif dialogue[dia_id]['role'] == 'assistant':
-                dialogue[dia_id]['role'] = self.name
-                
-        return dialogue
+        return get_conversation_store().dialogue(self.name, obj_agent.name)
 
     async def a_drawing(self,):
         # dalle 3 call 
@@ -737,41 +741,45 @@ Please notice that:
 
 class CharacterList:
     characters: list[Character]
+    PERCEPTION_RANGE = 18 # Manhattan distance within which characters in the same building perceive each other
 
-    def __init__(self):
+    def __init__(self, cell_size=PERCEPTION_RANGE):
         self.characters = []
+        self._by_name: dict[str, Character] = {}
+        self._by_guid: dict[int, Character] = {}
+        self._grid = UniformGrid(cell_size) # position index, kept up to date by Character.change_pos/change_building
 
     def perspect_surrounding_char(self, protagonist: Character) -> list[Character]:
         '''
         return characters in the same building
         '''
-
-
         def perspectable(agent_a, agent_b):
             blg_a = agent_a.in_building
             blg_b = agent_b.in_building
-            distance = agent_a.x -agent_b.x + agent_a.y - agent_b.y # Manhattan distance
-            return blg_a==blg_b and distance<18 
+            distance = abs(agent_a.x - agent_b.x) + abs(agent_a.y - agent_b.y) # Manhattan distance
+            return blg_a==blg_b and distance<self.PERCEPTION_RANGE
 
-        return [  char for char in self.characters if perspectable(protagonist, char) and protagonist!=char ]
+        candidates = self._grid.query(protagonist.x, protagonist.y, self.PERCEPTION_RANGE)
+        return [  char for char in candidates if perspectable(protagonist, char) and protagonist!=char ]
 
     def get_character_by_name(self, name:str):
-        for char in self.characters:
-            if char.name == name:
-                return char
-        return None
+        return self._by_name.get(name)
     
     def get_character_by_id(self, id):
-        for char in self.characters:
-            if char.guid == id:
-                return char
-        return None 
+        return self._by_guid.get(id)
 
     def add_character(self, character):
         self.characters.append(character)
+        self._by_name.setdefault(character.name, character)
+        self._by_guid.setdefault(character.guid, character)
+        self._grid.insert(id(character), character, character.x, character.y)
+        character._index_listeners.append(self.update_character_index)
+
+    def update_character_index(self, character):
+        self._grid.move(id(character), character, character.x, character.y)
 
     def get_nearby_characters(self, character, radius) -> list[str]:
-        return [other_character.name for other_character in self.characters if
+        return [other_character.name for other_character in self._grid.query(character.x, character.y, radius) if
                 abs(other_character.x - character.x) <= radius and abs(other_character.y - character.y) <= radius]
 
     def encode_to_json(self) -> json:
@@ -824,27 +832,47 @@ class PromptAndResponse:
     def encode_latest_llm(self) -> json:
         return serialize(self, allowed=['name', 'latest_prompt_type', 'latest_prompt', 'latest_response'])
     
-    def response_vanity_check(self, response, check_exempt_layers):
+    def response_parser(self, check_exempt_layers) -> ResponseParser:
+        return get_response_parser(self.latest_prompt_example, check_exempt_layers)
+
+    def parse_response(self, response, check_exempt_layers):
+        '''
+        (response dict, None) or (None, ResponseError), defects like markdown fences, trailing commas
+        and single quotes are repaired locally
+        '''
         try:
-            response_dict = PromptAndResponse.response_json_check(response)
-            self.response_structure_check(response_dict,check_exempt_layers)
-        except Exception as e:
-            return f'{self.error_seperator} Please NOTICE that {e} '
+            response_dict, repaired = self.response_parser(check_exempt_layers).parse(response)
+        except ResponseError as e:
+            return None, e
+        parser_stats.record(repaired)
+        return response_dict, None
+
+    def repair_message(self, message, response, error: ResponseError, check_exempt_layers) -> str:
+        '''
+        the short message appended after message and response instead of message + error,
+        the tokens it saves are added to the parser stats
+        '''
+        repair_message = self.response_parser(check_exempt_layers).repair_message(error)
+        full_retry = [{'content': message}, {'content': response}, {'content': f'{message}{self.response_vanity_error(error)}'}]
+        repair_retry = [{'content': message}, {'content': response}, {'content': repair_message}]
+        parser_stats.record_retry(estimate_tokens(full_retry), estimate_tokens(repair_retry))
+        return repair_message
+
+    def response_vanity_error(self, error) -> str:
+        return f'{self.error_seperator} Please NOTICE that {error} '
+
+    def response_vanity_check(self, response, check_exempt_layers):
+        _, error = self.parse_response(response, check_exempt_layers)
+        if error is not None:
+            return self.response_vanity_error(error)
         
     @staticmethod
     def response_json_check(response):
-        response = PromptAndResponse.extract_json_from_markdown(response)
-        try:        
-            if type(response) is not dict:
-                response = eval(response) 
-        except:
-            try:
-                response = json.loads(response) 
-            except:           
-                __import__('ipdb').set_trace()
-                print(f'Can not load reply as json, reply: {response}')
-                raise AssertionError('Must return a formal dict ! Recheck the dict format')
-        
+        try:
+            response, _ = get_response_parser(None).parse(response)
+        except ResponseError as e:
+            print(f'Can not load reply as json, reply: {response}')
+            raise AssertionError(str(e))
         return response
            
     def response_structure_check(self, response_dict, exempt_layers=[2,3,4,5,6,7,8,9,10]):    
@@ -2,8 +2,8 @@
 import copy
 import traceback
 
-from langchain_openai import OpenAIEmbeddings
 from ..llm.llm_expends.dalle3 import DALLE3Caller
+from ..llm.embedding_service import get_embedding_service
 import asyncio
 import uuid
 from PIL import Image
@@ -93,7 +93,7 @@ class DrawingList:
             self.drawings.append(drawing)
             
         if os.getenv('Milvus'):
-            self.embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+            self.embeddings = get_embedding_service()
             # self.artwork_milvus_data_store = artwork_milvus_data_store
             self.artwork_milvus_data_store = MilvusDataStore(
                 host=MILVUS_HOST,
@@ -0,0 +1,216 @@
+import asyncio
+import threading
+from collections import deque
+from functools import partial
+from typing import Dict, List, Optional
+
+from ..utils.log import LogManager
+
+SUMMARY_NAME = 'conversation_summary' # name of the system message holding the summary in a trimmed _oai_messages list
+SUMMARY_ROLE = 'summary of the earlier conversation' # role of the summary entry in retrieve_modify_dialogue
+
+SUMMARY_PROMPT = '''Update the running summary of the conversation between {speakers}.
+Current summary: {summary}
+Turns to add:
+{turns}
+Keep the facts, promises, prices and feelings that matter for later conversations, drop the small talk.
+Return only the new summary as plain text, in at most {max_words} words.'''
+
+
+class ConversationHistory:
+    '''
+    the conversation of a pair of agents: the last max_turns turns as {'role': speaker name, 'content': text}
+    and a summary of the older turns, which is updated by the summarizer from the evicted turns
+    '''
+    __slots__ = ('speakers', 'turns', 'pending', 'summary', 'turns_total', 'summarizer', 'summarizing')
+
+    def __init__(self, speakers: tuple, max_turns: int):
+        self.speakers = speakers
+        self.turns: deque = deque(maxlen=max_turns)
+        self.pending: List[Dict] = [] # evicted from turns, not in the summary yet
+        self.summary = ''
+        self.turns_total = 0
+        self.summarizer = None # agent whose client writes the summary
+        self.summarizing = False
+
+
+def extractive_summary(summary: str, turns: List[Dict], max_chars: int, turn_chars: int = 120) -> str:
+    '''
+    summary without llm: the beginning of every turn appended, the oldest part cut beyond max_chars
+    '''
+    lines = [f"{t['role']}: {t['content'][:turn_chars]}" for t in turns]
+    return '; '.join(([summary] if summary else []) + lines)[-max_chars:]
+
+
+class ConversationStore:
+    '''
+    bounded conversation history per pair of agents, shared by both sides.
+    - record: a turn sent by one agent to the other, the oldest turn beyond max_turns moves to the pending turns
+    - bound: trims an autogen _oai_messages list to the last max_turns messages, the older ones are replaced by
+      a system message with the summary, so the prompt of a long conversation stays flat
+    - summarize_due: once summarize_every turns are pending, the summary is rewritten from the old summary and
+      the pending turns by a low priority llm call of the scheduler, off the tick (extractive when use_llm is False
+      or the call fails)
+    '''
+    def __init__(self, max_turns: int = 20, summarize_every: int = 10, max_summary_chars: int = 2000, use_llm: bool = True):
+        self.max_turns = max_turns
+        self.summarize_every = summarize_every
+        self.max_summary_chars = max_summary_chars
+        self.use_llm = use_llm
+        self._histories: Dict[frozenset, ConversationHistory] = {}
+        self._due: Dict[frozenset, ConversationHistory] = {}
+        self._lock = threading.Lock()
+        self.summaries = 0
+        self.llm_summaries = 0
+        self.failed_summaries = 0
+
+    def history(self, name_a: str, name_b: str, create: bool = False) -> Optional[ConversationHistory]:
+        key = frozenset((name_a, name_b))
+        history = self._histories.get(key)
+        if history is None and create:
+            with self._lock:
+                history = self._histories.setdefault(key, ConversationHistory(tuple(sorted(key)), self.max_turns))
+        return history
+
+    def record(self, speaker, listener_name: str, message: Dict):
+        content = message.get('content')
+        if content is None: # function calls
+            return
+        history = self.history(speaker.name, listener_name, create=True)
+        with self._lock:
+            if len(history.turns) == history.turns.maxlen:
+                history.pending.append(history.turns[0])
+            history.turns.append({'role': speaker.name, 'content': content if isinstance(content, str) else str(content)})
+            history.turns_total += 1
+            history.summarizer = speaker
+            if len(history.pending) >= self.summarize_every:
+                self._due[frozenset(history.speakers)] = history
+
+    def bound(self, messages: List[Dict], name_a: str, name_b: str):
+        '''
+        messages: the _oai_messages list of one side, trimmed in place
+        '''
+        start = 1 if messages and messages[0].get('name') == SUMMARY_NAME else 0
+        if len(messages) - start <= self.max_turns:
+            return
+        del messages[:len(messages) - self.max_turns]
+        history = self.history(name_a, name_b)
+        summary = self.summary_of(history)
+        if summary:
+            messages.insert(0, {'role': 'system', 'name': SUMMARY_NAME,
+                                'content': f'Summary of the earlier conversation between {name_a} and {name_b}: {summary}'})
+
+    def summary_of(self, history: Optional[ConversationHistory]) -> str:
+        '''
+        the summary, followed by the pending turns in short while they are not summarized yet
+        '''
+        if history is None:
+            return ''
+        if not history.pending:
+            return history.summary
+        return extractive_summary(history.summary, history.pending, self.max_summary_chars)
+
+    def dialogue(self, name_a: str, name_b: str) -> List[Dict]:
+        '''
+        the summary of the older turns (if any) and the recent turns, in the format of Character.retrieve_modify_dialogue
+        '''
+        history = self.history(name_a, name_b)
+        if history is None:
+            return []
+        with self._lock:
+            summary = self.summary_of(history)
+            turns = [dict(t) for t in history.turns]
+        return ([{'role': SUMMARY_ROLE, 'content': summary}] if summary else []) + turns
+
+    def turn_count(self, name_a: str, name_b: str) -> int:
+        history = self.history(name_a, name_b)
+        return history.turns_total if history is not None else 0
+
+    def summarize_due(self):
+        '''
+        submit the summaries that are due, called once per tick from the event loop
+        '''
+        if not self._due:
+            return
+        with self._lock:
+            due, self._due = [h for h in self._due.values() if not h.summarizing], {}
+            for history in due:
+                history.summarizing = True
+        if not self.use_llm:
+            for history in due:
+                self._apply(history, len(history.pending), None)
+            return
+        from ..llm.scheduler import get_llm_scheduler
+        for history in due:
+            future = get_llm_scheduler().submit(partial(self._summarize, history), prompt_type='SUM')
+            future.add_done_callback(partial(self._on_done, history))
+
+    async def _summarize(self, history: ConversationHistory):
+        with self._lock:
+            count, turns = len(history.pending), list(history.pending)
+        agent = history.summarizer
+        prompt = SUMMARY_PROMPT.format(speakers=' and '.join(history.speakers), summary=history.summary or 'none',
+                                       turns='\n'.join(f"{t['role']}: {t['content']}" for t in turns),
+                                       max_words=self.max_summary_chars // 6)
+        # to_thread keeps the scheduler job in the context, the usage is recorded under SUM
+        reply = await asyncio.to_thread(
+            partial(agent.routed_reply_from_client, agent.client, [{'role': 'user', 'content': prompt}], structured=False))
+        return count, reply
+
+    def _on_done(self, history: ConversationHistory, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            if not future.cancelled():
+                LogManager.log_warning(f"[ConversationStore]: summary of {history.speakers} failed, kept extractive: {future.exception()!r}")
+            self.failed_summaries += 1
+            self._apply(history, len(history.pending), None)
+            return
+        count, reply = future.result()
+        self._apply(history, count, reply if isinstance(reply, str) and reply.strip() else None)
+
+    def _apply(self, history: ConversationHistory, count: int, summary: Optional[str]):
+        with self._lock:
+            turns, history.pending = history.pending[:count], history.pending[count:]
+            if summary is None:
+                history.summary = extractive_summary(history.summary, turns, self.max_summary_chars)
+            else:
+                history.summary = summary.strip()[-self.max_summary_chars:]
+                self.llm_summaries += 1
+            history.summarizing = False
+            self.summaries += 1
+            if len(history.pending) >= self.summarize_every:
+                self._due[frozenset(history.speakers)] = history
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            histories = list(self._histories.values())
+        return {
+            'pairs': len(histories),
+            'turns_kept': sum(len(h.turns) for h in histories),
+            'turns_pending': sum(len(h.pending) for h in histories),
+            'turns_total': sum(h.turns_total for h in histories),
+            'summary_chars': sum(len(h.summary) for h in histories),
+            'summaries': self.summaries,
+            'llm_summaries': self.llm_summaries,
+            'failed_summaries': self.failed_summaries,
+        }
+
+
+_conversation_store: ConversationStore = None
+
+
+def get_conversation_store() -> ConversationStore:
+    '''
+    process-wide store sized by CommonConfig.conversation_*
+    '''
+    global _conversation_store
+    if _conversation_store is None:
+        from config.config_common import CommonConfig
+        _conversation_store = ConversationStore(max_turns=CommonConfig.conversation_max_turns,
+                                                summarize_every=CommonConfig.conversation_summarize_every,
+                                                max_summary_chars=CommonConfig.conversation_summary_max_chars,
+                                                use_llm=CommonConfig.conversation_summary_llm)
+    return _conversation_store
+
+
+def get_conversation_stats() -> Optional[Dict[str, float]]:
+    return _conversation_store.stats() if _conversation_store is not None else None
@@ -13,26 +13,60 @@ import uuid
 
 # from ..utils.serialization import serialize
 from ..database.milvus_datastore import MilvusDataStore
-from ..global_config import MILVUS_HOST, MILVUS_PORT, MILVUS_INDEX_PARAMS
-from ..database.milvus_constants import ENTITY_SCHEMA
+from ..database.vector_store import NumpyVectorStore, VectorStore
+from ..global_config import MILVUS_HOST, MILVUS_PORT, MILVUS_INDEX_PARAMS, VECTOR_STORE, VECTOR_STORE_PATH
+from ..database.milvus_constants import CHARACTER_MEMORY_COLLECTION, CHARACTER_MEMORY_SCHEMA
 
-ENTITY_COLLECTION = 'entity_memory'
+ENTITY_COLLECTION = 'entity_memory' # prefix of the former per-character collections, see app/database/migrate_memory_collections.py
 LOCATION_COLLECTION = 'location_memory'
 TRANSACTION_COLLECTION = 'transaction_records'
 
-class Memory:
-    def __init__(self, entity_name: str) -> None:
-        self.entity_name = entity_name
-        self.datastore = MilvusDataStore(
-            host=MILVUS_HOST,
-            port=MILVUS_PORT,
-            collection_name=self.build_collection_name(),
-            schema=ENTITY_SCHEMA,
-            index_params=MILVUS_INDEX_PARAMS
+def get_vector_store(collection_name: str, **milvus_kwargs) -> VectorStore:
+    '''
+    VECTOR_STORE=numpy keeps the collection in process (persisted under VECTOR_STORE_PATH), otherwise milvus
+    '''
+    if VECTOR_STORE == 'numpy':
+        return NumpyVectorStore.shared(collection_name, path=VECTOR_STORE_PATH)
+    return MilvusDataStore.shared(collection_name=collection_name, host=MILVUS_HOST, port=MILVUS_PORT, **milvus_kwargs)
+
+
+def get_character_memory_store() -> VectorStore:
+    '''
+    the memory collection shared by all the characters, each character lives in the partition of its act_name
+    '''
+    return get_vector_store(
+            CHARACTER_MEMORY_COLLECTION,
+            field_schema=CHARACTER_MEMORY_SCHEMA,
+            index_field='emb',
+            index_params=MILVUS_INDEX_PARAMS,
         )
+
+
+class Memory:
+    def __init__(self, character_id=None, character_name: str = None, embeddings=None, entity_name: str = None) -> None:
+        self.character_id = character_id
+        self.character_name = character_name if character_name is not None else entity_name
+        self.entity_name = self.character_name
+        self.embeddings = embeddings
         self.numeric_memory = defaultdict(float)
-        
+
+    @property
+    def character_milvus_data_store(self) -> VectorStore:
+        # resolved on first use, creating a character does not touch milvus
+        return get_character_memory_store()
+
+    @property
+    def trade_records_milvus_data_store(self) -> VectorStore:
+        return get_vector_store(TRANSACTION_COLLECTION)
+
+    @property
+    def datastore(self) -> VectorStore:
+        return self.character_milvus_data_store
+
     def build_collection_name(self):
+        '''
+        name of the former per-character collection, only used to migrate it into the shared one
+        '''
         name = f"{ENTITY_COLLECTION}_{self.entity_name}"
         name = re.sub(' ', '', name)
         return name
@@ -70,13 +104,15 @@ class Memory:
         } 
         '''
         try:
-            embedding = self.embeddings.embed_query(text)
+            embedding = await self.embeddings.aembed_query(text)
             print(len(embedding))
             dict_to_insert = copy.deepcopy(scale_dict)
             dict_to_insert.update({
                 "id": str(uuid.uuid1()), 
-                "emb": embedding 
+                "emb": embedding,
+                "text": text,
             })
+            dict_to_insert.setdefault("act_name", self.character_name) # partition key of the shared collection
             #the dict should match the collection schema in milvus_constants.py
             if data_store is None: data_store = self.character_milvus_data_store
             response = data_store.insert_data( dict_to_insert )
@@ -162,10 +198,12 @@ class Memory:
         return self.trade_records.get(name, [])
     
 
-    def name_specific_memory_retrieve_from_milvus(self, obj_name: str, query:str,topk:int=4):
+    def name_specific_memory_retrieve_from_milvus(self, obj_name: str, query:str,topk:int=4, query_emb=None):
         milvus_expression = f"obj_name=='{obj_name}' && act_name=='{self.character_name}'"
+        if query_emb is None:
+            query_emb = self.embeddings.embed_query(text=query)
         search_param = {
-                "data": [self.embeddings.embed_query(text=query)], # 要搜索的query的emb
+                "data": [query_emb], # 要搜索的query的emb
                 "anns_field": "emb", # 要检索的向量字段
                 "param": {"metric_type": "COSINE"},
                 "limit": topk, # Top K 
@@ -177,6 +215,14 @@ class Memory:
         )
         return search_result
     
+    def name_specific_memories_retrieve_from_milvus(self, queries: List[tuple], topk:int=4):
+        '''
+        queries: [(obj_name, query), ...], all the queries are embedded in one call
+        '''
+        query_embs = self.embeddings.embed_documents([query for _, query in queries])
+        return [self.name_specific_memory_retrieve_from_milvus(obj_name, query, topk=topk, query_emb=emb)
+                for (obj_name, query), emb in zip(queries, query_embs)]
+
     def buyer_specific_memory_retrieve_from_milvus(self, obj_name: str, query:str, topk:int=4):
         milvus_expression = f"buyer=='{obj_name}'"
         search_param = {
@@ -1,4 +1,4 @@
-from langchain_openai import OpenAIEmbeddings
+from app.llm.embedding_service import get_embedding_service
 from app.database.milvus_constants import ARTWORK_MILVUS_FILED_SCHEMA
 from app.database.milvus_datastore import MilvusDataStore
 from app.global_config import MILVUS_HOST, MILVUS_INDEX_PARAMS, MILVUS_PORT
@@ -6,7 +6,7 @@ from pymilvus.orm.collection import (
     SearchResult
 )
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+embeddings = get_embedding_service()
 
 ARTWORK_COLLECTION_NAME = 'artwork_collection'
 artwork_milvus_data_store = MilvusDataStore(
@@ -71,24 +71,28 @@ class Emotion:
         if event:
             self.impressive_event_update(emotion, intensity_change, event)        
     
-    def passive_update(self, emotion=None, decay_alpha=None):
+    def passive_update(self, emotion=None, decay_alpha=None, steps=1):
+        '''
+        steps: ticks to apply at once, a character woken after waiting catches up on the ticks it skipped
+        '''
         if decay_alpha is None: decay_alpha = self.passive_decay_alpha
         
         # TODO: optimize emotion passive update algorithm
-        if emotion is None: # update all the emotions in the current state
-            for key in self.emotion.keys():
-                if self.emotion[key] > 7: 
-                    self.emotion[key] -= self.emotion[key] * random.uniform(0, 10) * decay_alpha # exptreme high emotion will randomly decrease by 0~10%
-                    self.emotion[key] -= self.emotion[key] * random.randrange(0, 10) * decay_alpha # exptreme high emotion will randomly decrease by 0~10%
-                else:
-                    self.emotion[key] += self.emotion[key] * random.randrange(0, 5) * decay_alpha # normal emotion will randomly in/decrease by 0~5%
-        else:
-            if self.emotion[emotion] > 7: 
-                self.emotion[emotion] -= self.emotion[emotion] * random.randrange(-5, 5) * decay_alpha 
+        for _ in range(steps):
+            if emotion is None: # update all the emotions in the current state
+                for key in self.emotion.keys():
+                    if self.emotion[key] > 7: 
+                        self.emotion[key] -= self.emotion[key] * random.uniform(0, 10) * decay_alpha # exptreme high emotion will randomly decrease by 0~10%
+                        self.emotion[key] -= self.emotion[key] * random.randrange(0, 10) * decay_alpha # exptreme high emotion will randomly decrease by 0~10%
+                    else:
+                        self.emotion[key] += self.emotion[key] * random.randrange(0, 5) * decay_alpha # normal emotion will randomly in/decrease by 0~5%
             else:
-                self.emotion[emotion] += self.emotion[emotion] * random.randrange(-5, 5) * decay_alpha
-        for emo in self.emotion.keys():
-            self.emotion[emo] = max(0, min(10, round(self.emotion[emo], 2)))
+                if self.emotion[emotion] > 7: 
+                    self.emotion[emotion] -= self.emotion[emotion] * random.randrange(-5, 5) * decay_alpha 
+                else:
+                    self.emotion[emotion] += self.emotion[emotion] * random.randrange(-5, 5) * decay_alpha
+            for emo in self.emotion.keys():
+                self.emotion[emo] = max(0, min(10, round(self.emotion[emo], 2)))
                 
     def impressive_event_update(self, emotion, emotion_delta, event:str):
         pre_emo_dif = self.impressive_event.get(emotion, dict()).get('emo_delta', 1) 
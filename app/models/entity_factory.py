@@ -4,7 +4,8 @@ from app.models.character import CharacterList
 from app.models.character import Character
 from app.repository.agent_repo import get_agent_from_db
 from app.llm.caller import LLMCaller, GPT35Caller
-from config import unique_names as name_list
+from app.llm.key_router import get_key_router
+from config import cheap_apis, official_apis, unique_names as name_list
 
 from openai import OpenAI
 
@@ -83,14 +84,9 @@ class AgentCreation:
     
     @staticmethod 
     def allocate_llm( *args, **kwargs):
-        with open('runtime/cheap_apis.json', 'r') as file:
-            cheap_apis = json.load(file)
-        with open('runtime/official_apis.json', 'r') as file:
-            official_apis = json.load(file)
-        
-        # find the least used api
-        sorted_cheap_apis = dict(sorted(cheap_apis.items(), key=lambda item: len(item[1])))
-        sorted_official_apis = dict(sorted(official_apis.items(), key=lambda item: len(item[1]))) 
-        
-        return {"llm_cfg":{'cheap_api':sorted_cheap_apis[0], 'official_api':sorted_official_apis[0]}}
+        # home keys with the fewest agents, the requests themselves are routed by the key router
+        router = get_key_router()
+        if router is None: # router not initialised, any key of each pool, as in Simulation.load_llm_config
+            return {"llm_cfg": {'cheap_api': random.choice(cheap_apis), 'official_api': random.choice(official_apis)}}
+        return {"llm_cfg": router.least_used_cfg()}
          
\ No newline at end of file
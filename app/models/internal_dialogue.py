@@ -1,10 +1,8 @@
 import asyncio
 import random
-import os
-import re
-import traceback
 from ..service.character_state.register import register
 from ..constants.prompt_type import PromptType
+from ..llm.scheduler import get_llm_scheduler
 
 @register(name=PromptType.INNER_MONOLOGUE, type="prompt")
 class MonologuePrompt:
@@ -58,33 +56,14 @@ class MonologuePrompt:
     
     
     def format_attr(self, **kwargs) -> str:
-        base_prompt = self.PROMPT
+        from ..llm.prompt.base_prompt import fit_to_budget
+        from ..llm.prompt.template import prompt_templates
+        template = prompt_templates.get(self.prompt_type, self.PROMPT)
         att_dict = dict()
-        att_dict.update({'memory': self.character.longterm_memory.to_json()})
+        att_dict.update({'memory': self.character.longterm_memory.to_json()} if 'memory' in template.attributes else {})
         att_dict.update(self.character.working_memory.serialize())
         att_dict.update(kwargs)
-        
-        attributes = re.findall('\{([a-zA-Z_]+)\}', base_prompt) 
-        for att in attributes:
-            if att in att_dict:
-                att_val = att_dict[att]
-            elif hasattr(self, att):
-                att_val = getattr(self, att)
-            elif hasattr(self.character, att):
-                att_val = getattr(self.character, att)
-            elif att in self.character.working_memory.wm: # TODO
-                att_val = self.character.working_memory.get(att)   
-            else:
-                raise  AssertionError(f'Missing attribute: {att} . Current prompt: {self.prompt_type}')
-            try:
-                base_prompt = base_prompt.replace('{'+att+'}', str(att_val))
-            except:
-                traceback.print_exc()
-                if os.getenv('DEBUG'):
-                    __import__('ipdb').set_trace()
-                pass        
-        
-        return base_prompt
+        return template.render(fit_to_budget(self, template, att_dict).__getitem__)
 
 class InnerMonologue():
     """
@@ -120,8 +99,14 @@ class InnerMonologue():
     def call_llm(self):
         message = self.build_prompt()
         self.save_llm_prompt(message)
-        self.llm_task = asyncio.create_task(self.character.a_process_then_reply(message=message, sender=self.character, restart=True))
-        self.llm_task.add_done_callback(lambda task: self.set_monologue(task.result()))
+        self.llm_task = get_llm_scheduler().submit(lambda: self.character.a_process_then_reply(message=message, sender=self.character, restart=True),
+                                                   prompt_type=PromptType.INNER_MONOLOGUE, owner=self)
+        self.llm_task.add_done_callback(self.on_llm_done)
+
+    def on_llm_done(self, task):
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.set_monologue(task.result())
         
     def save_llm_prompt(self, prompt):
         self.character.save_prompt(prompt, PromptType.INNER_MONOLOGUE, getattr(InnerMonologue, 'EXAMPLE', None))
@@ -9,11 +9,13 @@ from typing import Optional, Union
 from autogen import filter_config, ConversableAgent, AssistantAgent, UserProxyAgent, config_list_from_json, Agent
 
 from app.models.base_agent import SimsAgent
-from app.utils.load_oai_config import plug_api_to_cfg, register_callback
+from app.llm.key_router import register_agent
+from app.utils.load_oai_config import plug_api_to_cfg
 from app.utils.save_object import find_instance_specific_data_attrs
 from ..service.character_state.register import FuncName2Registered
 from ..utils.serialization import serialize
 from ..utils.globals import RESOURCE_SPLITER
+from ..utils.spatial_index import UniformGrid
 from config import cfg_tmplt
 
 class Building(SimsAgent):
@@ -54,7 +56,7 @@ class Building(SimsAgent):
         self.map = map
         assert RESOURCE_SPLITER not in name, f'building name should not contain {RESOURCE_SPLITER}, your building name: {name}'
                 
-        register_callback(llm_cfg, guid=self.guid, prefix=f'building_{name}')
+        register_agent(llm_cfg, guid=self.guid, prefix=f'building_{name}')
         config_list = plug_api_to_cfg(cfg_tmplt, **llm_cfg) 
         cfg_ls = filter_config(
                 config_list=config_list, 
@@ -202,11 +204,15 @@ class Building(SimsAgent):
         return self.name
             
 class BuildingList:
-    def __init__(self):
+    def __init__(self, cell_size=16):
         self.buildings: list[Building] = []
+        self._by_name: dict[str, Building] = {}
+        self._grid = UniformGrid(cell_size) # buildings are static, indexed by the cells their rectangle covers
 
     def add_building(self, building):
         self.buildings.append(building)
+        self._by_name.setdefault(building.name, building)
+        self._grid.insert_rect(id(building), building, building.xMin, building.yMin, building.xMax, building.yMax)
 
     def get_building_name(self):
         return [building.name for building in self.buildings]
@@ -216,19 +222,13 @@ class BuildingList:
         return dicts
 
     def get_building_by_id(self, building_id):
-        for building in self.buildings:
-            if building.name == building_id:
-                return building
-        return None
+        return self._by_name.get(building_id)
 
     def get_building_by_name(self, building_name):
-        for building in self.buildings:
-            if building.name == building_name:
-                return building
-        return None
+        return self._by_name.get(building_name)
     
     def get_building_by_pos(self, x, y):
-        for building in self.buildings:
+        for building in self._grid.query(x, y):
             if building.cordinate_in_building(x, y):
                 return building
         return None
@@ -1,7 +1,7 @@
-from langchain_openai import OpenAIEmbeddings
 from sklearn.metrics.pairwise import paired_distances
 
 from ..repository.artwork_repo import update_artwork_in_db, get_artwork_from_db
+from ..llm.embedding_service import get_embedding_service
 from .db_modules.milvus_collections import artwork_milvus_data_store, retrieve_artwork_by_prompt_emb
 
 class MarketAdjust:
@@ -10,7 +10,7 @@ class MarketAdjust:
     '''
     def __init__(self, commodities=None, model=None):
         self.commodities = commodities if commodities else []
-        self.model = model if model else OpenAIEmbeddings(model="text-embedding-3-large")
+        self.model = model if model else get_embedding_service()
         all_drawings = [] # TODO sql query to get all drawings   
         self.artwork_milvus_data_store = artwork_milvus_data_store
     
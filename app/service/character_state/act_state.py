@@ -146,7 +146,7 @@ class ActState(BaseState):
                 __import__('ipdb').set_trace()
             return False, dict()
         
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict() 
     
     def push_attr_change_to_server(self, **kwargs):
@@ -160,7 +160,7 @@ class ActState(BaseState):
                 'display_duration': 3
             }
             msg = f"1002@{json.dumps(msg)}"
-            add_msg_to_send_to_game_server(msg)
+            add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
             
         elif action in ["MOVE"]:
             msg = {
@@ -170,7 +170,7 @@ class ActState(BaseState):
                 'display_duration': 3
             }
             msg = f"1002@{json.dumps(msg)}"
-            add_msg_to_send_to_game_server(msg)
+            add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
     
     def push_state_change_to_server(self, **kwargs):
@@ -184,5 +184,5 @@ class ActState(BaseState):
         }
         msg = f"1002@{json.dumps(msg)}"
 
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
\ No newline at end of file
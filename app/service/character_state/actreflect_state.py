@@ -1,7 +1,6 @@
 import asyncio
 from functools import partial
 import json
-from time import sleep
 from ...utils.gameserver_utils import add_msg_to_send_to_game_server
 from .base_state import BaseState
 from ...constants import CharacterState, PromptType
@@ -65,7 +64,7 @@ class ActReflection(BaseState):
             'display_duration': 1000
         }
         msg = f"1002@{json.dumps(msg)}"
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
     
     
\ No newline at end of file
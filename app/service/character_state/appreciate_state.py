@@ -1,6 +1,5 @@
 import random
 import json
-from time import sleep
 from ...utils.gameserver_utils import add_msg_to_send_to_game_server
 from .base_state import BaseState
 from .register import register
@@ -178,6 +177,6 @@ class AppreciateState(BaseState):
             'display_duration': 1000
         }
         msg = f"1002@{json.dumps(msg)}"
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
             
\ No newline at end of file
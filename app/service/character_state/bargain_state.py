@@ -218,7 +218,7 @@ class BargainState(BaseState):
         owner_agent = self.get_agent_by_name(self.owner_name)
         assert owner_agent is not None, f'Owner agent {self.owner_name} is not found.'
         self.update_sys_prompt_to_bargain(resource_id=resource_id, owner_agent=owner_agent)
-        self.llm_task = asyncio.create_task(self.character.a_initiate_chat(recipient=owner_agent,
+        self.llm_task = self.submit_llm(lambda: self.character.a_initiate_chat(recipient=owner_agent,
                                             message="I like this painting! It seems it belongs to you. Could you give me a price for it? I want to buy it.", #self.get_character_wm_by_name(''),
                                             clear_history=True, )
                                             )
@@ -13,13 +13,18 @@ from app.utils.globals import RESOURCE_SPLITER
 from config import config
 from ..character_state import FuncName2Registered, PromptName2Registered, StateName2Registered
 from ...communication.websocket_server import WebSocketServer
-from ...constants import StateName2State, PromptType, State2PushMsgId, State2RecieveMsgId, InterruptableStates
-from ...llm.caller import LLMCaller
+from ...constants import StateName2State, PromptType, State2PushMsgId, State2RecieveMsgId, InterruptableStates, get_recieve_msg_ids
+from ...global_config import VECTOR_STORE
+from ...llm.caller import LLMCaller, get_llm_caller
+from ...llm.batcher import get_decision_batcher
+from ...llm.scheduler import get_llm_scheduler
 from ...llm.prompt.base_prompt import BasePrompt
 from ...models.location import BuildingList
 from ...models.character import Character, CharacterList, CharacterState
+from ..wakeups import Wait
 from ...utils.function_chain import FunctionChain
-from ...utils.gameserver_utils import add_msg_to_send_to_game_server
+from ...utils.log import LogManager
+from ...utils.gameserver_utils import add_msg_to_send_to_game_server, display_scheduler
 #from ipdb import set_trace
 
 class BaseState:
@@ -34,7 +39,11 @@ class BaseState:
     finish_state: bool
     circle_tolerance: int, if the len of a circle in the state machine > circle tolerance, it will be deemed as a circle
     loop_tolerance: int, if the node in a circle is visited more than loop_tolearnce, the cirlce will be forced to be quit (directed to another state) 
+    wait_aware_updates: names of the update calls a subclass adds and accounts for in wait_condition, a state with
+        other update calls is stepped every tick
     '''
+    WAITING_UPDATES = ('change_date', 'monitor_server_msg', 'passive_update', 'state_timeout', 'change_state')
+    wait_aware_updates = ()
 
     def __init__(self, character: Character, main_prompt, character_list: CharacterList, building_list: BuildingList,
                  followed_states, 
@@ -60,7 +69,6 @@ class BaseState:
         self.character: Character = character
         self.description = description
         self.on_change_state: callable = on_change_state
-        self.llm_caller = LLMCaller(config.llm_model) # deprecated , but keep it for now, since it is more flexible
         self.default_client = default_client
         self._state_duration:int = 0
         self.state_duration_tolerance:int = state_duration_tolerance
@@ -68,6 +76,7 @@ class BaseState:
         self.loop_duration = 0 
         self._loop_tolerance:int = loop_tolerance
         self.previous_state = previous_state        
+        self._only_waits = None
         
         self.arbitrary_obj = arbitrary_obj
         self.arbitrary_wm:dict = arbitrary_wm if arbitrary_wm is not None else dict()
@@ -119,6 +128,10 @@ class BaseState:
                                        
                     funchain.add(call, index)
                     
+    @property
+    def llm_caller(self) -> LLMCaller:
+        return get_llm_caller(config.llm_model) # deprecated , but keep it for now, since it is more flexible
+
     @property
     def next_state(self):
         # if sum(list(self.followed_states.values())) > 1:
@@ -192,6 +205,9 @@ class BaseState:
                 set_trace()
 
     def exit_state(self, **kwargs):
+        get_llm_scheduler().cancel_owner(self) # llm calls still queued or running for this state are obsolete
+        if get_decision_batcher() is not None:
+            get_decision_batcher().cancel_owner(self)
         return self.exit_state_chain.execute( obj=self, **kwargs)
 
     def post_exit(self, *args, **kwargs):
@@ -211,6 +227,44 @@ class BaseState:
         
         return return_dict
 
+    @property
+    def only_waits(self) -> bool:
+        '''
+        the update chain has no call besides the default ones and wait_aware_updates
+        '''
+        if self._only_waits is None:
+            allowed = set(self.WAITING_UPDATES) | set(self.wait_aware_updates)
+            self._only_waits = all(name in allowed for name in self.update_state_chain.function_names)
+        return self._only_waits
+
+    def ticks_to_timeout(self):
+        '''
+        ticks before update_state finds the state overdue, None when it is overdue already
+        '''
+        if self._state_duration > self.state_duration_tolerance:
+            return None
+        return self.state_duration_tolerance - self._state_duration + 1
+
+    def wait_condition(self):
+        '''
+        what the state waits on before a step can change anything, None to be stepped every tick, see app.service.wakeups.
+        by default: the main llm call is pending and no followed state is on, so the update chain only ages the state
+        and decays the emotion until the call completes, a handled server message arrives or the state times out
+        '''
+        if not self.prompt_type or any(self.followed_states.values()) or not self.only_waits:
+            return None
+        task = getattr(self, 'llm_task', None)
+        if task is None or task.done():
+            return None
+        return Wait(task=task, msg_ids=get_recieve_msg_ids(self.state_name), ticks=self.ticks_to_timeout())
+
+    def catch_up(self, ticks: int):
+        '''
+        apply the periodic effects of the ticks skipped while the character was parked, before its next step
+        '''
+        self._state_duration += ticks
+        self.character.emotion.passive_update(steps=ticks)
+
     def check_attr_chage(self):
         if any([  getattr(self.character, attr)==self.character.prev_modifiable_attr.get(attr) for attr in self.character.digital_internal_properties ]):
             self.character.prev_modifiable_attr = self.character.modifiable_status_dict
@@ -223,7 +277,7 @@ class BaseState:
             }
             msg = f"1002@{json.dumps(msg)}"
 
-            add_msg_to_send_to_game_server(msg)
+            add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
 
         return False, dict()
     
@@ -241,7 +295,7 @@ class BaseState:
     def push_msg_to_game_server(self, msg):
         msg = self.wrap_up_msg(msg)
         # print(f'push msg to game server: {msg}')
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
 
     def handle_server_attr_change_msg(self, msg):
@@ -255,7 +309,7 @@ class BaseState:
             self.handle_server_attr_change_msg(msg['msg'])
             return False, {}
 
-        if int(msg['msg_id']) == int(State2RecieveMsgId.get(self.state_name, 0)):
+        if int(msg['msg_id']) in get_recieve_msg_ids(self.state_name):
             msg = msg['msg']
             return self.handle_server_msg(msg)
         return False, dict()
@@ -277,7 +331,7 @@ class BaseState:
     def call_main_prompt(self, prompt):
         if self.prompt_type:
             self.call_llm(prompt, self.prompt_type)
-            self.llm_task.add_done_callback(lambda task: self.execute_post_llm_chain(result=task.result(), prompt_type=self.prompt_type))
+            self.llm_task.add_done_callback(self.on_llm_done)
             
         return False, dict()
         
@@ -288,6 +342,22 @@ class BaseState:
         return  False, {"prompt": prompt}
             
         
+    def on_llm_done(self, task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            # the state times out and perspects again, see state_timeout
+            LogManager.log_warning(f"[{self.character.name}] {self.state_name} llm call failed: {task.exception()!r}")
+            return
+        self.execute_post_llm_chain(result=task.result(), prompt_type=self.prompt_type)
+
+    def submit_llm(self, factory):
+        '''
+        queue an llm call of this state in the global scheduler, it is cancelled when the state exits
+        factory: lambda: <coroutine of the call>
+        '''
+        return get_llm_scheduler().submit(factory, prompt_type=self.prompt_type, owner=self)
+
     def execute_post_llm_chain(self, result, prompt_type):
         self.post_llm_call_chain.store_dict_result(result)
         success, msg = self.post_llm_call_chain.execute(result=result,
@@ -326,7 +396,11 @@ class BaseState:
         """
         Create an LLM task with a given prompt and assign a callback.
         """
-        self.llm_task = asyncio.create_task(self.character.a_process_then_reply(message=prompt, sender=self.character, restart=True, check_exempt_layers=self.prompt_class.check_exempt_layers))
+        batcher = get_decision_batcher()
+        if batcher is not None and batcher.accepts(self, prompt):
+            self.llm_task = batcher.request(self, prompt) # answered together with the same prompt type of other characters
+            return
+        self.llm_task = self.submit_llm(lambda: self.character.a_process_then_reply(message=prompt, sender=self.character, restart=True, check_exempt_layers=self.prompt_class.check_exempt_layers))
 
     def get_character_wm_by_name(self, mem_name, default=None):
         if mem_name in self.arbitrary_wm:
@@ -388,14 +462,22 @@ class BaseState:
         return False, dict()
 
     async def insert_memory_item(self, result, text=None, scale_dict=None):
-        if text is not None and scale_dict is not None and os.getenv('Milvus'):
+        if text is not None and scale_dict is not None and VECTOR_STORE:
             await self.character.longterm_memory.insert_milvus_memory(text=text, scale_dict=scale_dict)
 
     def retrieve_memory(self, obj_name, text):
         memos = []
-        if os.getenv('Milvus'):
+        if VECTOR_STORE:
             memos = self.character.longterm_memory.name_specific_memory_retrieve_from_milvus(obj_name=obj_name, query=text)
         return memos
+
+    def retrieve_memories(self, queries):
+        '''
+        queries: [(obj_name, text), ...], the texts are embedded in one batch
+        '''
+        if VECTOR_STORE and queries:
+            return self.character.longterm_memory.name_specific_memories_retrieve_from_milvus(queries)
+        return [[] for _ in queries]
    
     def passive_update(self):
         self.update_character_emotion()
@@ -434,7 +516,6 @@ class BaseState:
         return self.state_name.name
 
     def push_state_change_to_server(self, **kwargs):
-        from time import sleep
         state_name = f'{self.state_name}'.split('.')[-1]
         msg = {
             'content': f'{self.character.name} entered state {state_name}',
@@ -444,12 +525,10 @@ class BaseState:
         }
         msg = f"1002@{json.dumps(msg)}"
 
-        add_msg_to_send_to_game_server(msg)
-        sleep(3)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid, hold=3)
         return False, dict()
     
     def push_attr_change_to_server(self, **kwargs):
-        from time import sleep
         state_name = str(self.state_name).split(".")[-1]
         msg = {
             'content': f'{state_name} ends',
@@ -458,5 +537,5 @@ class BaseState:
             'display_duration': 2
         }
         msg = f"1002@{json.dumps(msg)}"
-        sleep(2)
+        display_scheduler.reserve(self.character.guid, hold=2)
         return False, dict()
\ No newline at end of file
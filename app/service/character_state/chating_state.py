@@ -77,7 +77,7 @@ class ChatingState(BaseState):
         self.character.update_system_message(self.character.system_message + f'Your current status: {self.character.internal_status}. You are chatting with {recipient.name}. Your impression of him/her is {mem_on_rec }. If you are purchasing something, calculate the final price carefully. You can not reply more than 30 words at a time.')
         
         
-        self.llm_task = asyncio.create_task(self.character.a_initiate_chat(recipient=recipient,
+        self.llm_task = self.submit_llm(lambda: self.character.a_initiate_chat(recipient=recipient,
                                             message=self.get_character_wm_by_name('init_conversation'),
                                             clear_history=True, )
                                             )
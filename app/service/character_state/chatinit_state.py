@@ -5,6 +5,7 @@ from ...constants import CharacterState, PromptType
 from ...models.character import Character, CharacterList
 from ...models.location import BuildingList
 from .register import register
+from ..wakeups import Wait
 from autogen import Agent
 
 @register(name='CHATINIT', type="state")
@@ -12,6 +13,8 @@ class ChatInitState(BaseState):
     '''
     consider how to init a conversation.
     '''
+    wait_aware_updates = ('monitor_chat_target_state',)
+
     def __init__(self, character: Character, character_list: CharacterList, building_list: BuildingList,  on_change_state, 
                  followed_states=[CharacterState.CHATING],
                  main_prompt = PromptType.CHATINIT,
@@ -58,12 +61,26 @@ class ChatInitState(BaseState):
         act_obj = self.get_character_wm_by_name('act_obj')
         agent:Character = self.get_agent_by_name(act_obj)
         if agent is not None:
-            if agent.state == CharacterState.RECEIVECHAT:
+            if getattr(agent.state, 'state_name', None) == CharacterState.RECEIVECHAT:
                 agent.working_memory.store_memory('act_obj', self.character.name)
                 self.target_agent_ready = True 
         
         return False, {}
 
+    def wait_condition(self):
+        '''
+        wait for the llm call and for the target agent to enter RECEIVECHAT, the chat starts once both are done
+        '''
+        if self.target_agent_ready or not self.only_waits:
+            return None
+        task = getattr(self, 'llm_task', None)
+        task = task if task is not None and not task.done() else None
+        act_obj = self.get_character_wm_by_name('act_obj')
+        peer = self.character_list.get_character_by_name(act_obj) if act_obj else None
+        if task is None and (peer is None or not any(self.followed_states.values())):
+            return None
+        return Wait(task=task, peer=peer, peer_state=CharacterState.RECEIVECHAT, ticks=self.ticks_to_timeout())
+
     def change_state(self, overduration):
         
         for state, ready in self.followed_states.items():
@@ -2,7 +2,6 @@ import copy
 import os
 import random
 import json
-from time import sleep
 from ...utils.gameserver_utils import add_msg_to_send_to_game_server
 from .base_state import BaseState
 from .register import register
@@ -52,7 +51,7 @@ class DrawState(BaseState):
         self.post_llm_call_chain.add(self.link_drawing_to_gallery, 1)
     
     def call_llm(self, prompt, prompt_type: PromptType):
-        self.llm_task = asyncio.create_task(self.character.drawing_agent.a_process_then_reply(message=prompt, sender=self.character.drawing_agent, restart=True)) 
+        self.llm_task = self.submit_llm(lambda: self.character.drawing_agent.a_process_then_reply(message=prompt, sender=self.character.drawing_agent, restart=True)) 
     
     def push_state_to_game_server(self, result):
         msg = {'agent_guid': self.character.guid, 'url': f"nft/{result['img_id']}.png", 'artwork_id': result['img_id']}
@@ -104,5 +103,5 @@ class DrawState(BaseState):
             'display_duration': 1000
         }
         msg = f"1002@{json.dumps(msg)}"
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
\ No newline at end of file
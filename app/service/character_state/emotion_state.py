@@ -1,6 +1,5 @@
 import random
 import json
-from time import sleep
 from ...utils.gameserver_utils import add_msg_to_send_to_game_server
 from .base_state import BaseState
 from .register import register
@@ -154,8 +153,7 @@ class EmotionState(BaseState):
             }
         msg = f"1002@{json.dumps(msg)}"
 
-        add_msg_to_send_to_game_server(msg)
-        sleep(3)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid, hold=3)
         return False, dict()
     
     def push_state_change_to_server(self, **kwargs):
@@ -168,7 +166,7 @@ class EmotionState(BaseState):
             'display_duration': 1000
         }
         msg = f"1002@{json.dumps(msg)}"
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
         
             
@@ -5,6 +5,7 @@ from .base_state import BaseState
 from .register import register
 from ...communication.websocket_server import WebSocketServer
 from ...constants import CharacterState
+from ...global_config import VECTOR_STORE
 from ...models.location import BuildingList
 from ...models.character import Character, CharacterList
 from ...constants import PromptType
@@ -59,7 +60,7 @@ class EstimateState(BaseState):
         seller = self.character.working_memory.retrieve_by_name("seller")
         query = f'[resource_id]: {resource_id}\n[seller]: {seller}\n[market_price]: {basic_price}\n[emotion]: {self.character.emotion.extreme_emotion}\n[like score]: {like_score}'
         records = []
-        if os.getenv('Milvus'):
+        if VECTOR_STORE:
             records = self.character.longterm_memory.buyer_specific_memory_retrieve_from_milvus(obj_name=self.character.name, query=query)
         else:
             # FIXME: remove records ref below
@@ -1,9 +1,8 @@
 import os
 import random
 import json
-from time import sleep
 from ...utils.gameserver_utils import add_msg_to_send_to_game_server
-from ...constants import State2RecieveMsgId
+from ...constants import State2RecieveMsgId, get_recieve_msg_ids
 from .base_state import BaseState
 from .register import register
 from ...communication.websocket_server import WebSocketServer
@@ -11,6 +10,7 @@ from ...constants import CharacterState
 from ...models.location import BuildingList, Building
 from ...models.character import Character, CharacterList
 from ...utils.log import LogManager
+from ..wakeups import Wait
 
 @register(name='MOVE', type="state")
 class MoveState(BaseState):
@@ -136,6 +136,20 @@ class MoveState(BaseState):
         self.character.satiety = max(0, self.character.satiety)
         return super().passive_update()
     
+    def wait_condition(self):
+        '''
+        walking: nothing to do until the game server reports the arrival (2001)
+        '''
+        if self.prompt_type or not self.is_moving:
+            return super().wait_condition()
+        if any(self.followed_states.values()) or not self.only_waits:
+            return None
+        return Wait(msg_ids=get_recieve_msg_ids(self.state_name))
+
+    def catch_up(self, ticks: int):
+        self.character.satiety = max(0, self.character.satiety - 0.1 * self.character.satiety_decay_rate * ticks)
+        super().catch_up(ticks)
+
     def reset_ismoving(self):
         self.is_moving = False
         return False, dict()
@@ -166,8 +180,7 @@ class MoveState(BaseState):
                 }
             msg = f"1002@{json.dumps(msg)}"
 
-            add_msg_to_send_to_game_server(msg)
-            sleep(3)
+            add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid, hold=3)
         return False, dict()
     
     
\ No newline at end of file
@@ -4,6 +4,7 @@ import os
 from .base_state import BaseState
 from .register import register
 from ...constants import CharacterState, PromptType
+from ...global_config import VECTOR_STORE
 from ...models.location import BuildingList
 from ...models.character import Character, CharacterList
 
@@ -87,6 +88,9 @@ class PerspectState(BaseState):
     def retrieve_knowledge(self, external_obs):
         # TODO retrieve more relevant knowledge
         knowledge_dict = {}
+        observed = [ (main_k, k, v) for main_k, main_v in external_obs.items() if main_k in ['building', 'people'] #{building: {name: obs}}
+                        for k, v in main_v.items() ] # {name: obs}
+        memos_ls = iter(self.retrieve_memories([ (k, v) for _, k, v in observed ]))
         for main_k, main_v in external_obs.items(): 
             #{building: {name: obs}}
             if main_k in ['building', 'people']:
@@ -94,7 +98,7 @@ class PerspectState(BaseState):
                 for k, v in main_v.items():
                     # {name: obs}
                     knowledge = self.character.longterm_memory.get_memory(main_k,k)
-                    memos = self.retrieve_memory(obj_name=k, text=v)  
+                    memos = next(memos_ls)
                     ttl_mem = knowledge + memos
                     knowledge_dict[main_k][k] = ttl_mem if ttl_mem else None
         
@@ -211,7 +215,7 @@ class PerspectState(BaseState):
             return self.turn_on_states(CharacterState.PLAN)
         
     def store_memory(self, result, text=None, scale_dict=None):
-        if os.getenv('Milvus') :
+        if VECTOR_STORE :
             for aspect, disc_ls in result.items():
                 for disc in disc_ls: 
                     assert 'difference_level' in disc, 'difference_level is not in the dict, your dict is: ' + str(disc)
@@ -229,7 +233,6 @@ class PerspectState(BaseState):
     
     def push_attr_change_to_server(self, **kwargs):
         import json
-        from time import sleep
         from ...utils.gameserver_utils import add_msg_to_send_to_game_server
         if "monologue_understanding" in self.character.inner_monologue.content:
             msg = {
@@ -241,8 +244,7 @@ class PerspectState(BaseState):
             
             msg = f"1002@{json.dumps(msg)}"
 
-            add_msg_to_send_to_game_server(msg)
-            sleep(3)
+            add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid, hold=3)
         return super().push_attr_change_to_server(**kwargs)
     
     def push_state_change_to_server(self, **kwargs):
@@ -257,6 +259,6 @@ class PerspectState(BaseState):
         }
         msg = f"1002@{json.dumps(msg)}"
 
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
         
\ No newline at end of file
@@ -64,7 +64,6 @@ class PlanState(BaseState):
     
     def push_attr_change_to_server(self, **kwargs):
         import json
-        from time import sleep
         from ...utils.gameserver_utils import add_msg_to_send_to_game_server
         if "monologue_plan" in self.character.inner_monologue.content.keys():
             msg = {
@@ -82,8 +81,7 @@ class PlanState(BaseState):
             }
         msg = f"1002@{json.dumps(msg)}"
 
-        add_msg_to_send_to_game_server(msg)
-        sleep(3)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid, hold=3)
         return super().push_attr_change_to_server()
     
     def push_state_change_to_server(self, **kwargs):
@@ -98,5 +96,5 @@ class PlanState(BaseState):
         }
         msg = f"1002@{json.dumps(msg)}"
 
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
\ No newline at end of file
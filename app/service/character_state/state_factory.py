@@ -1,5 +1,11 @@
+import inspect
+from collections.abc import MutableMapping
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Callable
 
+from config.config_common import CommonConfig
+
 from . import FuncName2Registered, PromptName2Registered, StateName2Registered
 from .act_state import ActState
 from .base_state import BaseState
@@ -16,11 +22,111 @@ from .bargain_state import BargainState
 from .emotion_state import EmotionState
 from .summarize_state import SummarizeState
 from .estimate_state import EstimateState
-from ...constants.character_state import CharacterState
+from ...constants.character_state import CharacterState, StateName2State
 from ...models.location import BuildingList
 from ...models.character import Character, CharacterList
 
 
+class StateTemplate:
+    '''
+    what every character shares for a state of the config: the class, its keyword arguments (read only) and the
+    state name, resolved once. the state of a character is built from it the first time it is used
+    '''
+    __slots__ = ('state_name', 'cls', 'kwargs')
+
+    def __init__(self, cls, kwargs=None, state_name=None):
+        self.cls = cls
+        self.kwargs = MappingProxyType(dict(kwargs or {}))
+        state_name = self.kwargs.get('state_name', default_state_name(cls) or state_name)
+        self.state_name = StateName2State[state_name] if type(state_name) is str else state_name
+
+    def build(self, character, character_list, building_list, change_state_callback) -> BaseState:
+        state = self.cls(character, character_list, building_list, change_state_callback, **self.kwargs)
+        assert state.state_name == self.state_name, f'{self.cls.__name__} is configured as {self.state_name} but named itself {state.state_name}'
+        return state
+
+
+@lru_cache(maxsize=None)
+def default_state_name(cls):
+    parameter = inspect.signature(cls.__init__).parameters.get('state_name')
+    return None if parameter is None or parameter.default is inspect.Parameter.empty else parameter.default
+
+
+class LazyStates(MutableMapping):
+    '''
+    state name -> state of one character, a state is built on first access (change_state_by_enum),
+    so the states a character never enters cost nothing. `in`, keys() and len() do not build states,
+    values() and items() build all of them
+    '''
+    def __init__(self, templates, character, character_list, building_list, change_state_callback):
+        self._templates: dict = {template.state_name: template for template in templates}
+        self._states: dict = {}
+        self._build_args = (character, character_list, building_list, change_state_callback)
+
+    def __getitem__(self, state_name):
+        state = self._states.get(state_name)
+        if state is None:
+            state = self._states[state_name] = self._templates[state_name].build(*self._build_args)
+        return state
+
+    def __setitem__(self, state_name, state):
+        self._states[state_name] = state
+
+    def __delitem__(self, state_name):
+        self._templates.pop(state_name, None)
+        del self._states[state_name]
+
+    def __contains__(self, state_name):
+        return state_name in self._templates or state_name in self._states
+
+    def __iter__(self):
+        yield from self._templates
+        yield from (state_name for state_name in self._states if state_name not in self._templates)
+
+    def __len__(self):
+        return len(self._templates) + sum(1 for state_name in self._states if state_name not in self._templates)
+
+    @property
+    def built(self) -> int:
+        return len(self._states)
+
+
+_state_templates: dict = {} # id(state_config) -> (state_config, templates)
+_validated_templates: set = set() # id of the template lists built for a character once
+
+
+def get_state_templates(state_config: dict) -> list:
+    '''
+    templates of a state config, built once and shared by all the characters using the config
+    '''
+    cached = _state_templates.get(id(state_config))
+    if cached is None or cached[0] is not state_config:
+        cached = _state_templates[id(state_config)] = (
+            state_config, [StateTemplate(StateName2Registered[state], cfg, state_name=state) for state, cfg in state_config.items()])
+    return cached[1]
+
+
+@lru_cache(maxsize=None)
+def default_state_templates() -> tuple:
+    state_classes = {
+        CharacterState.IDLE: IdleState,
+        CharacterState.PLAN: PlanState,
+        CharacterState.PERSPQ: PerspectQuestionState,
+        CharacterState.PERSPA: PerspectAnsState,
+        CharacterState.MOVE: MoveState,
+        CharacterState.ACT: ActState,
+        CharacterState.CRITIC: CriticState,
+        CharacterState.DRAWINIT: DrawInitState,
+        CharacterState.DRAW: DrawState,
+        CharacterState.APPRECIATE: AppreciateState,
+        CharacterState.EMOTION: EmotionState,
+        CharacterState.BARGAIN: BargainState,
+        CharacterState.SUM: SummarizeState,
+        CharacterState.ESTIMATE: EstimateState,
+    }
+    return tuple(StateTemplate(cls, state_name=state) for state, cls in state_classes.items())
+
+
 def get_initialized_states(
         character: Character,
         character_list: CharacterList,
@@ -32,32 +138,17 @@ def get_initialized_states(
     """
     Initializes the states for a given character.
     change_state_callback: callback to change character state. By default: StateManager.change_state_by_enum
+    with CommonConfig.lazy_states the states are built on first use, see LazyStates, except for the first character
+    of a config: it builds all of them, so a mistake in the config (unregistered calls, bad followed_states,
+    misnamed states) fails at startup instead of the first time a character enters the state
     """
+    templates = default_state_templates() if state_config is None else get_state_templates(state_config)
 
-    if state_config is None:
-        state_classes = {
-            CharacterState.IDLE: IdleState,
-            CharacterState.PLAN: PlanState,
-            CharacterState.PERSPQ: PerspectQuestionState,
-            CharacterState.PERSPA: PerspectAnsState,
-            CharacterState.MOVE: MoveState,
-            CharacterState.ACT: ActState,
-            CharacterState.CRITIC: CriticState,
-            CharacterState.DRAWINIT: DrawInitState,
-            CharacterState.DRAW: DrawState,
-            CharacterState.APPRECIATE: AppreciateState,
-            CharacterState.EMOTION: EmotionState,
-            CharacterState.BARGAIN: BargainState,
-            CharacterState.SUM: SummarizeState,
-            CharacterState.ESTIMATE: EstimateState,
-        }
-
-
-        state_dict= {state: cls(character, character_list, building_list, change_state_callback) for state, cls in
-                state_classes.items()}
-    else:
-        states:list[BaseState] = [ StateName2Registered[state](character, character_list, building_list, change_state_callback, **cfg) for state, cfg in state_config.items()]
-        state_dict = { state.state_name: state for state in states}
-        
-
+    state_dict = LazyStates(templates, character, character_list, building_list, change_state_callback)
+    if not CommonConfig.lazy_states:
+        return {state_name: state_dict[state_name] for state_name in state_dict}
+    if id(templates) not in _validated_templates:
+        for state_name in state_dict:
+            state_dict[state_name] # built and kept for this character
+        _validated_templates.add(id(templates))
     return state_dict
@@ -1,38 +1,24 @@
+from collections import deque
 from queue import Queue
 from .base_state import BaseState
 from .state_factory import get_initialized_states
 from ...constants.character_state import CharacterState, get_state_name
 
 
-class LengthLimitedList(list):
-    def __init__(self, limit, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.limit = limit
-
-    def append(self, item):
-        super().append(item)
-        while len(self) > self.limit:
-            self.pop(0)
-
-    def extend(self, iterable):
-        super().extend(iterable)
-        while len(self) > self.limit:
-            self.pop(0)
-
-    def insert(self, index, item):
-        if len(self) < self.limit or index < self.limit:
-            super().insert(index, item)
-        while len(self) > self.limit:
-            self.pop(0)
-
 class StateManager:
-    def __init__(self, character, character_list, building_list, state_config: dict, init_state=None):
+    def __init__(self, character, character_list, building_list, state_config: dict, init_state=None, history_limit=999, inbox_limit=100):
         '''
         update -> change state -> exist state -> enter state
+        inbox: the server messages routed to the character (see app.service.inbound), one is handed to each step
+        previous_states: the last history_limit exited states, the oldest dropped in O(1)
+        decaying_states: the exits whose state still decays, each calls post_exit once per transition and is dropped
+            once the loop_duration of its state is below 0, so a transition costs the live exits, not the history
         '''
         self.character = character
         self.current_state = None
-        self.previous_states:LengthLimitedList[BaseState] = LengthLimitedList(limit=999)
+        self.previous_states: deque[BaseState] = deque(maxlen=history_limit)
+        self.decaying_states: list[BaseState] = []
+        self.inbox: deque[dict] = deque(maxlen=inbox_limit)
         self.state_config = state_config
         self.states: dict[CharacterState, BaseState] = \
             get_initialized_states(character, character_list, building_list,
@@ -52,10 +38,12 @@ class StateManager:
         post exist process, 
         """
         # handing overloop
-        for state in self.previous_states:
+        decaying = []
+        for state in self.decaying_states:
             state.post_exit()
-            if state.loop_duration < 0:
-                self.previous_states.remove(state)
+            if state.loop_duration >= 0:
+                decaying.append(state)
+        self.decaying_states = decaying
 
     def change_state(self, new_state: BaseState):
         self.post_process()
@@ -63,6 +51,7 @@ class StateManager:
         if self.current_state:
             self.current_state.exit_state()
             self.previous_states.append(self.current_state)
+            self.decaying_states.append(self.current_state)
         self.current_state = new_state
         prev_state = self.previous_states[-1].state_name if len(self.previous_states) > 0 else None
         self.current_state.set_previous_state(prev_state) # TODO: cls to str
@@ -71,13 +60,18 @@ class StateManager:
     def add_state(self, state_name, state_obj):
         self.states[state_name] = state_obj
 
-    def update_state(self, *args, **kwargs):
+    def update_state(self, *args, skipped=0, **kwargs):
+        '''
+        skipped: ticks the character was parked by the wakeup scheduler, caught up before the step
+        '''
         if self.current_state: # check overlooped circle
             print(f"{self.character.name} update state: {self.current_state.__class__.__name__}")
+            if skipped:
+                self.current_state.catch_up(skipped)
             try:
                 self.current_state.update_state(*args, **kwargs)
             except RecursionError:
-                raise RecursionError(f'{self.current_state} is over looped, the circle is {self.previous_states}')
+                raise RecursionError(f'{self.current_state} is over looped, the circle is {list(self.previous_states)[-20:]}')
                 
 
     def change_state_callback(self, next_state: CharacterState):
@@ -116,5 +116,5 @@ class SummarizeState(BaseState):
             'display_duration': 1000
         }
         msg = f"1002@{json.dumps(msg)}"
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
\ No newline at end of file
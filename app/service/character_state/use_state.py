@@ -1,7 +1,6 @@
 import asyncio
 import json
 
-from time import sleep
 from ...utils.gameserver_utils import add_msg_to_send_to_game_server
 from .base_state import BaseState
 from ...constants import PromptType
@@ -74,7 +73,7 @@ class UseState(BaseState):
             You are operating {in_bldng_equip.name} in this building. If you want to stop, please say "TERMINATE" ')
         building.update_system_message(building.system_message + f' {self.character.name} is using {in_bldng_equip.name} in this building. \
                                        The characteristics of him/her is {self.character.internal_status } .') 
-        self.llm_task = asyncio.create_task( building.a_initiate_chat(recipient=self.character,
+        self.llm_task = self.submit_llm(lambda: building.a_initiate_chat(recipient=self.character,
                                             message = f'{init_message}, your are in {building.description}', 
                                            clear_history=True, )
                                             )
@@ -106,8 +105,7 @@ class UseState(BaseState):
         }
         msg = f"1002@{json.dumps(msg)}"
 
-        add_msg_to_send_to_game_server(msg)
-        sleep(3)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid, hold=3)
         return super().push_attr_change_to_server()
     
     def push_state_change_to_server(self, **kwargs):
@@ -121,5 +119,5 @@ class UseState(BaseState):
             'display_duration': 1000
         }
         msg = f"1002@{json.dumps(msg)}"
-        add_msg_to_send_to_game_server(msg)
+        add_msg_to_send_to_game_server(msg, agent_guid=self.character.guid)
         return False, dict()
\ No newline at end of file
@@ -0,0 +1,73 @@
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from ..constants.msg_id import AllStateMsg, get_recieve_msg_ids
+from ..utils.log import LogManager
+
+
+class InboundDispatcher:
+    '''
+    routes the server messages of a tick to the characters, each message is parsed once:
+    - a message with an agent_guid is indexed by (agent_guid, msg_id) and goes to that agent only
+    - a message without agent_guid is indexed by msg_id and goes to every character whose state receives the id
+    - an AllStateMsg goes to every character
+    the messages of a character are looked up by its guid and the ids of its current state (get_recieve_msg_ids,
+    a state may receive several ids), in the order the server sent them, see messages_for
+    '''
+    def __init__(self):
+        self._addressed: Dict[Tuple[int, int], List[Tuple[int, dict]]] = defaultdict(list)
+        self._unaddressed: Dict[int, List[Tuple[int, dict]]] = defaultdict(list)
+        self._all_state: List[Tuple[int, dict]] = []
+        self.msg_ids = set() # ids received this tick
+        self.received = 0
+        self.delivered = 0
+        self.malformed = 0
+
+    def index(self, msgs: Iterable[dict]):
+        '''
+        replace the messages of the previous tick by msgs
+        '''
+        self._addressed.clear()
+        self._unaddressed.clear()
+        self._all_state = []
+        self.msg_ids = set()
+        for seq, msg in enumerate(msgs):
+            self.received += 1
+            try:
+                msg_id = int(msg['msg_id'])
+                content = json.loads(msg['msg']) if isinstance(msg['msg'], (str, bytes)) else msg['msg']
+                agent_guid = content.get('agent_guid') if isinstance(content, dict) else None
+                agent_guid = int(agent_guid) if agent_guid is not None else None
+            except (KeyError, TypeError, ValueError) as e:
+                self.malformed += 1
+                LogManager.log_warning(f"[InboundDispatcher]: dropped malformed server msg {msg!r}: {e!r}")
+                continue
+            self.msg_ids.add(msg_id)
+            if msg_id in AllStateMsg:
+                self._all_state.append((seq, msg))
+            elif agent_guid is None:
+                self._unaddressed[msg_id].append((seq, msg))
+            else:
+                self._addressed[(agent_guid, msg_id)].append((seq, msg))
+
+    def messages_for(self, agent_guid: int, state_name) -> List[dict]:
+        '''
+        the messages of this tick for a character in the state state_name
+        '''
+        found = list(self._all_state)
+        for msg_id in get_recieve_msg_ids(state_name):
+            found += self._addressed.get((int(agent_guid), msg_id), ())
+            found += self._unaddressed.get(msg_id, ())
+        if len(found) > 1:
+            found.sort(key=lambda item: item[0])
+        self.delivered += len(found)
+        return [msg for _, msg in found]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'received': self.received,
+            'delivered': self.delivered,
+            'malformed': self.malformed,
+        }
+
@@ -1,5 +1,6 @@
 import asyncio
 import copy
+from functools import partial
 import os
 from pathlib import Path
 import queue
@@ -9,20 +10,35 @@ import random
 from multiprocessing import Pool
 import yaml
 from autogen import config_list_from_json, filter_config
-from app.constants.msg_id import State2RecieveMsgId, AllStateMsg
 
-from app.utils.load_oai_config import build_runtime_apis_file
+from app.llm.key_router import init_key_router, get_key_router
+from app.llm.mock_server import start_configured_mock_server
+from app.llm.scheduler import get_llm_scheduler
 from config import building_data_table, character_data_table, city_status, boss_data_table, interactable_equipments_data_table, cheap_apis, official_apis, cfg_tmplt
 from config.config_common import CommonConfig
+from .character_state import PromptName2Registered
 from .character_state.state_manager import StateManager
 from .database import SessionLocal
+from ..database.milvus_datastore import MilvusDataStore
+from ..database.vector_store import NumpyVectorStore
+from .inbound import InboundDispatcher
+from .tick_engine import TickEngine
+from .wakeups import get_wakeup_scheduler, get_wakeup_stats
 from ..communication.websocket_server import WebSocketServer
 from ..constants.character_state import CharacterState
 from ..models.building import Building, BuildingList, InBuildingEquip
 from ..models.character import Character, CharacterList
 from ..models.boss_agent import Boss
+from ..models.conversation import get_conversation_stats, get_conversation_store
 # from ..models.trader_agent import Trader
 from ..utils.log import LogManager
+from ..llm.embedding_service import get_embedding_stats
+from ..llm.response_cache import get_response_cache_stats
+from ..llm.batcher import get_batcher_stats
+from ..llm.response_parser import get_parser_stats
+from ..llm.usage import get_llm_usage
+from ..llm.prompt.context import get_context_stats
+from ..llm.prompt.template import validate_prompt_templates
 from ..utils.gameserver_utils import server_msg_queue
 from ..utils import globals
 from ..models.agent_creation import AgentCreation
@@ -58,15 +74,19 @@ class Simulation:
         assert 'States' in self.configs
 
         self.configs.update(self.load_llm_config())
+        self.tick_engine = TickEngine(ordering=CommonConfig.tick_ordering,
+                                      char_budget=CommonConfig.character_tick_budget,
+                                      tick_budget=CommonConfig.update_interval)
+        self.inbound = InboundDispatcher()
         
         LogManager.setup_logger()
 
     @staticmethod
     def load_llm_config():
+        start_configured_mock_server() # MOCK_LLM=inprocess
         assert len(cheap_apis) > 0
         assert len(official_apis) > 0
-        build_runtime_apis_file(cheap_apis, 'runtime/cheap_apis.json')
-        build_runtime_apis_file(official_apis, 'runtime/official_apis.json')
+        init_key_router(cheap_apis, official_apis, cfg_tmplt)
         
         char_llm_cfgs, bldg_llm_cfgs = [], []
         assert len(cheap_apis) >= len(official_apis)
@@ -154,10 +174,18 @@ class Simulation:
             self.character_state_managers[character.name] = StateManager(character, self.character_list,
                                                                          self.building_list,
                                                                          state_config=state_config)
+        # compile all prompt templates now, a broken prompt fails the start instead of the first call
+        validate_prompt_templates(PromptName2Registered,
+                                  character=self.character_list.characters[0] if self.character_list.characters else None)
 
-    def load_frontend_data_from_json(self, json_data):
-        map_info = json.load(open('config/city_status.json', 'r'))
-        terrain = np.array(map_info['terrain_data']['data'])
+    def load_frontend_data_from_json(self, json_data, terrain=None, max_characters=CommonConfig.max_characters):
+        '''
+        terrain: walkable map of the buildings, read from config/city_status.json when not given
+        max_characters: characters of json_data that are loaded, None loads all
+        '''
+        if terrain is None:
+            map_info = json.load(open('config/city_status.json', 'r'))
+            terrain = np.array(map_info['terrain_data']['data'])
         self.building_list = BuildingList()
         self.character_list = CharacterList()
         self.total_update_count = 0
@@ -184,7 +212,7 @@ class Simulation:
                     break
             assert added2building, f'Equipment {equip_dic["name"]} not added to any building'
         
-        for i, character in tqdm(enumerate(json_data['characters'][:5])):
+        for i, character in tqdm(enumerate(json_data['characters'][:max_characters])):
             index = i % len(self.configs['char_llm_cfg'])
             agent = Character.decode_from_json(llm_cfg=self.configs['char_llm_cfg'][index], **character)
             if CommonConfig.load_from is not None and os.path.exists(CommonConfig.load_from):
@@ -310,43 +338,40 @@ class Simulation:
 
         return msgs
     
-    def filter_out_msg(self, server_msgs, state_manager):
-        state_name = state_manager.current_state.state_name
-        character_guid = state_manager.character.guid
-        server_msg = None
-        for msg in server_msgs:
-            content = json.loads(msg['msg'])
-            try:
-                if int(msg['msg_id']) == int(State2RecieveMsgId.get(state_name, 0)):
-                    if 'agent_guid' in content :
-                        if int(content.get('agent_guid', 0)) == int(character_guid):
-                            server_msg = msg 
-                    else:
-                        server_msg = msg
-                    break # only handle the first msg for now, TODO: handle all msgs
-                elif int(msg['msg_id']) in AllStateMsg :
-                    server_msg = msg
-                    break
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-                __import__('ipdb').set_trace()
-        return server_msg        
-    
-    def update_state(self):
+    async def update_state(self):
         if not self.started:
             server_msgs = self.handle_server_msg() # load the city
         if self.newday_countdown > 0:
             server_msgs = self.handle_server_msg()
+            date = self.transform_date()
+            globals.update_date_num(date)
+            
+            # barrier before the tick: everything shared is resolved here, characters only touch themselves
+            steps = {}
+            wakeups = get_wakeup_scheduler()
+            self.inbound.index(server_msgs)
+            build_new_agent = 2008 in self.inbound.msg_ids
+            for name, state_manager in list(self.character_state_managers.items()):
+                state_manager.inbox.extend(self.inbound.messages_for(state_manager.character.guid,
+                                                                     state_manager.current_state.state_name))
+                skipped = wakeups.wake(name, state_manager, state_manager.inbox, self.total_update_count) if wakeups else 0
+                if skipped is None: # parked, the date is the only thing its update chain would change
+                    state_manager.character.change_date(date)
+                    state_manager.inbox.clear() # none of them is handled by the waiting state
+                    continue
+                server_msg = state_manager.inbox.popleft() if state_manager.inbox else None
+                steps[name] = partial(state_manager.update_state, msg=server_msg, date=date, skipped=skipped)
+            if build_new_agent:
+                AgentCreation.build_new_agent()
             
-            for state_manager in self.character_state_managers.values():
-                
-                server_msg = self.filter_out_msg(server_msgs, state_manager)
-                date = self.transform_date()
-                globals.update_date_num(date)
-                if server_msg and int(server_msg.get('msg_id', 0)) == 2008:
-                    AgentCreation.build_new_agent()
-                state_manager.update_state(msg=server_msg, date=date)
+            await self.tick_engine.run(steps)
+            if wakeups:
+                for name in steps:
+                    wakeups.park(name, self.character_state_managers[name], self.total_update_count)
+            LogManager.flush_char_attrs()
+            await asyncio.get_running_loop().run_in_executor(None, MilvusDataStore.flush_due)
+            get_llm_usage().maybe_write_summary()
+            get_conversation_store().summarize_due()
 
             self.total_update_count += 1
             self.newday_countdown -= 0 if os.getenv("DEBUG") else 1
@@ -354,6 +379,32 @@ class Simulation:
             
             if self.total_update_count % 100  == 0:
                 self.save_state()
+                NumpyVectorStore.flush_all()
+                LogManager.log_info(f"tick stats: {self.tick_engine.stats.summary()}")
+                LogManager.log_info(f"inbound msg stats: {self.inbound.stats()}")
+                wakeup_stats = get_wakeup_stats()
+                if wakeup_stats is not None:
+                    LogManager.log_info(f"wakeup stats: {wakeup_stats}")
+                embedding_stats = get_embedding_stats()
+                if embedding_stats is not None:
+                    LogManager.log_info(f"embedding stats: {embedding_stats}")
+                LogManager.log_info(f"llm scheduler stats: {get_llm_scheduler().stats()}")
+                if get_key_router() is not None:
+                    LogManager.log_info(f"api key stats: {get_key_router().stats()}")
+                response_cache_stats = get_response_cache_stats()
+                if response_cache_stats is not None:
+                    LogManager.log_info(f"llm response cache stats: {response_cache_stats}")
+                LogManager.log_info(f"llm response parser stats: {get_parser_stats()}")
+                conversation_stats = get_conversation_stats()
+                if conversation_stats is not None:
+                    LogManager.log_info(f"conversation stats: {conversation_stats}")
+                batcher_stats = get_batcher_stats()
+                if batcher_stats is not None:
+                    LogManager.log_info(f"llm batcher stats: {batcher_stats}")
+                context_stats = get_context_stats()
+                if context_stats is not None:
+                    LogManager.log_info(f"prompt context stats: {context_stats}")
+                LogManager.log_info(f"llm usage by state: {get_llm_usage().query(group_by=('state', 'prompt_type'), top=10)}")
             # if self.total_update_count % 25 == 0:
             #     self.market_update()
             
@@ -0,0 +1,132 @@
+import asyncio
+import inspect
+import os
+import time
+import traceback
+from collections import defaultdict, deque
+from typing import Callable, Dict, Optional
+
+from ..utils.log import LogManager
+
+
+class TickStats:
+    '''
+    wall time of the recent ticks and of each character inside them
+    '''
+    def __init__(self, history: int = 200):
+        self.history = history
+        self.tick_count = 0
+        self.tick_durations = deque(maxlen=history)
+        self.char_durations: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.history))
+        self.over_budget: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.last_tick: Dict[str, float] = {}
+
+    def record_character(self, name: str, duration: float, budget: Optional[float] = None):
+        self.char_durations[name].append(duration)
+        self.last_tick[name] = duration
+        if budget is not None and duration > budget:
+            self.over_budget[name] += 1
+
+    def record_tick(self, duration: float):
+        self.tick_count += 1
+        self.tick_durations.append(duration)
+
+    @staticmethod
+    def percentile(values, pct: float) -> float:
+        if not values:
+            return 0.
+        ordered = sorted(values)
+        idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+        return ordered[idx]
+
+    def slowest_characters(self, top_k: int = 5):
+        avg = {name: sum(d) / len(d) for name, d in self.char_durations.items() if d}
+        return sorted(avg.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+    def summary(self) -> dict:
+        return {
+            'ticks': self.tick_count,
+            'tick_p50': self.percentile(self.tick_durations, 50),
+            'tick_p99': self.percentile(self.tick_durations, 99),
+            'tick_max': max(self.tick_durations, default=0.),
+            'slowest_characters': self.slowest_characters(),
+            'over_budget': dict(self.over_budget),
+            'errors': dict(self.errors),
+        }
+
+
+class TickEngine:
+    '''
+    run the update of every character of one tick as an independent asyncio task.
+
+    ordering policy:
+        CONCURRENT: all characters are stepped in their own tasks and joined at the end of the tick (barrier).
+                    A step is synchronous code, so it is never interleaved with another character's step;
+                    between two steps the loop serves finished LLM calls, display timers, etc.
+        SERIAL: characters are stepped one after another in the given order, still yielding to the loop in between.
+    Shared simulation state (server messages, date, agent creation, checkpoints) must be prepared before
+    run() or applied after it, never inside a character step.
+    '''
+    CONCURRENT, SERIAL = 'concurrent', 'serial'
+
+    def __init__(self, ordering: str = CONCURRENT, char_budget: Optional[float] = None,
+                 tick_budget: Optional[float] = None, max_concurrency: Optional[int] = None, history: int = 200):
+        assert ordering in [self.CONCURRENT, self.SERIAL], f'ordering should be {self.CONCURRENT} or {self.SERIAL}, got {ordering}'
+        self.ordering = ordering
+        self.char_budget = char_budget
+        self.tick_budget = tick_budget
+        self.max_concurrency = max_concurrency
+        self.stats = TickStats(history)
+
+    async def _step(self, name: str, step: Callable, semaphore: Optional[asyncio.Semaphore]):
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            await asyncio.sleep(0) # let pending callbacks run before this character
+            start = time.perf_counter()
+            try:
+                res = step()
+                if inspect.isawaitable(res):
+                    await res
+            finally:
+                self.stats.record_character(name, time.perf_counter() - start, self.char_budget)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    async def run(self, steps: Dict[str, Callable]) -> Dict[str, BaseException]:
+        '''
+        steps: {character name: callable doing the update of the character}
+        return the exceptions raised by the failed characters, the others are not affected
+        '''
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else None
+        names = list(steps.keys())
+        if self.ordering == self.CONCURRENT:
+            results = await asyncio.gather(*[self._step(name, steps[name], semaphore) for name in names],
+                                           return_exceptions=True)
+        else:
+            results = []
+            for name in names:
+                try:
+                    results.append(await self._step(name, steps[name], None))
+                except Exception as e:
+                    results.append(e)
+
+        errors = {}
+        for name, res in zip(names, results):
+            if isinstance(res, BaseException):
+                errors[name] = res
+                self.stats.errors[name] += 1
+                LogManager.log_error(f'[TickEngine] update of {name} failed: {res}')
+                traceback.print_exception(type(res), res, res.__traceback__)
+                if os.getenv('DEBUG'):
+                    __import__('ipdb').set_trace()
+
+        duration = time.perf_counter() - start
+        self.stats.record_tick(duration)
+        if self.tick_budget is not None and duration > self.tick_budget:
+            LogManager.log_warning(f'[TickEngine] tick {self.stats.tick_count} took {duration:.3f}s, '
+                                   f'budget {self.tick_budget}s, slowest: {self.stats.slowest_characters(3)}')
+        return errors
@@ -0,0 +1,132 @@
+import asyncio
+from typing import Any, Dict, Iterable, Optional
+
+from ..constants.character_state import CharacterState
+
+ATTR_CHANGE_MSG_ID = 2003 # SERVER_MSG_AGENT_ATTR_CHANGE, handled by every state, see BaseState.monitor_server_msg
+
+
+class Wait:
+    '''
+    what a parked state waits on, any of them wakes it:
+    task: an llm call (asyncio future) that completes
+    msg_ids: a server message of one of these ids for the character
+    peer, peer_state: another agent entering a state
+    ticks: the number of ticks after which it is stepped anyway, e.g. its state_timeout
+    '''
+    __slots__ = ('task', 'msg_ids', 'peer', 'peer_state', 'ticks')
+
+    def __init__(self, task: Optional[asyncio.Future] = None, msg_ids: Iterable[int] = (), peer: Any = None,
+                 peer_state: CharacterState = None, ticks: Optional[int] = None):
+        self.task = task
+        self.msg_ids = frozenset(int(i) for i in msg_ids) | {ATTR_CHANGE_MSG_ID}
+        self.peer = peer
+        self.peer_state = peer_state
+        self.ticks = ticks
+
+    def __repr__(self) -> str:
+        return f'Wait(task={self.task is not None}, msg_ids={sorted(self.msg_ids)}, peer={getattr(self.peer, "name", None)}, ticks={self.ticks})'
+
+
+class Parked:
+    __slots__ = ('state', 'wait', 'tick', 'until', 'followed_on')
+
+    def __init__(self, state, wait: Wait, tick: int):
+        self.state = state
+        self.wait = wait
+        self.tick = tick
+        self.followed_on = any(state.followed_states.values())
+        self.until = tick + wait.ticks if wait.ticks is not None else None
+
+
+class WakeupScheduler:
+    '''
+    characters whose state only waits (an llm call, a server message, a peer, a timeout) are not stepped:
+    after its step, a character is parked with the Wait returned by current_state.wait_condition() (None keeps it
+    stepped every tick), and at the barrier of the next ticks wake() checks the wait in O(1) instead of running
+    the update chain. a woken character is stepped with the number of ticks it skipped, so that the state
+    catches up on its periodic effects (duration, emotion decay, ...) at once, see BaseState.catch_up.
+    a parked character is also woken when its state changed or a followed state was turned on meanwhile
+    (e.g. by the done callback of its llm call).
+    '''
+    def __init__(self):
+        self._parked: Dict[str, Parked] = {}
+        self.steps = 0
+        self.skipped = 0
+        self.wakeups: Dict[str, int] = {'task': 0, 'msg': 0, 'peer': 0, 'timeout': 0, 'state': 0}
+
+    def wake(self, name: str, state_manager, msgs: Iterable[dict], tick: int) -> Optional[int]:
+        '''
+        msgs: the server messages queued for the character
+        None when the character stays parked this tick, otherwise the ticks it skipped since its last step
+        '''
+        parked = self._parked.get(name)
+        if parked is None:
+            self.steps += 1
+            return 0
+        reason = self._reason(parked, state_manager, msgs, tick)
+        if reason is None:
+            self.skipped += 1
+            return None
+        del self._parked[name]
+        self.wakeups[reason] += 1
+        self.steps += 1
+        return tick - parked.tick - 1
+
+    @staticmethod
+    def _reason(parked: Parked, state_manager, msgs: Iterable[dict], tick: int) -> Optional[str]:
+        state, wait = parked.state, parked.wait
+        if state_manager.current_state is not state or (not parked.followed_on and any(state.followed_states.values())):
+            return 'state'
+        if wait.task is not None and wait.task.done():
+            return 'task'
+        if any(int(msg['msg_id']) in wait.msg_ids for msg in msgs):
+            return 'msg'
+        if wait.peer is not None and getattr(wait.peer.state, 'state_name', wait.peer.state) == wait.peer_state:
+            return 'peer'
+        if parked.until is not None and tick >= parked.until:
+            return 'timeout'
+        return None
+
+    def park(self, name: str, state_manager, tick: int):
+        '''
+        after the step of tick, park the character if its state declares a wait
+        '''
+        state = state_manager.current_state
+        wait = state.wait_condition() if state is not None else None
+        if wait is None:
+            self._parked.pop(name, None)
+        else:
+            self._parked[name] = Parked(state, wait, tick)
+
+    def forget(self, name: str):
+        self._parked.pop(name, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'parked': len(self._parked),
+            'steps': self.steps,
+            'skipped': self.skipped,
+            'skipped_ratio': round(self.skipped / (self.steps + self.skipped), 3) if self.steps + self.skipped else 0.,
+            'wakeups': dict(self.wakeups),
+        }
+
+
+_wakeup_scheduler: WakeupScheduler = None
+
+
+def get_wakeup_scheduler() -> Optional[WakeupScheduler]:
+    '''
+    process-wide scheduler, None when CommonConfig.event_wakeups is off and every character is stepped every tick
+    '''
+    global _wakeup_scheduler
+    if _wakeup_scheduler is None:
+        from config.config_common import CommonConfig
+        if not CommonConfig.event_wakeups:
+            return None
+        _wakeup_scheduler = WakeupScheduler()
+    return _wakeup_scheduler
+
+
+def get_wakeup_stats() -> Optional[Dict[str, Any]]:
+    return _wakeup_scheduler.stats() if _wakeup_scheduler is not None else None
@@ -22,7 +22,7 @@ for setting_name, env_name in env_names.items():
     #     raise EnvironmentError("You must send additional environment variables to this app from docker-config.",env_name, setting_name)
 
 
-self.db_connection_string = f"mysql+pymysql://{env_names['user']}:{env_names['password']}@{env_names['host']}:{env_names['port']}/{env_names['database_name']}"
+self.db_connection_string = os.environ.get('DATABASE_URL', f"mysql+pymysql://{env_names['user']}:{env_names['password']}@{env_names['host']}:{env_names['port']}/{env_names['database_name']}")
 # set up the database connection string
 # self.db_connection_string = ('mysql+pymysql://%s:%s@%s:%s/%s' %
 #                              (self.user, self.password,
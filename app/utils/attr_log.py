@@ -0,0 +1,150 @@
+import atexit
+import csv
+import glob
+import os
+from typing import Dict, List, Optional
+
+
+class CharAttrLog:
+    '''
+    append-only log of the character attributes.
+    rows are buffered in memory and flushed once per tick (or when the buffer is full) into rolling segments:
+        <log_dir>/char_attrs_00000.csv, char_attrs_00001.csv, ...
+    a new segment is started when the current one has max_rows_per_segment rows or when a row brings columns
+    that are not in the header of the current segment.
+    fmt='parquet' writes the segments with pyarrow instead of csv. All values are logged as str, so every
+    column of a parquet segment is a string column.
+    '''
+    SEGMENT_PREFIX = 'char_attrs_'
+
+    def __init__(self, log_dir: str, fmt: str = 'csv', max_rows_per_segment: int = 100000, max_buffer: int = 5000):
+        assert fmt in ['csv', 'parquet'], f'fmt should be csv or parquet, got {fmt}'
+        if fmt == 'parquet':
+            try:
+                import pyarrow # noqa
+            except ImportError:
+                print('pyarrow is not installed, char attrs are logged as csv')
+                fmt = 'csv'
+        self.log_dir = log_dir
+        self.fmt = fmt
+        self.max_rows_per_segment = max_rows_per_segment
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict[str, str]] = []
+        self._segment_id = self._last_segment_id(log_dir) # continue after the segments of the previous runs
+        self._header: List[str] = []
+        self._rows_in_segment = 0
+        self._parquet_writer = None
+        atexit.register(self.close)
+
+    @property
+    def segment_path(self):
+        return os.path.join(self.log_dir, f'{self.SEGMENT_PREFIX}{self._segment_id:05d}.{self.fmt}')
+
+    def append(self, row: Dict[str, str]):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.max_buffer:
+            self.flush()
+
+    def _roll(self, header: List[str]):
+        self._close_segment()
+        self._segment_id += 1
+        self._header = header
+        self._rows_in_segment = 0
+        os.makedirs(self.log_dir, exist_ok=True)
+        if self.fmt == 'csv':
+            with open(self.segment_path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(header)
+
+    def _close_segment(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        start = 0
+        while start < len(rows):
+            # collect the rows that fit into the current segment
+            end = start
+            for row in rows[start:]:
+                if any(k not in self._header for k in row) or \
+                        self._rows_in_segment + end - start >= self.max_rows_per_segment:
+                    break
+                end += 1
+            if end == start: # the first row does not fit, start a new segment with the union of columns
+                header = list(self._header) if self._rows_in_segment < self.max_rows_per_segment else []
+                for k in rows[start]:
+                    if k not in header:
+                        header.append(k)
+                self._roll(header)
+                continue
+            self._write(rows[start:end])
+            self._rows_in_segment += end - start
+            start = end
+
+    def _write(self, rows: List[Dict[str, str]]):
+        if self.fmt == 'csv':
+            with open(self.segment_path, 'a', newline='', encoding='utf-8') as f:
+                csv.DictWriter(f, fieldnames=self._header, restval='').writerows(rows)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.table({k: [None if row.get(k) is None else str(row.get(k)) for row in rows] for k in self._header},
+                             schema=pa.schema([(k, pa.string()) for k in self._header]))
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.segment_path, table.schema)
+            self._parquet_writer.write_table(table)
+
+    def close(self):
+        self.flush()
+        self._close_segment()
+
+    @staticmethod
+    def _last_segment_id(log_dir: str) -> int:
+        '''
+        the highest segment number in log_dir, -1 when there is none
+        '''
+        last = -1
+        for path in CharAttrLog.segments(log_dir):
+            stem = os.path.splitext(os.path.basename(path))[0][len(CharAttrLog.SEGMENT_PREFIX):]
+            if stem.isdigit():
+                last = max(last, int(stem))
+        return last
+
+    @staticmethod
+    def segments(log_dir: str) -> List[str]:
+        return sorted(glob.glob(os.path.join(log_dir, f'{CharAttrLog.SEGMENT_PREFIX}*.csv')) +
+                      glob.glob(os.path.join(log_dir, f'{CharAttrLog.SEGMENT_PREFIX}*.parquet')))
+
+    @staticmethod
+    def load(log_dir: str, columns: Optional[List[str]] = None):
+        '''
+        read all the segments into one pandas DataFrame
+        '''
+        import pandas as pd
+        frames = []
+        for path in CharAttrLog.segments(log_dir):
+            if path.endswith('.parquet'):
+                frames.append(pd.read_parquet(path, columns=columns))
+            else:
+                frames.append(pd.read_csv(path, usecols=lambda c: columns is None or c in columns))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def query(log_dir: str, sql_query: str, table_name: str = 'char_attrs'):
+        '''
+        run sql on the logged attributes, e.g.
+            CharAttrLog.query('logs/char_attrs', 'SELECT * FROM char_attrs WHERE name = "Lily Johnson"')
+        '''
+        import sqlite3
+        import pandas as pd
+        conn = sqlite3.connect(':memory:')
+        try:
+            CharAttrLog.load(log_dir).to_sql(table_name, conn, index=False, if_exists='replace')
+            return pd.read_sql_query(sql_query, conn)
+        finally:
+            conn.close()
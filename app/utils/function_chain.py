@@ -4,6 +4,9 @@ import os
 import traceback
 from typing import Optional, List, Tuple, Union
 
+_binders = {} # (function, bound) -> parameter names, see FunctionChain.compile_binder
+
+
 class ChainResult:
     def __init__(self, result_dict=None, continue_chain=True):
         if result_dict is None:
@@ -17,14 +20,35 @@ class FunctionChain:
     a list of functions that can be executed sequentially 
     '''
     def __init__(self, func_list: Union[List[callable], Tuple[callable]] = None ):
-        self._functions = func_list if func_list else []
+        self._functions = []
+        self._binders = [] # parameter names of each function, compiled once when the function is added
         self._results = {}
         self.continue_chain = True
         self.args = dict()
+        for func in (func_list if func_list else []):
+            self.add(func)
         self.sanity_check()
         
     def sanity_check(self):
         pass
+
+    @staticmethod
+    def compile_binder(func) -> Tuple[str, ...]:
+        """
+        names of the parameters that func accepts, the kwargs of execute() are filtered by them.
+        an empty tuple means func is called without arguments.
+        functions and methods are compiled once per function, the states of all characters share the result
+        """
+        if inspect.ismethod(func):
+            key = (func.__func__, True)
+        elif inspect.isfunction(func):
+            key = (func, False)
+        else: # partials, callables: no stable key
+            return tuple(inspect.signature(func).parameters)
+        binder = _binders.get(key)
+        if binder is None:
+            binder = _binders[key] = tuple(inspect.signature(func).parameters)
+        return binder
         
     def add(self, func, index=None):
         """add a function into the chain"""
@@ -36,6 +60,7 @@ class FunctionChain:
         #     self._functions.insert(index, func)
             
         self._functions.insert(index, func)
+        self._binders.insert(index, self.compile_binder(func))
         return self
 
 
@@ -45,14 +70,15 @@ class FunctionChain:
         kwargs['obj'] = obj
         # self.args.update(kwargs)
         return_dict = {}
-        for func in self._functions:
+        for func, params in zip(self._functions, self._binders):
             try:
-                sig = inspect.signature(func)
-                kwargs.update(self.args)
-                func_kwargs = {k: v for k,v  in kwargs.items() if k in sig.parameters}
-                stop_sign, return_dict = func( **func_kwargs)
+                if self.args: kwargs.update(self.args)
+                if params:
+                    stop_sign, return_dict = func(**{k: kwargs[k] for k in params if k in kwargs})
+                else:
+                    stop_sign, return_dict = func()
                 # stop_sign, return_dict = func(*args, obj=obj, **kwargs, **self.args, **return_dict)
-                kwargs.update(return_dict)
+                if return_dict: kwargs.update(return_dict)
                 if stop_sign: break
             except Exception as e:
                 print(f'error in {func}, state: {obj.state_name}')
@@ -63,8 +89,13 @@ class FunctionChain:
 
         return True, return_dict
         
+    @property
+    def function_names(self) -> Tuple[str, ...]:
+        return tuple(getattr(func, '__name__', repr(func)) for func in self._functions)
+
     def clear(self):
         self._functions.clear()
+        self._binders.clear()
 
     def stop(self):
         self.continue_chain = False
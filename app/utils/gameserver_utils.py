@@ -3,9 +3,67 @@ from queue import *
 
 LLM_msg_queue = Queue()
 server_msg_queue = Queue()
-    
 
-def add_msg_to_send_to_game_server(msg):
-    global LLM_msg_queue
-    LLM_msg_queue.put(msg)
 
+class DisplayScheduler:
+    '''
+    pace the messages pushed to the game server without blocking the event loop.
+    each agent owns a display timeline: a message is released once the previous messages of the same agent
+    have been displayed for their hold time. It replaces the time.sleep() after a push in the states.
+    '''
+    def __init__(self):
+        self._free_at: dict[int, float] = {} # agent_guid -> loop time when the display slot of the agent is free
+        self.pending = 0
+
+    def push(self, msg, agent_guid=None, hold=0):
+        '''
+        msg: str to put into LLM_msg_queue
+        hold: seconds the message stays on the screen before the next message of the same agent is released
+        '''
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError: # no loop, e.g. debug scripts, nothing to wait for
+            loop = None
+        if loop is None or agent_guid is None:
+            LLM_msg_queue.put(msg)
+            return
+
+        now = loop.time()
+        release_at = max(now, self._free_at.get(agent_guid, now))
+        self._free_at[agent_guid] = release_at + hold
+        if release_at <= now:
+            LLM_msg_queue.put(msg)
+        else:
+            self.pending += 1
+            loop.call_at(release_at, self._release, msg)
+
+    def reserve(self, agent_guid, hold):
+        '''
+        keep the screen of the agent for hold seconds without sending anything
+        '''
+        try:
+            now = asyncio.get_running_loop().time()
+        except RuntimeError:
+            return
+        self._free_at[agent_guid] = max(now, self._free_at.get(agent_guid, now)) + hold
+
+    def _release(self, msg):
+        self.pending -= 1
+        LLM_msg_queue.put(msg)
+
+    def reset(self, agent_guid=None):
+        if agent_guid is None:
+            self._free_at.clear()
+        else:
+            self._free_at.pop(agent_guid, None)
+
+
+display_scheduler = DisplayScheduler()
+
+
+def add_msg_to_send_to_game_server(msg, agent_guid=None, hold=0):
+    '''
+    agent_guid: if given, the msg is queued behind the messages of the same agent that are still on display
+    hold: display time (s) reserved for this msg before the next msg of the agent is sent
+    '''
+    display_scheduler.push(msg, agent_guid=agent_guid, hold=hold)
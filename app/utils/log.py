@@ -3,14 +3,14 @@ import os
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
 import shutil
-import traceback
-import pandas as pd
+from .attr_log import CharAttrLog
 
 
 class LogManager:
     log_directory = os.path.join(os.path.dirname(__file__), '..', '..', 'logs')
     prompt_res_log = os.path.join(log_directory, 'prompt_res')
-    char_attrs_log = os.path.join(log_directory, 'char_attrs.csv')
+    char_attrs_log = os.path.join(log_directory, 'char_attrs') # directory of the rolling segments, see CharAttrLog
+    char_attr_writer: CharAttrLog = None
     app_log_file_path = os.path.join(log_directory, 'app.log')
     error_log_file_path = os.path.join(log_directory, 'error.log')
     record_start_marker = "@@RECORD_START@@"
@@ -114,12 +114,12 @@ class LogManager:
             else:
                 attr_dict[att] = str(attr_dict[att])
         # log_file_path = os.path.join(LogManager.char_attrs_log, f"{character_name}_Attr.csv")
-        log_file_path = LogManager.char_attrs_log
-        df = pd.read_csv(log_file_path) if os.path.exists(log_file_path) else pd.DataFrame(columns=list(attr_dict.keys()))
-        df = df[-10000000:]
-        try:
-            df = pd.concat([df, pd.DataFrame([attr_dict])], ignore_index=True)
-        except:
-            traceback.print_exc()
-            __import__('ipdb').set_trace()
-        df.to_csv(log_file_path, index=False)
\ No newline at end of file
+        if LogManager.char_attr_writer is None:
+            LogManager.char_attr_writer = CharAttrLog(LogManager.char_attrs_log, fmt=os.getenv('ATTR_LOG_FORMAT', 'csv'))
+        LogManager.char_attr_writer.append(attr_dict)
+
+    @staticmethod
+    def flush_char_attrs():
+        """write the buffered character attributes, called once per tick"""
+        if LogManager.char_attr_writer is not None:
+            LogManager.char_attr_writer.flush()
@@ -0,0 +1,80 @@
+from collections import defaultdict
+from typing import Any, Dict, Hashable, List, Tuple
+
+
+class UniformGrid:
+    '''
+    uniform bucket grid over the town map.
+    an item is stored in every cell its bounding box overlaps, a point item lives in exactly one cell.
+    query results are returned in insertion order, so callers that used to scan a list keep the same order.
+    '''
+    def __init__(self, cell_size: float = 16):
+        assert cell_size > 0, f'cell_size should be positive, got {cell_size}'
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], Dict[Hashable, Any]] = defaultdict(dict)
+        self._item_cells: Dict[Hashable, Tuple[int, int, int, int]] = {} # key -> covered cell range
+        self._order: Dict[Hashable, int] = {}
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._item_cells)
+
+    def _cell_range(self, xmin, ymin, xmax, ymax):
+        cs = self.cell_size
+        return int(xmin // cs), int(ymin // cs), int(xmax // cs), int(ymax // cs)
+
+    def insert_rect(self, key: Hashable, item: Any, xmin, ymin, xmax, ymax):
+        if key in self._item_cells:
+            self.remove(key)
+        else:
+            self._order[key] = self._counter
+            self._counter += 1
+        cx0, cy0, cx1, cy1 = self._cell_range(xmin, ymin, xmax, ymax)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self._cells[(cx, cy)][key] = item
+        self._item_cells[key] = (cx0, cy0, cx1, cy1)
+
+    def insert(self, key: Hashable, item: Any, x, y):
+        self.insert_rect(key, item, x, y, x, y)
+
+    def move(self, key: Hashable, item: Any, x, y):
+        '''
+        update a point item, cheap when it stays in the same cell
+        '''
+        if self._item_cells.get(key) == self._cell_range(x, y, x, y):
+            return
+        self.insert(key, item, x, y)
+
+    def remove(self, key: Hashable):
+        cell_range = self._item_cells.pop(key, None)
+        if cell_range is None:
+            return
+        cx0, cy0, cx1, cy1 = cell_range
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = self._cells.get((cx, cy))
+                if bucket is not None:
+                    bucket.pop(key, None)
+                    if not bucket:
+                        del self._cells[(cx, cy)]
+
+    def discard(self, key: Hashable):
+        self.remove(key)
+        self._order.pop(key, None)
+
+    def query_rect(self, xmin, ymin, xmax, ymax) -> List[Any]:
+        cx0, cy0, cx1, cy1 = self._cell_range(xmin, ymin, xmax, ymax)
+        found = {}
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = self._cells.get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        return [found[k] for k in sorted(found, key=self._order.__getitem__)]
+
+    def query(self, x, y, radius=0) -> List[Any]:
+        '''
+        items whose cells overlap the square [x-radius, x+radius] x [y-radius, y+radius], callers filter the exact distance
+        '''
+        return self.query_rect(x - radius, y - radius, x + radius, y + radius)
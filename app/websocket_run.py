@@ -4,10 +4,11 @@ import uvicorn
 
 sys.path.append('./')
 
-from starlette.responses import PlainTextResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 from starlette.routing import Route, WebSocketRoute
 
 from app.communication.websocket_server import WebSocketServer
+from app.llm.usage import DIMENSIONS, get_llm_usage
 from app.main import main
 from config import config
 
@@ -16,10 +17,25 @@ async def homepage(request):
     return PlainTextResponse('Hello, world!')
 
 
+async def llm_usage(request):
+    '''
+    /llm_usage?group_by=state,prompt_type&character=xxx&top=10
+    '''
+    params = request.query_params
+    group_by = [d for d in params.get('group_by', 'state').split(',') if d]
+    filters = {d: params[d] for d in DIMENSIONS if d in params}
+    top = int(params['top']) if 'top' in params else None
+    try:
+        return JSONResponse(get_llm_usage().query(group_by=group_by, top=top, **filters))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+
 ws_server = WebSocketServer()
 ws_server.callback = main
 routes = [
     Route("/", homepage),
+    Route("/llm_usage", llm_usage),
     WebSocketRoute("/ws", ws_server)
 ]
 
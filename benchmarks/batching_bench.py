@@ -0,0 +1,107 @@
+'''
+llm calls and tokens per tick when N characters enter EMOTION in the same tick, single calls vs batched calls
+
+    python benchmarks/batching_bench.py [--agents 50] [--batch-size 10] [--invalid 0.05]
+
+the prompts are rendered from the EmotionPrompt template with synthetic per-character values, the batched
+replies are produced locally (a fraction --invalid of the answers is broken to exercise the single-call fallback),
+so the numbers only count calls and tokens, no llm is called.
+'''
+import argparse
+import json
+import math
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from app.llm.batcher import BATCH_SYSTEM_MESSAGE, build_batch_message, split_batch_reply
+from app.llm.prompt.context import count_tokens
+from app.llm.prompt.emotion_prompt import EmotionPrompt
+from app.llm.prompt.template import PromptTemplate
+from app.llm.response_parser import ResponseError, get_response_parser
+from app.models.character import Character
+
+EMOTIONS = ['joy', 'trust', 'fear', 'surprise', 'sadness', 'disgust', 'anger', 'anticipation']
+NAMES = ['Jay', 'Ava', 'Bob', 'Mia', 'Leo', 'Zoe', 'Max', 'Eve']
+
+
+def character_values(rng: random.Random, i: int) -> dict:
+    other = rng.choice(NAMES)
+    return {
+        'emotion_options': EMOTIONS,
+        'prev_emotion': {e: rng.randint(0, 10) for e in rng.sample(EMOTIONS, 3)},
+        'world_understanding': f'character_{i} lives in the small town, {other} runs the bar and sells paintings. ' * rng.randint(1, 4),
+        'history': [f'{other}: do you want to buy my painting {k}?' for k in range(rng.randint(1, 6))],
+        'EXAMPLE': EmotionPrompt.EXAMPLE,
+    }
+
+
+def profile(i: int) -> str:
+    # the system message of Character.build_sys_message, sent with every single call and per request in a batch
+    return (f"{Character.DEFAULT_SYS_PROMPT}\n\nThe name of the character: character_{i}, The character id is {i}, "
+            f"The game character's bio : a painter of the small town who likes the bar\n")
+
+
+def answer(rng: random.Random) -> dict:
+    return {'emotions': [{'emotion': e, 'change': rng.randint(-5, 5), 'explanation': 'because of the last conversation'}
+                         for e in rng.sample(EMOTIONS, 3)]}
+
+
+def run(agents: int, batch_size: int, invalid: float, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    template = PromptTemplate(EmotionPrompt.PROMPT)
+    parser = get_response_parser(EmotionPrompt.EXAMPLE, [1, 2, 3, 4, 5, 6, 7, 8, 9])
+    batch_system_tokens = count_tokens(BATCH_SYSTEM_MESSAGE)
+    renders = [(f'r{i}', template, character_values(rng, i), profile(i)) for i in range(agents)]
+    answers = {request_id: answer(rng) for request_id, *_ in renders}
+    answer_tokens = {k: count_tokens(json.dumps(v)) for k, v in answers.items()}
+
+    single_prompt_tokens = {request_id: count_tokens(system) + count_tokens(template.render(lambda att: str(values[att])))
+                            for request_id, _, values, system in renders}
+    single = {
+        'calls': agents,
+        'prompt_tokens': sum(single_prompt_tokens.values()),
+        'completion_tokens': sum(answer_tokens.values()),
+    }
+
+    batched = {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'fallbacks': 0}
+    for start in range(0, agents, batch_size):
+        group = renders[start:start + batch_size]
+        message = build_batch_message(group)
+        reply = {'answers': {request_id: answers[request_id] if rng.random() >= invalid else {'emotion': 'joy'}
+                             for request_id, *_ in group}}
+        reply_text = json.dumps(reply)
+        batched['calls'] += 1
+        batched['prompt_tokens'] += batch_system_tokens + count_tokens(message)
+        batched['completion_tokens'] += count_tokens(reply_text)
+        for request_id, raw in split_batch_reply(reply_text, [r for r, *_ in group]).items():
+            try:
+                parser.parse(raw)
+            except ResponseError:
+                batched['fallbacks'] += 1
+                batched['calls'] += 1
+                batched['prompt_tokens'] += single_prompt_tokens[request_id]
+                batched['completion_tokens'] += answer_tokens[request_id]
+
+    for numbers in (single, batched):
+        numbers['total_tokens'] = numbers['prompt_tokens'] + numbers['completion_tokens']
+    return {
+        'agents': agents,
+        'batch_size': batch_size,
+        'expected_batches': math.ceil(agents / batch_size),
+        'single_calls_per_tick': single,
+        'batched_calls_per_tick': batched,
+        'calls_saved': single['calls'] - batched['calls'],
+        'tokens_saved': single['total_tokens'] - batched['total_tokens'],
+        'token_ratio': round(batched['total_tokens'] / single['total_tokens'], 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--invalid', type=float, default=0.05, help='fraction of broken answers in the batched replies')
+    args = parser.parse_args()
+    print(json.dumps(run(args.agents, args.batch_size, args.invalid), indent=1))
@@ -0,0 +1,90 @@
+'''
+throughput of the embedding service on a synthetic perception burst: every agent observes a few objects
+and embeds one query per object, as PerspectState.retrieve_knowledge does.
+
+    python benchmarks/embedding_bench.py [--agents 200] [--objects 5] [--latency 0.05]
+
+the embedder is LocalEmbeddings behind a fixed per-call latency (a stand-in for the embedding api round trip).
+"before" embeds every query with its own blocking call, "after_sync" is one embed_documents call per agent
+(retrieve_memories), "after_async" issues all queries concurrently through aembed_query and lets the service
+coalesce them.
+'''
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from app.llm.embedding_service import EmbeddingService, LocalEmbeddings
+
+
+class LatencyEmbeddings(LocalEmbeddings):
+    def __init__(self, latency, dim=256):
+        super().__init__(dim)
+        self.latency = latency
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return [LocalEmbeddings.embed_query(self, text) for text in texts]
+
+
+def make_burst(agents, objects):
+    return [[(f'obj_{o}', f'agent {a} sees obj {o} near the market at tick {a % 7}') for o in range(objects)]
+            for a in range(agents)]
+
+
+def run_before(embedder, burst):
+    start = time.perf_counter()
+    for queries in burst:
+        for _, text in queries:
+            embedder.embed_query(text)
+    return time.perf_counter() - start
+
+
+def run_after_sync(service, burst):
+    start = time.perf_counter()
+    for queries in burst:
+        service.embed_documents([text for _, text in queries])
+    return time.perf_counter() - start
+
+
+def run_after_async(service, burst):
+    async def agent(queries):
+        return await service.aembed_documents([text for _, text in queries])
+
+    async def main():
+        await asyncio.gather(*[agent(queries) for queries in burst])
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=200)
+    parser.add_argument('--objects', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    burst = make_burst(args.agents, args.objects)
+    n_queries = args.agents * args.objects
+    embedder = LatencyEmbeddings(args.latency)
+    before = run_before(embedder, burst)
+    after_sync = run_after_sync(EmbeddingService(embedder), burst)
+    async_service = EmbeddingService(embedder)
+    after_async = run_after_async(async_service, burst)
+    print(json.dumps({
+        'agents': args.agents,
+        'queries': n_queries,
+        'before_queries_per_s': round(n_queries / before, 1),
+        'after_sync_queries_per_s': round(n_queries / after_sync, 1),
+        'after_async_queries_per_s': round(n_queries / after_async, 1),
+        'after_async_stats': async_service.stats(),
+    }, indent=1))
@@ -0,0 +1,82 @@
+'''
+micro benchmark of FunctionChain.execute on a 5-function update chain, i.e. the per character per tick overhead
+
+    python benchmarks/function_chain_bench.py [--ticks 100000]
+
+"before" replays the previous dispatch (inspect.signature + kwargs filtering on every call),
+"after" is the current FunctionChain with binders compiled in add().
+'''
+import argparse
+import inspect
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from app.utils.function_chain import FunctionChain
+
+
+class LegacyFunctionChain(FunctionChain):
+    def execute(self, obj, *args, **kwargs):
+        kwargs['obj'] = obj
+        return_dict = {}
+        for func in self._functions:
+            sig = inspect.signature(func)
+            kwargs.update(self.args)
+            func_kwargs = {k: v for k, v in kwargs.items() if k in sig.parameters}
+            stop_sign, return_dict = func(**func_kwargs)
+            kwargs.update(return_dict)
+            if stop_sign: break
+        return True, return_dict
+
+
+class DummyState:
+    '''
+    same signatures as BaseState.update_state_chain
+    '''
+    state_name = 'BENCH'
+
+    def __init__(self):
+        self.date = 0
+        self.chain_funcs = [self.change_date, self.monitor_server_msg, self.passive_update, self.state_timeout, self.change_state]
+
+    def change_date(self, date):
+        self.date = date
+        return False, dict()
+
+    def monitor_server_msg(self, msg=None):
+        return False, dict()
+
+    def passive_update(self):
+        return False, dict()
+
+    def state_timeout(self, overduration: bool):
+        return False, dict()
+
+    def change_state(self, overduration):
+        return False, dict()
+
+
+def run(chain_cls, ticks):
+    state = DummyState()
+    chain = chain_cls(state.chain_funcs)
+    start = time.perf_counter()
+    for tick in range(ticks):
+        chain.execute(msg=None, date=tick, overduration=False, overlooped=False, obj=state)
+    return (time.perf_counter() - start) / ticks
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=100000)
+    args = parser.parse_args()
+
+    before = run(LegacyFunctionChain, args.ticks)
+    after = run(FunctionChain, args.ticks)
+    print(json.dumps({
+        'ticks': args.ticks,
+        'before_us_per_tick': round(before * 1e6, 3),
+        'after_us_per_tick': round(after * 1e6, 3),
+        'speedup': round(before / after, 2),
+    }, indent=1))
@@ -0,0 +1,71 @@
+'''
+startup cost of the character memory stores, needs a running milvus (MILVUS_HOST / MIVUS_PORT)
+
+    python benchmarks/milvus_startup_bench.py [--characters 50]
+
+"before" creates one collection per character (connect, create, index, load), as Memory did,
+"after" resolves the shared partitioned collection for every character.
+the bench_* collections are dropped at the end.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pymilvus import utility
+
+from app.database.milvus_constants import CHARACTER_MEMORY_NUM_PARTITIONS, CHARACTER_MEMORY_SCHEMA
+from app.database.milvus_datastore import MILVUS_ALIAS, MilvusDataStore
+from app.global_config import MILVUS_HOST, MILVUS_INDEX_PARAMS, MILVUS_PORT
+
+
+def make_store(collection_name, shared):
+    kwargs = dict(host=MILVUS_HOST, port=MILVUS_PORT, field_schema=CHARACTER_MEMORY_SCHEMA,
+                  index_field='emb', index_params=MILVUS_INDEX_PARAMS)
+    if shared:
+        return MilvusDataStore.shared(collection_name=collection_name, **kwargs)
+    return MilvusDataStore(collection_name=collection_name, **kwargs)
+
+
+def run_before(characters):
+    start = time.perf_counter()
+    for i in range(characters):
+        make_store(f'bench_entity_memory_{i}', shared=False)
+    return time.perf_counter() - start
+
+
+def run_after(characters):
+    start = time.perf_counter()
+    for _ in range(characters):
+        make_store('bench_character_memory', shared=True)
+    return time.perf_counter() - start
+
+
+def loaded_segments():
+    return sum(len(utility.get_query_segment_info(name, using=MILVUS_ALIAS))
+               for name in utility.list_collections(using=MILVUS_ALIAS) if name.startswith('bench_'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--characters', type=int, default=50)
+    args = parser.parse_args()
+
+    try:
+        before = run_before(args.characters)
+        after = run_after(args.characters)
+        print(json.dumps({
+            'characters': args.characters,
+            'partitions': CHARACTER_MEMORY_NUM_PARTITIONS,
+            'before_startup_s': round(before, 3),
+            'after_startup_s': round(after, 3),
+            'before_collections': args.characters,
+            'after_collections': 1,
+            'loaded_segments': loaded_segments(),
+        }, indent=1))
+    finally:
+        for name in utility.list_collections(using=MILVUS_ALIAS):
+            if name.startswith('bench_'):
+                utility.drop_collection(name, using=MILVUS_ALIAS)
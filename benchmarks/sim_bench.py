@@ -0,0 +1,205 @@
+'''
+end-to-end tick throughput of the simulation on a synthetic city, offline
+
+    python benchmarks/sim_bench.py [--agents 20] [--buildings 11] [--ticks 50] [--latency fixed:0.05] [--output bench.json]
+
+N characters are cloned from the config/character.json templates (renamed, new ids), M buildings from
+config/building.json, laid out on a walkable grid with one of every equipment of equipment.json per building.
+Simulation.update_state runs K ticks against the mock llm server (app/llm/mock_server.py, started in this process),
+the numpy vector store, LocalEmbeddings and a SQLite database in a temporary directory.
+the json report (ticks/sec, p50/p99 tick latency, llm calls per tick, rss per agent, startup time, git commit)
+is printed and written to --output, to compare runs across commits.
+'''
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+
+BUILDING_SIZE = 20
+BUILDING_GAP = 10
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError: # not linux, peak rss instead
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.
+
+
+def synthetic_city(agents: int, buildings: int, building_table: dict, character_table: dict, equipment_table: dict, seed: int = 0):
+    '''
+    (frontend city status, backend tables, terrain) in the formats of Simulation.merge_frontend_backend_json
+    '''
+    import numpy as np
+    rng = random.Random(seed)
+    per_row = max(1, int(buildings ** 0.5))
+    area_dic, backend_buildings = {}, {}
+    building_templates = list(building_table.values())
+    for i in range(buildings):
+        template = building_templates[i % len(building_templates)]
+        name = template['name'] if i < len(building_templates) else f"{template['name']} {i // len(building_templates) + 1}"
+        x, y = (i % per_row) * (BUILDING_SIZE + BUILDING_GAP), (i // per_row) * (BUILDING_SIZE + BUILDING_GAP)
+        backend_buildings[str(i + 1)] = dict(copy.deepcopy(template), id=str(i + 1), name=name)
+        area_dic[name] = {'xMin': x, 'yMin': y, 'xMax': x + BUILDING_SIZE - 1, 'yMax': y + BUILDING_SIZE - 1}
+    width = per_row * (BUILDING_SIZE + BUILDING_GAP)
+    height = ((buildings - 1) // per_row + 1) * (BUILDING_SIZE + BUILDING_GAP)
+    terrain = np.ones((width, height), dtype=int)
+
+    equipments = {}
+    for k, (name, _) in enumerate(equipment_table.items()):
+        equipments[name] = []
+        for area in area_dic.values():
+            equipments[name].append({'pos': {'x': area['xMin'] + k % BUILDING_SIZE, 'y': area['yMin'] + k // BUILDING_SIZE}})
+
+    agent_dic, backend_characters = {}, {}
+    character_templates = list(character_table.values())
+    for i in range(agents):
+        template = character_templates[i % len(character_templates)]
+        name = template['name'] if i < len(character_templates) else f"{template['name']} {i // len(character_templates) + 1}"
+        backend_characters[str(i + 1)] = dict(copy.deepcopy(template), id=i + 1, name=name)
+        agent_dic[name] = {'id': i + 1, 'postion': {'x': rng.randrange(width), 'y': rng.randrange(height)}}
+
+    frontend = {'area_dic': area_dic, 'intelligent_agent_dic': agent_dic, 'map_obj_list_dic_of_interactive': equipments}
+    backend = {'buildings': backend_buildings, 'characters': backend_characters, 'equipments': copy.deepcopy(equipment_table)}
+    return frontend, backend, terrain
+
+
+async def run_ticks(sim, ticks: int, mock):
+    latencies, calls = [], []
+    for _ in range(ticks):
+        requests = mock.stats['requests']
+        start = time.perf_counter()
+        await sim.update_state()
+        latencies.append(time.perf_counter() - start)
+        calls.append(mock.stats['requests'] - requests)
+    return latencies, calls
+
+
+def offline_environment(seed: int = 0) -> int:
+    '''
+    points the simulation to the mock llm, the numpy vector store, LocalEmbeddings and a SQLite database in a
+    temporary directory, must run before the app is imported. returns the port of the mock llm
+    '''
+    workdir = tempfile.mkdtemp(prefix='sim_bench_')
+    port = free_port()
+    # read by app/global_config.py, config/__init__.py and the database modules at import
+    os.environ.update({
+        'MOCK_LLM': 'http', 'MOCK_LLM_PORT': str(port), 'MOCK_LLM_SEED': str(seed),
+        'VECTOR_STORE': 'numpy', 'VECTOR_STORE_PATH': os.path.join(workdir, 'vector_store'),
+        'EMBEDDING_BACKEND': 'local',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'sims.db')}",
+    })
+    os.chdir(ROOT) # the simulation reads config/ and writes logs/ relative to the repo
+    return port
+
+
+def load_city(agents: int, buildings: int, seed: int = 0, state_config: str = 'config/states.yaml'):
+    '''
+    a Simulation with the characters and buildings of a synthetic city loaded, without state managers yet
+    '''
+    from app.database.base_database import init_db
+    init_db() # the tables of the SQLite database of offline_environment
+    from app.service.simulation import Simulation
+    from config import building_data_table, character_data_table, interactable_equipments_data_table
+    frontend, backend, terrain = synthetic_city(agents, buildings, building_data_table, character_data_table,
+                                                interactable_equipments_data_table, seed=seed)
+    sim = Simulation(state_config_file=state_config, oai_config_file='OAI_CONFIG_LIST')
+    data = sim.merge_frontend_backend_json(frontend_data=frontend, backend_data=backend)
+    sim.load_frontend_data_from_json(data, terrain=terrain, max_characters=None)
+    return sim
+
+
+def run(agents: int, buildings: int, ticks: int, latency: str, seed: int = 0, state_config: str = 'config/states.yaml') -> dict:
+    port = offline_environment(seed)
+    start = time.perf_counter()
+    from app.llm.mock_server import start_mock_server
+    import app.service.simulation # timed with the mock server import
+    from app.service.wakeups import get_wakeup_stats
+    import_seconds = time.perf_counter() - start
+
+    server, mock = start_mock_server('127.0.0.1', port, seed=seed, latency=latency)
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    sim = load_city(agents, buildings, seed=seed, state_config=state_config)
+    sim.create_character_state_managers()
+    sim.started = True
+    sim.newday_countdown = ticks + 1
+    startup_seconds = time.perf_counter() - start
+    startup_requests = mock.stats['requests']
+    rss_after = rss_bytes()
+
+    start = time.perf_counter()
+    latencies, calls = asyncio.run(run_ticks(sim, ticks, mock))
+    run_seconds = time.perf_counter() - start
+    rss_end = rss_bytes()
+    server.shutdown()
+
+    return {
+        'commit': git_commit(),
+        'agents': len(sim.character_list.characters),
+        'buildings': len(sim.building_list.buildings),
+        'ticks': ticks,
+        'mock_latency': latency,
+        'import_seconds': round(import_seconds, 3),
+        'startup_seconds': round(startup_seconds, 3),
+        'startup_llm_calls': startup_requests,
+        'ticks_per_sec': round(ticks / run_seconds, 3) if run_seconds else 0.,
+        'tick_p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'tick_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'tick_max_ms': round(max(latencies) * 1000, 2) if latencies else 0.,
+        'llm_calls_per_tick': round(sum(calls) / ticks, 3) if ticks else 0.,
+        'llm_calls_max_tick': max(calls) if calls else 0,
+        'rss_mb': round(rss_end / 2 ** 20, 1),
+        'rss_per_agent_kb': round((rss_after - rss_before) / max(1, agents) / 1024, 1),
+        'rss_growth_per_tick_kb': round((rss_end - rss_after) / max(1, ticks) / 1024, 1),
+        'mock': {k: v for k, v in mock.stats.items()},
+        'tick_engine': sim.tick_engine.stats.summary(),
+        'wakeups': get_wakeup_stats(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--buildings', type=int, default=11)
+    parser.add_argument('--ticks', type=int, default=50)
+    parser.add_argument('--latency', default='fixed:0.05', help='latency of the mock llm, see app.llm.mock_server.parse_latency')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--states', default='config/states.yaml')
+    parser.add_argument('--output', default=None, help='also write the report to this json file')
+    args = parser.parse_args()
+    report = run(args.agents, args.buildings, args.ticks, args.latency, seed=args.seed, state_config=args.states)
+    print(json.dumps(report, indent=1, default=str))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
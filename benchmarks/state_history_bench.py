@@ -0,0 +1,129 @@
+'''
+cost of a state transition of StateManager after a long run, list history vs deque history with decaying states
+
+    python benchmarks/state_history_bench.py [--transitions 100000] [--states 12] [--window 1000] [--circle-tolerance 4]
+
+the states are minimal stand-ins (enter adds circle_tolerance to loop_duration, post_exit decays it by one, as in
+BaseState) visited in a random walk biased to short cycles. "before" is the LengthLimitedList(999) history walked
+by post_process on every transition, "after" is StateManager.change_state itself. the reported numbers are
+the mean microseconds per transition over the first and the last --window transitions.
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from app.service.character_state.state_manager import StateManager
+
+
+class BenchState:
+    def __init__(self, state_name, circle_tolerance=4):
+        self.state_name = state_name
+        self._circle_tolerance = circle_tolerance
+        self.loop_duration = 0
+
+    def enter_state(self):
+        self.loop_duration += self._circle_tolerance
+
+    def exit_state(self):
+        pass
+
+    def post_exit(self):
+        self.loop_duration -= 1
+
+    def set_previous_state(self, state):
+        self.previous_state = state
+
+
+class LengthLimitedList(list):
+    def __init__(self, limit, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limit = limit
+
+    def append(self, item):
+        super().append(item)
+        while len(self) > self.limit:
+            self.pop(0)
+
+
+class ListHistoryManager:
+    '''
+    the bookkeeping of StateManager before: the history is walked and pruned on every transition
+    '''
+    def __init__(self):
+        self.current_state = None
+        self.previous_states = LengthLimitedList(limit=999)
+
+    def change_state(self, new_state):
+        for state in self.previous_states:
+            state.post_exit()
+            if state.loop_duration < 0:
+                self.previous_states.remove(state)
+        if self.current_state:
+            self.current_state.exit_state()
+            self.previous_states.append(self.current_state)
+        self.current_state = new_state
+        self.current_state.set_previous_state(self.previous_states[-1].state_name if self.previous_states else None)
+        self.current_state.enter_state()
+
+
+def deque_history_manager(history_limit=999):
+    # bypass __init__, which builds every state with its prompts, only the bookkeeping is measured
+    manager = StateManager.__new__(StateManager)
+    manager.current_state = None
+    manager.previous_states = deque(maxlen=history_limit)
+    manager.decaying_states = []
+    return manager
+
+
+def walk(states_count, transitions, seed):
+    rng = random.Random(seed)
+    path, current = [], 0
+    for _ in range(transitions):
+        current = (current + 1) % 3 if rng.random() < 0.7 else rng.randrange(states_count) # mostly a 3-state cycle
+        path.append(current)
+    return path
+
+
+def run_manager(manager, states, path, window):
+    durations = []
+    for index in path:
+        start = time.perf_counter()
+        manager.change_state(states[index])
+        durations.append(time.perf_counter() - start)
+    first, last = durations[:window], durations[-window:]
+    return {
+        'first_us': round(sum(first) / len(first) * 1e6, 2),
+        'last_us': round(sum(last) / len(last) * 1e6, 2),
+        'total_s': round(sum(durations), 3),
+        'history': len(manager.previous_states),
+        'max_loop_duration': max(s.loop_duration for s in states),
+    }
+
+
+def run(transitions, states_count, window, circle_tolerance=4, seed=0):
+    path = walk(states_count, transitions, seed)
+    before = run_manager(ListHistoryManager(), [BenchState(f's{i}', circle_tolerance) for i in range(states_count)], path, window)
+    after = run_manager(deque_history_manager(), [BenchState(f's{i}', circle_tolerance) for i in range(states_count)], path, window)
+    return {
+        'transitions': transitions,
+        'states': states_count,
+        'circle_tolerance': circle_tolerance,
+        'before': before,
+        'after': after,
+        'speedup_last': round(before['last_us'] / after['last_us'], 1) if after['last_us'] else None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transitions', type=int, default=100000)
+    parser.add_argument('--states', type=int, default=12)
+    parser.add_argument('--window', type=int, default=1000, help='transitions averaged at the start and at the end')
+    parser.add_argument('--circle-tolerance', type=int, default=4, help='loop_duration added when a state is entered')
+    args = parser.parse_args()
+    print(json.dumps(run(args.transitions, args.states, args.window, args.circle_tolerance), indent=1))
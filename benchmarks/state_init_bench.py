@@ -0,0 +1,82 @@
+'''
+startup time and memory of the state managers of N characters, every state built up front vs built on first entry
+
+    python benchmarks/state_init_bench.py [--agents 100] [--ticks 0]
+
+the characters come from the synthetic city of sim_bench.py (mock llm, numpy vector store, SQLite), then
+Simulation.create_character_state_managers runs with CommonConfig.lazy_states False ("before") and True ("after"),
+timed and measured with tracemalloc. with --ticks > 0 the lazy managers also run that many ticks and the report
+gives how many states the characters actually built.
+'''
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sim_bench import load_city, offline_environment, run_ticks
+
+
+def build_managers(sim, lazy: bool) -> dict:
+    from config.config_common import CommonConfig
+    CommonConfig.lazy_states = lazy
+    sim.character_state_managers = {}
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    sim.create_character_state_managers()
+    seconds = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    agents = len(sim.character_state_managers)
+    return {
+        'seconds': round(seconds, 3),
+        'ms_per_agent': round(seconds / agents * 1000, 2),
+        'kb_per_agent': round(allocated / agents / 1024, 1),
+        'states_built': sum(built_states(m) for m in sim.character_state_managers.values()),
+    }
+
+
+def built_states(manager) -> int:
+    return getattr(manager.states, 'built', len(manager.states))
+
+
+def run(agents: int, ticks: int, seed: int = 0) -> dict:
+    port = offline_environment(seed)
+    from app.llm.mock_server import start_mock_server
+    server, mock = start_mock_server('127.0.0.1', port, seed=seed, latency='fixed:0')
+    sim = load_city(agents, 11, seed=seed)
+    states_per_agent = len(next(iter(sim.configs['States'].values())))
+    before = build_managers(sim, lazy=False)
+    after = build_managers(sim, lazy=True)
+    report = {
+        'agents': agents,
+        'states_per_agent': states_per_agent,
+        'before': before,
+        'after': after,
+        'startup_speedup': round(before['seconds'] / after['seconds'], 1) if after['seconds'] else None,
+        'memory_ratio': round(after['kb_per_agent'] / before['kb_per_agent'], 3) if before['kb_per_agent'] else None,
+    }
+    if ticks:
+        sim.started = True
+        sim.newday_countdown = ticks + 1
+        asyncio.run(run_ticks(sim, ticks, mock))
+        report['after_ticks'] = {
+            'ticks': ticks,
+            'states_built': sum(built_states(m) for m in sim.character_state_managers.values()),
+            'states_total': states_per_agent * agents,
+        }
+    server.shutdown()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=100)
+    parser.add_argument('--ticks', type=int, default=0, help='ticks run with the lazy states afterwards')
+    args = parser.parse_args()
+    print(json.dumps(run(args.agents, args.ticks), indent=1))
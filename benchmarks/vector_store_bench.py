@@ -0,0 +1,135 @@
+'''
+recall and latency of the memory searches on the in-process NumpyVectorStore, optionally against milvus
+
+    python benchmarks/vector_store_bench.py [--rows 20000] [--characters 100] [--dim 256] [--queries 200] [--milvus]
+
+every search is filtered like Memory.name_specific_memory_retrieve_from_milvus (obj_name && act_name).
+the reference top-k is an exact numpy scan over the filtered rows, so recall@k of the numpy store is a
+correctness check and recall@k of milvus measures its IVF index.
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from app.database.vector_store import NumpyVectorStore
+
+
+def make_rows(n_rows, n_characters, dim, rng):
+    vectors = rng.standard_normal((n_rows, dim)).astype(np.float32)
+    rows = [{
+        'id': str(i),
+        'act_name': f'character_{i % n_characters}',
+        'obj_name': f'building_{(i // n_characters) % 10}',
+        'timestamp': i,
+        'text': f'memory {i}',
+        'emb': vectors[i].tolist(),
+    } for i in range(n_rows)]
+    return rows, vectors
+
+
+def make_queries(n_queries, n_characters, dim, rng):
+    return [(rng.standard_normal(dim).astype(np.float32),
+             f"obj_name=='building_{q % 10}' && act_name=='character_{q % n_characters}'") for q in range(n_queries)]
+
+
+def exact_topk(rows, vectors, query, expr, topk):
+    act_name = expr.split("act_name=='")[1].rstrip("'")
+    obj_name = expr.split("obj_name=='")[1].split("'")[0]
+    ids = np.array([i for i, row in enumerate(rows) if row['act_name'] == act_name and row['obj_name'] == obj_name])
+    if len(ids) == 0:
+        return set()
+    candidates = vectors[ids] / np.linalg.norm(vectors[ids], axis=1, keepdims=True)
+    scores = candidates @ (query / np.linalg.norm(query))
+    return {rows[i]['id'] for i in ids[np.argsort(-scores)[:topk]]}
+
+
+def search(store, queries, topk):
+    latencies, results = [], []
+    for query, expr in queries:
+        start = time.perf_counter()
+        hits = store.vector_search({
+            'data': [query.tolist()], 'anns_field': 'emb', 'param': {'metric_type': 'COSINE'},
+            'limit': topk, 'output_fields': ['text', 'timestamp'], 'expr': expr,
+        })[0]
+        latencies.append(time.perf_counter() - start)
+        results.append({str(hit.id) for hit in hits})
+    return latencies, results
+
+
+def report(name, latencies, results, truth, insert_s, n_rows):
+    recall = np.mean([len(r & t) / len(t) for r, t in zip(results, truth) if t])
+    stats = {f'{name}_insert_rows_per_s': round(n_rows / insert_s, 1)} if insert_s else {}
+    return {
+        **stats,
+        f'{name}_recall_at_k': round(float(recall), 4),
+        f'{name}_p50_ms': round(float(np.percentile(latencies, 50)) * 1e3, 3),
+        f'{name}_p95_ms': round(float(np.percentile(latencies, 95)) * 1e3, 3),
+    }
+
+
+def milvus_store(dim):
+    from pymilvus import CollectionSchema, DataType, FieldSchema
+    from app.database.milvus_datastore import MilvusDataStore
+    from app.global_config import MILVUS_HOST, MILVUS_INDEX_PARAMS, MILVUS_PORT
+    schema = CollectionSchema(fields=[
+        FieldSchema(name='id', dtype=DataType.VARCHAR, max_length=200, is_primary=True),
+        FieldSchema(name='act_name', dtype=DataType.VARCHAR, max_length=200, is_partition_key=True),
+        FieldSchema(name='obj_name', dtype=DataType.VARCHAR, max_length=200),
+        FieldSchema(name='timestamp', dtype=DataType.INT64),
+        FieldSchema(name='text', dtype=DataType.VARCHAR, max_length=4096),
+        FieldSchema(name='emb', dtype=DataType.FLOAT_VECTOR, dim=dim),
+    ], num_partitions=64)
+    return MilvusDataStore(host=MILVUS_HOST, port=MILVUS_PORT, collection_name='bench_vector_store', field_schema=schema,
+                           index_field='emb', index_params=MILVUS_INDEX_PARAMS, create_new=True,
+                           consistency_level='Strong', write_buffer_size=1024)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--characters', type=int, default=100)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--topk', type=int, default=4)
+    parser.add_argument('--milvus', action='store_true', help='also run the searches on a live milvus')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows, vectors = make_rows(args.rows, args.characters, args.dim, rng)
+    queries = make_queries(args.queries, args.characters, args.dim, rng)
+    truth = [exact_topk(rows, vectors, query, expr, args.topk) for query, expr in queries]
+    output = {'rows': args.rows, 'characters': args.characters, 'dim': args.dim, 'topk': args.topk}
+
+    with tempfile.TemporaryDirectory() as path:
+        store = NumpyVectorStore('bench_memory', path=path)
+        start = time.perf_counter()
+        for i in range(0, len(rows), 256):
+            store.insert_data(rows[i:i + 256])
+        insert_s = time.perf_counter() - start
+        output.update(report('numpy', *search(store, queries, args.topk), truth, insert_s, args.rows))
+
+        start = time.perf_counter()
+        store.flush()
+        output['numpy_persist_s'] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        reopened = NumpyVectorStore('bench_memory', path=path)
+        output['numpy_reopen_mmap_s'] = round(time.perf_counter() - start, 3)
+        output.update(report('numpy_mmap', *search(reopened, queries, args.topk), truth, None, args.rows))
+
+    if args.milvus:
+        store = milvus_store(args.dim)
+        start = time.perf_counter()
+        for i in range(0, len(rows), 256):
+            store.insert_data(rows[i:i + 256])
+        store.flush()
+        insert_s = time.perf_counter() - start
+        output.update(report('milvus', *search(store, queries, args.topk), truth, insert_s, args.rows))
+        store.collection.drop()
+
+    print(json.dumps(output, indent=1))
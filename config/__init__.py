@@ -43,11 +43,20 @@ with open(os.path.join(dir_path, "city_status.json"), "r") as file:
 with open(os.path.join(dir_path, "unique_names.json"), "r") as file:
     unique_names = json.load(file)
     
-with open(os.path.join(dir_path, "cheap_apis.txt"), "r") as file:
-    cheap_apis = [ line.strip() for line in file.readlines()]
-
-with open(os.path.join(dir_path, "official_apis.txt"), "r") as file:
-    official_apis = [ line.strip() for line in file.readlines()]
- 
-with open(os.path.join(dir_path, "OAI_CFG_TMPLT.txt"), "r") as file:
-    cfg_tmplt = file.read()
\ No newline at end of file
+from app.global_config import MOCK_LLM, MOCK_LLM_HOST, MOCK_LLM_PORT, MOCK_LLM_KEYS
+
+if MOCK_LLM:
+    # every model of the template points to the local mock server, no api keys needed
+    cheap_apis = [f'mock-cheap-{i}' for i in range(MOCK_LLM_KEYS)]
+    official_apis = [f'mock-official-{i}' for i in range(MOCK_LLM_KEYS)]
+    with open(os.path.join(dir_path, "MOCK_OAI_CFG_TMPLT.txt"), "r") as file:
+        cfg_tmplt = file.read().replace('{mock_base_url}', f'http://{MOCK_LLM_HOST}:{MOCK_LLM_PORT}/v1')
+else:
+    with open(os.path.join(dir_path, "cheap_apis.txt"), "r") as file:
+        cheap_apis = [ line.strip() for line in file.readlines()]
+
+    with open(os.path.join(dir_path, "official_apis.txt"), "r") as file:
+        official_apis = [ line.strip() for line in file.readlines()]
+     
+    with open(os.path.join(dir_path, "OAI_CFG_TMPLT.txt"), "r") as file:
+        cfg_tmplt = file.read()
\ No newline at end of file
@@ -6,6 +6,45 @@ class CommonConfig:
     llm_model = "gpt-3.5"
     debug = False
     update_interval = 2
+    max_characters = 5 # characters of the city status that are simulated, None simulates all
+    lazy_states = True # a state of a character is built the first time it is entered, False builds every state of states.yaml at startup
+    event_wakeups = True # characters whose state only waits (llm call, server message, chat partner, timeout) are not stepped until woken, see app.service.wakeups
+    tick_ordering = 'concurrent' # 'concurrent' or 'serial', see app.service.tick_engine.TickEngine
+    character_tick_budget = 0.2 # seconds a single character update may take before it is reported as slow
+    embedding_cache_size = 20000 # vectors kept in memory, 0 disables the embedding cache
+    embedding_cache_dir = '.cache/embeddings' # on-disk tier of the embedding cache, None keeps it in memory only
+    llm_max_concurrency = 16 # llm calls in flight at the same time, see app.llm.scheduler.LLMScheduler
+    llm_priorities = { # PromptType name -> priority class, lower runs first
+        'CHATING': 0, 'CHATRCEIVE': 0, 'BARGAIN': 0, 'USERTRADE': 0,
+        'ACT': 1, 'PLAN': 1, 'USE': 1, 'TRADE': 1, 'ESTIMATE': 1, 'APPRECIATE': 1,
+        'PERSPECT': 2, 'ACTREFLECTION': 2, 'DRAWINIT': 2, 'DRAW': 2,
+        'EMOTION': 3, 'INNER_MONOLOGUE': 3, 'SUM': 3,
+    }
+    llm_default_priority = 2
+    llm_deadlines = {'EMOTION': 60, 'INNER_MONOLOGUE': 60} # seconds a call may wait in the queue before it is dropped
+    llm_batch_prompt_types = [] # PromptType names answered for several characters in one call, e.g. ['EMOTION', 'PERSPECT'], see app.llm.batcher
+    llm_batch_max_size = 10 # requests per batched call
+    llm_batch_window = 0.05 # seconds a request waits for others of the same prompt type
+    llm_cache_size = 5000 # llm responses kept in memory, 0 disables the response cache
+    llm_cache_dir = '.cache/llm_responses' # on-disk tier of the response cache, None keeps it in memory only
+    llm_cache_ttl = 24 * 3600 # seconds a cached response stays valid, None never expires
+    api_key_limits = { # per key, see app.llm.key_router.KeyRouter
+        'cheap_api': {'rpm': 60, 'tpm': 90000},
+        'official_api': {'rpm': 500, 'tpm': 300000},
+    }
+    api_key_max_wait = 30 # seconds a request may wait for a key with headroom before it is sent anyway
+    llm_cache_prompt_types = ['EMOTION', 'INNER_MONOLOGUE'] # PromptType names whose responses may be reused
+    llm_usage_window = 1000 # last calls per (character, state, prompt type, model) kept for the percentiles, see app.llm.usage
+    llm_usage_summary_file = 'llm_usage.json' # written under the log directory, None disables the summary file
+    llm_usage_summary_interval = 60 # seconds between two summary files
+    prompt_default_token_budget = 3000 # tokens of a prompt, the memory sections are cut to fit, 0 disables, see app.llm.prompt.context
+    prompt_token_budgets = {'PLAN': 4000} # PromptType name -> token budget
+    prompt_budget_sections = ['memory', 'buildings'] # placeholders whose snippets are ranked and cut to the budget
+    llm_structured_output_models = ['gpt-4o', 'gpt-4o-mini'] # models that get the json_schema of the prompt example as response_format
+    conversation_max_turns = 20 # turns kept per pair of agents, the older ones are summarized, see app.models.conversation
+    conversation_summarize_every = 10 # evicted turns that trigger a summary update
+    conversation_summary_max_chars = 2000
+    conversation_summary_llm = True # False keeps an extractive summary, without llm calls
     local_char_storage_path = f"ckpts/{datetime.now().strftime('%Y-%m-%d-%H:%M:%S')}/characters"
     local_blg_storage_path = f"ckpts/{datetime.now().strftime('%Y-%m-%d-%H:%M:%S')}/buildings"
     load_from = f"ckpts/2024-03-21-02:05:13"
\ No newline at end of file
@@ -31,7 +31,7 @@ def setup_proxy():
 async def periodic_update(service: Simulation):
     while True:
         start_time = time.monotonic()
-        service.update_state()
+        await service.update_state()
         elapsed = time.monotonic() - start_time
         wait_time = max(config.update_interval - elapsed, 0)
         await asyncio.sleep(wait_time)